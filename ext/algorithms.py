@@ -1,38 +1,246 @@
 import os
 import sys
 import logging
+import tempfile
 import pandas as pd
 import numpy as np
 
 from linker.plugins.base import AlgorithmProvider
 from linker.core.union_find import UnionFind
 
-from jellyfish import levenshtein_distance, jaro_winkler
+from jellyfish import jaro_winkler
 
 logger = logging.getLogger(__name__)
 
 
+# Number of string pairs compared at once by the vectorized kernels.
+BATCH_SIZE = 100000
+
+
+def as_strings(s):
+    """
+    Returns the values of a series as an array of strings. Missing values are replaced by empty strings.
+    """
+    values = s.values.astype(object)
+    values[pd.isnull(values)] = ''
+    return np.array([value if isinstance(value, str) else str(value) for value in values], dtype=object)
+
+
+def code_points(strings, width):
+    """
+    Converts an array of strings into a matrix of unicode code points, padded with zeros or truncated to
+    the given width.
+    """
+    codes = np.zeros((len(strings), max(width, 1)), dtype=np.uint32)
+    if len(strings) > 0:
+        fixed = np.array(strings, dtype=str)
+        columns = min(codes.shape[1], fixed.itemsize // 4)
+        codes[:, :columns] = fixed.view(np.uint32).reshape(len(strings), -1)[:, :columns]
+    return codes
+
+
+def banded_levenshtein(a_codes, a_lens, b_codes, b_lens, max_edits):
+    """
+    Computes the Levenshtein distance of a batch of string pairs, only inside a band of max_edits
+    diagonals around the main diagonal. Distances above max_edits are reported as max_edits + 1.
+    The computation stops as soon as no pair can stay within max_edits.
+    :param a_codes: Code points of the left strings, one row per pair.
+    :param a_lens: Lengths of the left strings.
+    :param b_codes: Code points of the right strings. Must be at least max(a_lens) + max_edits wide.
+    :param b_lens: Lengths of the right strings.
+    :param max_edits: Maximum number of edits.
+    :return: Array of the bounded distances.
+    """
+    k = max_edits
+    limit = k + 1
+    offsets = np.arange(-k, k + 1)
+
+    # Row i of the dynamic programming table holds D[i][i + d] for the band offsets d in [-k, k].
+    prev = np.where((offsets >= 0) & (offsets[np.newaxis, :] <= b_lens[:, np.newaxis]),
+                    offsets, limit).astype(np.int32)
+    distance = np.full(len(a_lens), limit, dtype=np.int32)
+
+    finished = a_lens == 0
+    distance[finished] = prev[finished, k + b_lens[finished]]
+
+    for i in range(1, int(a_lens.max()) + 1 if len(a_lens) else 0):
+        cur = np.full(prev.shape, limit, dtype=np.int32)
+        for w, d in enumerate(offsets):
+            j = i + d
+            if j < 0:
+                continue
+            if j == 0:
+                value = np.full(len(a_lens), i, dtype=np.int32)
+            else:
+                value = prev[:, w] + (a_codes[:, i - 1] != b_codes[:, j - 1])
+                if w + 1 < len(offsets):
+                    value = np.minimum(value, prev[:, w + 1] + 1)
+                if w > 0:
+                    value = np.minimum(value, cur[:, w - 1] + 1)
+            cur[:, w] = np.where(j <= b_lens, np.minimum(value, limit), limit)
+
+        finished = a_lens == i
+        distance[finished] = cur[finished, k + b_lens[finished] - i]
+        prev = cur
+
+        # Every path passes through the current row, so pairs with no value within the limit can not match.
+        remaining = a_lens > i
+        if not (prev[remaining].min(axis=1) <= k).any():
+            break
+
+    return distance
+
+
+def levenshtein_within(a, b, max_edits):
+    """
+    Checks for each pair of strings (a[i], b[i]) if their Levenshtein distance is at most max_edits.
+    Pairs with a length difference above max_edits are rejected without computing their distance.
+    :param a: Array of strings
+    :param b: Array of strings
+    :param max_edits: Maximum number of edits.
+    :return: int8 array, 1 for the pairs within max_edits and 0 otherwise.
+    """
+    result = np.zeros(len(a), dtype=np.int8)
+    a_lens = np.fromiter((len(x) for x in a), dtype=np.int64, count=len(a))
+    b_lens = np.fromiter((len(x) for x in b), dtype=np.int64, count=len(b))
+
+    equal = a == b
+    result[equal] = 1
+    if max_edits <= 0:
+        return result
+
+    candidates = np.flatnonzero(~equal & (np.abs(a_lens - b_lens) <= max_edits))
+    for start in range(0, len(candidates), BATCH_SIZE):
+        batch = candidates[start:start + BATCH_SIZE]
+        width = int(a_lens[batch].max())
+        distance = banded_levenshtein(code_points(a[batch], width), a_lens[batch],
+                                      code_points(b[batch], width + max_edits), b_lens[batch],
+                                      max_edits)
+        result[batch] = distance <= max_edits
+
+    return result
+
+
 class Levenshtein(AlgorithmProvider):
     name = 'LEVENSHTEIN'
     title = 'Levenshtein'
     type = 'DTR'
     args = ['max_edits']
+    cost = 20
 
     def apply(self, s1, s2, max_edits=0):
+        return pd.Series(levenshtein_within(as_strings(s1), as_strings(s2), int(max_edits)), index=s1.index)
+
 
-        def levenshtein_alg(x, max_edits=0):
-            try:
-                d = levenshtein_distance(x[0], x[1])
-                return 1 if d <= max_edits else 0
-            except TypeError as err:
-                logger.error(
-                    'Error in calculating Levenshtein edit distance: {}'
-                    .format(err))
+def deletion_variants(value, max_edits):
+    """
+    Generates all strings obtained by deleting up to max_edits characters from a string, the string included.
+    Two strings within max_edits edits of each other always share at least one of their variants.
+    """
+    variants = {value}
+    edge = {value}
+    for _ in range(max_edits):
+        edge = {variant[:i] + variant[i + 1:] for variant in edge for i in range(len(variant))}
+        variants |= edge
+    return variants
+
+
+class DeletionNeighbourhood(AlgorithmProvider):
+    """
+    Pairs the records whose blocking keys are all within max_edits edits of each other.
+    The records are joined on the deletion variants of their keys, so only the records that share a variant are
+    paired. The pairs are then verified by the bounded Levenshtein kernel.
+    :param max_edits: Maximum number of edits, or a list with the maximum number of edits of each blocking key.
+        Keys with 0 edits are joined exactly.
+    """
+    name = 'DELETIONS'
+    title = 'Deletion neighbourhood'
+    type = 'BLK'
+    tags = ['strings']
+    args = ['max_edits']
+
+    @staticmethod
+    def key_edits(count, max_edits):
+        if isinstance(max_edits, (list, tuple)):
+            return [int(k) for k in max_edits]
+        return [int(max_edits)] * count
 
-        strings = pd.concat([s1, s2], axis=1, ignore_index=True)
-        strings = strings.replace(np.nan, '', regex=True)
+    def exact_keys(self, count, max_edits=1):
+        return [key for key, k in enumerate(self.key_edits(count, max_edits)) if k == 0]
 
-        return strings.apply(levenshtein_alg, axis=1, max_edits=max_edits)
+    def apply(self, left, right, max_edits=1):
+        edits = self.key_edits(len(left.columns), max_edits)
+        left_rows = pd.DataFrame({'LEFT': np.arange(len(left.index))})
+        right_rows = pd.DataFrame({'RIGHT': np.arange(len(right.index))})
+        values = []
+
+        for key, k in enumerate(edits):
+            left_values = as_strings(left.iloc[:, key])
+            right_values = as_strings(right.iloc[:, key])
+            codes, uniques = pd.factorize(np.concatenate([left_values, right_values]))
+            values.append((left_values, right_values, k))
+
+            # Each distinct value is expanded into its variants once. Equal variants get equal ids on both sides.
+            variant_codes = [(code, variant) for code, value in enumerate(uniques)
+                             for variant in deletion_variants(value, k)]
+            variants = pd.DataFrame(variant_codes, columns=['CODE', 'VARIANT'])
+            variants[key] = pd.factorize(variants['VARIANT'])[0]
+            variants = variants[['CODE', key]]
+
+            left_codes, right_codes = codes[:len(left.index)], codes[len(left.index):]
+            left_rows = left_rows.assign(CODE=left_codes[left_rows['LEFT'].values]).merge(variants, on='CODE')
+            right_rows = right_rows.assign(CODE=right_codes[right_rows['RIGHT'].values]).merge(variants, on='CODE')
+
+        keys = list(range(len(edits)))
+        pairs = left_rows[['LEFT'] + keys].merge(right_rows[['RIGHT'] + keys], on=keys)
+        pairs = pairs[['LEFT', 'RIGHT']].drop_duplicates()
+
+        # Records sharing a variant can still be up to 2 * max_edits edits apart.
+        left_pos = pairs['LEFT'].values
+        right_pos = pairs['RIGHT'].values
+        within = np.ones(len(left_pos), dtype=bool)
+        for left_values, right_values, k in values:
+            if k > 0:
+                within &= levenshtein_within(left_values[left_pos], right_values[right_pos], k) == 1
+
+        order = np.lexsort((right_pos[within], left_pos[within]))
+        return left_pos[within][order], right_pos[within][order]
+
+
+def jaro_winkler_above(a, b, threshold):
+    """
+    Checks for each pair of strings (a[i], b[i]) if their Jaro-Winkler similarity is at least threshold.
+    The Jaro similarity of two strings is at most (m/|a| + m/|b| + 1)/3 with m = min(|a|, |b|), and the
+    Winkler prefix boost can only add p * 0.1 * (1 - jaro) for a common prefix of p <= 4 characters.
+    Only the pairs whose bound reaches the threshold are scored.
+    :param a: Array of strings
+    :param b: Array of strings
+    :param threshold: Minimum similarity.
+    :return: int8 array, 1 for the pairs with a similarity of at least threshold and 0 otherwise.
+    """
+    result = np.zeros(len(a), dtype=np.int8)
+    a_lens = np.fromiter((len(x) for x in a), dtype=np.float64, count=len(a))
+    b_lens = np.fromiter((len(x) for x in b), dtype=np.float64, count=len(b))
+    min_lens = np.minimum(a_lens, b_lens)
+
+    # Length of the common prefix, up to 4 characters.
+    prefix = (code_points(a, 4) == code_points(b, 4)) & (np.arange(4) < min_lens[:, np.newaxis])
+    prefix = np.cumprod(prefix, axis=1).sum(axis=1)
+
+    # The bound is not defined for empty strings, so they are always scored.
+    with np.errstate(divide='ignore', invalid='ignore'):
+        jaro_bound = (min_lens / a_lens + min_lens / b_lens + 1) / 3
+        bound = jaro_bound + prefix * 0.1 * (1 - jaro_bound)
+        candidates = (bound >= threshold - 1e-9) | (min_lens == 0)
+
+    # Identical non-empty strings have a similarity of exactly 1.
+    identical = (a == b) & (min_lens > 0)
+    result[identical] = 1 if threshold <= 1.0 else 0
+    candidates = np.flatnonzero(candidates & ~identical)
+
+    result[candidates] = [1 if jaro_winkler(x, y) >= threshold else 0
+                          for x, y in zip(a[candidates], b[candidates])]
+    return result
 
 
 class JaroWinkler(AlgorithmProvider):
@@ -40,22 +248,10 @@ class JaroWinkler(AlgorithmProvider):
     title = 'Jaro-Winkler'
     type = 'DTR'
     args = ['threshold']
+    cost = 30
 
     def apply(self, s1, s2, threshold=1.0):
-
-        def jaro_winkler_alg(x, threshold=1.0):
-            try:
-                t = jaro_winkler(x[0], x[1])
-                return 1 if t >= threshold else 0
-            except TypeError as err:
-                logger.error(
-                    'Error in calculating Jaro-Winkler similarity: {}'
-                    .format(err))
-
-        strings = pd.concat([s1, s2], axis=1, ignore_index=True)
-        strings = strings.replace(np.nan, '', regex=True)
-
-        return strings.apply(jaro_winkler_alg, axis=1, threshold=threshold)
+        return pd.Series(jaro_winkler_above(as_strings(s1), as_strings(s2), float(threshold)), index=s1.index)
 
 
 class SynonymTable(AlgorithmProvider):
@@ -71,30 +267,62 @@ class SynonymTable(AlgorithmProvider):
     title = 'Synonym Names'
     type = 'DTR'
     args = []
+    cost = 5
 
     synonym_file = "nicknames.csv"
-    names_index = None
-    name_sets = None
+    # Compiled name to root name table, rebuilt when the nicknames file changes.
+    roots_file = "nicknames_roots.csv"
+    name_roots = None
 
     @staticmethod
     def create_synonyms():
         '''
         Creates the disjoint sets of names using the given nicknames file.
+        :return: Dictionary that maps each name to the root name of its set.
         '''
         file_path = os.path.join(os.path.dirname(__file__), SynonymTable.synonym_file)
         nicknames = pd.read_csv(file_path)
-        nicknames['nameA'] = map(lambda x: x.upper(), nicknames['nameA'])
-        nicknames['nameB'] = map(lambda x: x.upper(), nicknames['nameB'])
+        nicknames['nameA'] = nicknames['nameA'].str.upper()
+        nicknames['nameB'] = nicknames['nameB'].str.upper()
         names = pd.concat([nicknames['nameA'], nicknames['nameB']]).drop_duplicates()
-        names.index = list(range(len(names)))
         names_index = pd.Series(list(range(len(names))), index=names.values)
         name_set = UnionFind(len(names))
 
-        for name_x, name_y in nicknames[['nameA', 'nameB']].values:
-            name_set.union(names_index[name_x], names_index[name_y])
+        name_set.union_many(names_index[nicknames['nameA']].values,
+                            names_index[nicknames['nameB']].values)
+
+        roots = names.values[name_set.find_many(np.arange(len(names)))]
+        return dict(zip(names.values, roots))
 
-        SynonymTable.name_sets = name_set
-        SynonymTable.names_index = names_index
+    @staticmethod
+    def load_synonyms():
+        '''
+        Loads the name to root name table. The compiled table is read from the roots file next to the
+        nicknames file if it is up to date, otherwise it is created and saved for the next processes.
+        '''
+        file_path = os.path.join(os.path.dirname(__file__), SynonymTable.synonym_file)
+        roots_path = os.path.join(os.path.dirname(__file__), SynonymTable.roots_file)
+
+        try:
+            if os.path.getmtime(roots_path) >= os.path.getmtime(file_path):
+                roots = pd.read_csv(roots_path, dtype=str, keep_default_na=False)
+                SynonymTable.name_roots = dict(zip(roots['name'], roots['root']))
+                return
+        except (OSError, KeyError, ValueError) as err:
+            logger.debug('Synonym roots table is not available: %s', err)
+
+        SynonymTable.name_roots = SynonymTable.create_synonyms()
+
+        try:
+            handle, temp_path = tempfile.mkstemp(suffix='.csv', dir=os.path.dirname(roots_path))
+            with os.fdopen(handle, 'w') as temp_file:
+                roots = pd.DataFrame({'name': list(SynonymTable.name_roots.keys()),
+                                      'root': list(SynonymTable.name_roots.values())},
+                                     columns=['name', 'root'])
+                roots.to_csv(temp_file, index=False)
+            os.replace(temp_path, roots_path)
+        except OSError as err:
+            logger.warning('Unable to save the synonym roots table: %s', err)
 
     @staticmethod
     def synonym(name_x, name_y):
@@ -104,8 +332,8 @@ class SynonymTable(AlgorithmProvider):
         :param name_y: Second input name.
         :return: 1 if name_x and name_y are synonyms, 0 otherwise.
         '''
-        if SynonymTable.name_sets is None:
-            SynonymTable.create_synonyms()
+        if SynonymTable.name_roots is None:
+            SynonymTable.load_synonyms()
 
         if pd.isnull(name_x):
             name_x = ''
@@ -115,20 +343,61 @@ class SynonymTable(AlgorithmProvider):
         name_y = name_y.upper()
         if name_x == '' and name_y == '':
             return 1
-        if name_x not in SynonymTable.names_index or name_y not in SynonymTable.names_index:
+        if name_x not in SynonymTable.name_roots or name_y not in SynonymTable.name_roots:
             return 0
 
-        return 1 if SynonymTable.name_sets.linked(SynonymTable.names_index[name_x],
-                                                  SynonymTable.names_index[name_y]) else 0
+        return 1 if SynonymTable.name_roots[name_x] == SynonymTable.name_roots[name_y] else 0
 
     def __init__(self):
-        if SynonymTable.name_sets is None:
-            SynonymTable.create_synonyms()
+        if SynonymTable.name_roots is None:
+            SynonymTable.load_synonyms()
+
+    @staticmethod
+    def name_roots_of(s):
+        """
+        Finds the root names of a series of names. Each distinct name is upper-cased and looked up once.
+        :return: (Array of root names, None for the names that are not in the table, Array of empty name flags)
+        """
+        codes, uniques = pd.factorize(s)
+        names = [str(name).upper() for name in uniques]
+        roots = np.array([SynonymTable.name_roots.get(name) for name in names] + [None], dtype=object)
+        # Missing names have code -1, which picks the trailing entries.
+        empty = np.array([name == '' for name in names] + [True], dtype=bool)
+        return roots[codes], empty[codes]
 
     def apply(self, s1, s2):
-        names = pd.concat([s1, s2], axis=1, ignore_index=True)
+        roots1, empty1 = SynonymTable.name_roots_of(s1)
+        roots2, empty2 = SynonymTable.name_roots_of(s2)
+
+        # Names that are not in the table have no root and never match.
+        matched = ((roots1 == roots2) & pd.notnull(roots1)) | (empty1 & empty2)
+        return pd.Series(matched.astype(np.int8), index=s1.index)
+
+
+class SynonymEncoding(AlgorithmProvider):
+    name = 'SYNONYMS'
+    title = 'Synonym Names Root'
+    type = 'TSF'
+    tags = ['strings', 'names']
+    args = []
+
+    def __init__(self):
+        if SynonymTable.name_roots is None:
+            SynonymTable.load_synonyms()
+
+    def apply(self, s):
+        """
+        Maps each name to the root name of its synonym set, so synonym names get the same blocking key.
+        Names that are not in the nicknames table are only upper-cased.
+        :param s: Input series of names
+        :return: Series of root names. Missing values stay missing.
+        """
+        from linker.core.algorithms import encode_unique
+
+        name_roots = SynonymTable.name_roots
 
-        def synonym_alg(x):
-            return SynonymTable.synonym(x[0], x[1])
+        def root_name(name):
+            name = str(name).upper()
+            return name_roots.get(name, name)
 
-        return names.apply(synonym_alg, axis=1)
+        return encode_unique(s, root_name)
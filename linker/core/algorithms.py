@@ -1,6 +1,8 @@
 import pandas as pd
 import numpy as np
+from functools import lru_cache
 
+from linker.core.base import ENCODING_CACHE_SIZE
 from linker.plugins.base import AlgorithmProvider
 #from ..plugins.base import AlgorithmProvider
 from jellyfish import (
@@ -13,6 +15,31 @@ import logging
 logger = logging.getLogger(__name__)
 
 
+# Encodings are cached by value, so the distinct names are encoded once per run across all chunks and steps.
+@lru_cache(maxsize=ENCODING_CACHE_SIZE)
+def cached_soundex(value):
+    return soundex(value)
+
+
+@lru_cache(maxsize=ENCODING_CACHE_SIZE)
+def cached_nysiis(value):
+    return nysiis(value)
+
+
+def encode_unique(s, encode):
+    """
+    Encodes each distinct value of a series once and broadcasts the codes back to all entries.
+    :param s: Input series
+    :param encode: Encoding function of a single value.
+    :return: Encoded series. Missing values stay missing.
+    """
+    codes, uniques = pd.factorize(s)
+    encoded = np.array([encode(value) for value in uniques] + [np.nan], dtype=object)
+
+    # Missing values have code -1, which picks the trailing NaN.
+    return pd.Series(encoded[codes], index=s.index, name=s.name)
+
+
 class NoEncoding(AlgorithmProvider):
     name = 'EXACT'
     title = 'Exact'
@@ -32,7 +59,7 @@ class SoundexEncoding(AlgorithmProvider):
     args = []
 
     def apply(self, s):
-        return s.apply(lambda x: soundex(x) if pd.notnull(x) else np.nan)
+        return encode_unique(s, cached_soundex)
 
 
 class NyiisEncoding(AlgorithmProvider):
@@ -43,7 +70,7 @@ class NyiisEncoding(AlgorithmProvider):
     args = []
 
     def apply(self, s):
-        return s.apply(lambda x: nysiis(x) if pd.notnull(x) else np.nan)
+        return encode_unique(s, cached_nysiis)
 
 
 class ExactComparsion(AlgorithmProvider):
@@ -52,6 +79,9 @@ class ExactComparsion(AlgorithmProvider):
     type = None
     tags = ['all']
     args = []
+    cost = 1
+    join_encoding = 'EXACT'
+    join_missing = True
 
     def apply(self, s1, s2):
         """
@@ -60,18 +90,33 @@ class ExactComparsion(AlgorithmProvider):
         :param s2: Right input series.
         :return: For each (x,y) pair from two input series, return 1 if x == y and returns 0 otherwise.
         """
-        x = pd.Series(0, index=s1.index)
+        return ((s1 == s2) | (s1.isnull() & s2.isnull())).astype(np.int8)
 
-        x[pd.eval('(s1 == s2) | ((s1 != s1) & (s2 != s2))')] = 1
 
-        return x
+def is_empty(s):
+    """
+    Checks the entries of a series for missing values and empty strings.
+    :param s: Input series
+    :return: Boolean series, True for the empty entries.
+    """
+    empty = s.isnull()
+    if s.dtype == np.object_:
+        empty |= s.values == ''
+    return empty
+
+
+def no_values(s1, s2):
+    """
+    Checks if one of two input series has no values. A column without any value is read as float, which
+    the string methods do not accept. Missing values are never equal, so none of the pairs match.
+    :return: True if all the entries of s1 or s2 are missing.
+    """
+    return bool(s1.isnull().all() or s2.isnull().all())
 
 
 def comp(s1, s2, empty_sum=2):
-    x = s1.apply(lambda x: 1 if pd.isnull(x) or len(str(x)) == 0 else 0)
-    y = s2.apply(lambda x: 1 if pd.isnull(x) or len(str(x)) == 0 else 0)
-    z = pd.concat([x, y], axis=1)
-    return z.apply(lambda x: 1 if x[0] + x[1] == empty_sum else 0, axis=1)
+    empty_count = is_empty(s1).astype(np.int8) + is_empty(s2).astype(np.int8).values
+    return (empty_count == empty_sum).astype(np.int8)
 
 
 class BothEmpty(AlgorithmProvider):
@@ -79,6 +124,7 @@ class BothEmpty(AlgorithmProvider):
     title = 'Both values empty'
     type = None
     args = []
+    cost = 1
 
     def apply(self, s1, s2):
         return comp(s1, s2, empty_sum=2)
@@ -89,6 +135,7 @@ class OneEmpty(AlgorithmProvider):
     title = 'One value should be empty'
     type = None
     args = []
+    cost = 1
 
     def apply(self, s1, s2):
         return comp(s1, s2, empty_sum=1)
@@ -99,6 +146,7 @@ class BothExist(AlgorithmProvider):
     title = 'Both values exist'
     type = None
     args = []
+    cost = 1
 
     def apply(self, s1, s2):
         return comp(s1, s2, empty_sum=0)
@@ -110,6 +158,8 @@ class SoundexComparison(AlgorithmProvider):
     type = None
     tags = ['strings', 'names']
     args = []
+    cost = 5
+    join_encoding = 'SOUNDEX'
 
     def apply(self, s1, s2):
         """
@@ -125,10 +175,8 @@ class SoundexComparison(AlgorithmProvider):
         # Apply SOUNDEX encoding to both s1 and s2 and check if the encodings are the same
         s1 = encoding.apply(s1)
         s2 = encoding.apply(s2)
-        x = pd.Series(0, index=s1.index)
-        x[s1 == s2] = 1
 
-        return x
+        return (s1 == s2).astype(np.int8)
 
 
 class NYIISComparison(AlgorithmProvider):
@@ -137,6 +185,8 @@ class NYIISComparison(AlgorithmProvider):
     type = None
     tags = ['strings', 'names']
     args = []
+    cost = 5
+    join_encoding = 'NYSIIS'
 
     def apply(self, s1, s2):
         """
@@ -152,10 +202,8 @@ class NYIISComparison(AlgorithmProvider):
         # Apply NYIIS encoding to both s1 and s2 and check if the encodings are the same
         s1 = encoding.apply(s1)
         s2 = encoding.apply(s2)
-        x = pd.Series(0, index=s1.index)
-        x[s1 == s2] = 1
 
-        return x
+        return (s1 == s2).astype(np.int8)
 
 
 class MatchSlice(AlgorithmProvider):
@@ -164,6 +212,7 @@ class MatchSlice(AlgorithmProvider):
     type = None
     tags = ['strings', 'names', 'dates']
     args = ['start', 'end']
+    cost = 3
 
     def apply(self, s1, s2, start=0, end=0):
         """
@@ -177,12 +226,13 @@ class MatchSlice(AlgorithmProvider):
                 and returns 0 otherwise.
         """
 
-        s1 = s1.apply(lambda x: x[start:end] if pd.notnull(x) else np.nan)
-        s2 = s2.apply(lambda x: x[start:end] if pd.notnull(x) else np.nan)
-        x = pd.Series(0, index=s1.index)
-        x[s1 == s2] = 1
+        if no_values(s1, s2):
+            return pd.Series(0, index=s1.index, dtype=np.int8)
+
+        s1 = s1.str.slice(start, end)
+        s2 = s2.str.slice(start, end)
 
-        return x
+        return (s1 == s2).astype(np.int8)
 
 
 class MatchHead(AlgorithmProvider):
@@ -191,6 +241,7 @@ class MatchHead(AlgorithmProvider):
     type = None
     tags = ['strings', 'names', 'dates']
     args = ['n']
+    cost = 3
 
     def apply(self, s1, s2, n=0):
         """
@@ -202,12 +253,13 @@ class MatchHead(AlgorithmProvider):
                 and returns 0 otherwise.
         """
 
-        s1 = s1.apply(lambda x: x[0:n] if pd.notnull(x) else np.nan)
-        s2 = s2.apply(lambda x: x[0:n] if pd.notnull(x) else np.nan)
-        x = pd.Series(0, index=s1.index)
-        x[s1 == s2] = 1
+        if no_values(s1, s2):
+            return pd.Series(0, index=s1.index, dtype=np.int8)
 
-        return x
+        s1 = s1.str.slice(0, n)
+        s2 = s2.str.slice(0, n)
+
+        return (s1 == s2).astype(np.int8)
 
 
 class MatchTail(AlgorithmProvider):
@@ -216,6 +268,7 @@ class MatchTail(AlgorithmProvider):
     type = None
     tags = ['strings', 'names', 'dates']
     args = ['n']
+    cost = 3
 
     def apply(self, s1, s2, n=0):
         """
@@ -227,12 +280,13 @@ class MatchTail(AlgorithmProvider):
                 and returns 0 otherwise.
         """
 
-        s1 = s1.apply(lambda x: x[-n:] if pd.notnull(x) else np.nan)
-        s2 = s2.apply(lambda x: x[-n:] if pd.notnull(x) else np.nan)
-        x = pd.Series(0, index=s1.index)
-        x[s1 == s2] = 1
+        if no_values(s1, s2):
+            return pd.Series(0, index=s1.index, dtype=np.int8)
+
+        s1 = s1.str.slice(-n)
+        s2 = s2.str.slice(-n)
 
-        return x
+        return (s1 == s2).astype(np.int8)
 
 
 class FixedLength(AlgorithmProvider):
@@ -241,6 +295,7 @@ class FixedLength(AlgorithmProvider):
     type = None
     tags = ['strings', 'names', 'dates']
     args = ['length']
+    cost = 2
 
     def apply(self, s1, s2, length=0):
         """
@@ -251,12 +306,13 @@ class FixedLength(AlgorithmProvider):
         :return: For each (x,y) pair from two input series, return 1 if both x and y have length n
                 and returns 0 otherwise.
         """
-        s1 = s1.apply(lambda x: len(x) if pd.notnull(x) else np.nan)
-        s2 = s2.apply(lambda x: len(x) if pd.notnull(x) else np.nan)
-        x = pd.Series(0, index=s1.index)
-        x[(s1 == s2) & (s1 == length)] = 1
+        if no_values(s1, s2):
+            return pd.Series(0, index=s1.index, dtype=np.int8)
 
-        return x
+        s1 = s1.str.len()
+        s2 = s2.str.len()
+
+        return ((s1 == s2) & (s1 == length)).astype(np.int8)
 
 
 class FixedValue(AlgorithmProvider):
@@ -265,6 +321,7 @@ class FixedValue(AlgorithmProvider):
     type = None
     tags = ['all']
     args = ['value']
+    cost = 1
 
     def apply(self, s1, s2, value):
         """
@@ -275,10 +332,7 @@ class FixedValue(AlgorithmProvider):
         :return: For each (x,y) pair from two input series, return 1 if both x and y have the same value as the input value;
                 returns 0 otherwise.
         """
-        x = pd.Series(0, index=s1.index)
-        x[(s1 == s2) & (s1 == value)] = 1
-
-        return x
+        return ((s1 == s2) & (s1 == value)).astype(np.int8)
 
 
 class AbsoluteDifference(AlgorithmProvider):
@@ -287,14 +341,183 @@ class AbsoluteDifference(AlgorithmProvider):
     type = None
     tags = ['numeric']
     args = ['threshold']
+    cost = 1
 
     def apply(self, s1, s2, threshold=0):
         d = pd.Series.abs(s1 - s2)
 
-        def abs_diff(x, t):
-            return 1 if x <= t else 0
+        return (d <= threshold).astype(np.int8)
+
+
+# Modulus of the MinHash hash functions, a Mersenne prime.
+MINHASH_PRIME = (1 << 31) - 1
+
+
+def minhash_signatures(texts, q, count, seed=0):
+    """
+    Computes the MinHash signatures of the q-gram sets of an array of strings.
+    Each signature holds the minimum of count random linear hash functions over the q-grams of a string.
+    Strings shorter than q are used as a single q-gram.
+    :param texts: Array of strings
+    :param q: Length of the q-grams.
+    :param count: Number of hash functions.
+    :param seed: Seed of the hash functions. Signatures are only comparable if they have the same seed.
+    :return: int64 matrix of the signatures, one row per string.
+    """
+    grams = [(text_no, text[i:i + q]) for text_no, text in enumerate(texts)
+             for i in range(max(len(text) - q + 1, 1))]
+    text_nos = np.array([text_no for text_no, _ in grams], dtype=np.int64)
+    # The q-grams are hashed by value, so the signature of a string does not depend on the other strings.
+    gram_ids = (pd.util.hash_array(np.array([gram for _, gram in grams], dtype=object)) %
+                np.uint64(MINHASH_PRIME)).astype(np.int64)
+
+    random = np.random.RandomState(seed)
+    a = random.randint(1, MINHASH_PRIME, size=count).astype(np.int64)
+    b = random.randint(0, MINHASH_PRIME, size=count).astype(np.int64)
+
+    signatures = np.full((len(texts), count), MINHASH_PRIME, dtype=np.int64)
+    batch_size = max(10 ** 7 // count, 1)
+    for start in range(0, len(gram_ids), batch_size):
+        batch_texts = text_nos[start:start + batch_size]
+        hashes = (gram_ids[start:start + batch_size, np.newaxis] * a + b) % MINHASH_PRIME
+
+        # The q-grams of each string are consecutive, so their minimum is reduced per run of equal text numbers.
+        starts = np.flatnonzero(np.r_[True, batch_texts[1:] != batch_texts[:-1]])
+        rows = batch_texts[starts]
+        signatures[rows] = np.minimum(signatures[rows], np.minimum.reduceat(hashes, starts, axis=0))
+
+    return signatures
+
+
+class MinHashBlocking(AlgorithmProvider):
+    """
+    Pairs the records whose blocking keys have similar sets of character q-grams.
+    The blocking keys of a record are joined into a single text and its q-grams are summarized by a MinHash
+    signature of bands * rows hashes. Records are paired if their signatures agree on all the rows of at least one
+    band. Two texts with a q-gram Jaccard similarity s are paired with a probability of 1 - (1 - s^rows)^bands, so
+    more bands increase the recall and more rows reduce the number of candidate pairs.
+    :param q: Length of the q-grams.
+    :param bands: Number of bands.
+    :param rows: Number of hashes per band.
+    """
+    name = 'MINHASH'
+    title = 'MinHash locality sensitive hashing'
+    type = 'BLK'
+    tags = ['strings']
+    args = ['q', 'bands', 'rows']
+
+    def exact_keys(self, count, **args):
+        return []
+
+    def apply(self, left, right, q=3, bands=20, rows=5):
+        q, bands, rows = int(q), int(bands), int(rows)
+        keys = pd.concat([left, right]).astype(str)
+        texts = keys.iloc[:, 0]
+        for col in keys.columns[1:]:
+            texts = texts + ' ' + keys[col]
+        codes, uniques = pd.factorize(texts.values)
+        left_codes, right_codes = codes[:len(left.index)], codes[len(left.index):]
+
+        signatures = minhash_signatures(uniques, q, bands * rows)
+
+        # Pairs of distinct texts that fall into the same bucket of at least one band.
+        left_texts = np.unique(left_codes)
+        right_texts = np.unique(right_codes)
+        text_pairs = []
+        for band in range(bands):
+            buckets = pd.util.hash_pandas_object(pd.DataFrame(signatures[:, band * rows:(band + 1) * rows]),
+                                                 index=False).values
+            text_pairs.append(pd.DataFrame({'LEFT_CODE': left_texts, 'BUCKET': buckets[left_texts]}).merge(
+                pd.DataFrame({'RIGHT_CODE': right_texts, 'BUCKET': buckets[right_texts]}), on='BUCKET'))
+        text_pairs = pd.concat(text_pairs)[['LEFT_CODE', 'RIGHT_CODE']].drop_duplicates()
+
+        pairs = pd.DataFrame({'LEFT': np.arange(len(left_codes)), 'LEFT_CODE': left_codes}).merge(
+            text_pairs, on='LEFT_CODE').merge(
+            pd.DataFrame({'RIGHT': np.arange(len(right_codes)), 'RIGHT_CODE': right_codes}), on='RIGHT_CODE')
+
+        left_pos = pairs['LEFT'].values
+        right_pos = pairs['RIGHT'].values
+        order = np.lexsort((right_pos, left_pos))
+        return left_pos[order], right_pos[order]
+
+
+def window_pairs(count, window, sides=None, first=0):
+    """
+    Finds the pairs of entries of a sorted sequence that are less than window entries apart.
+    :param count: Number of entries.
+    :param window: Size of the sliding window.
+    :param sides: Array of the side of each entry, 0 for left and 1 for right entries. Only the entries of
+        different sides are paired. By default all entries are paired with each other.
+    :param first: Only the pairs whose second entry is at or after this position are returned.
+    :return: (Array of first entry positions, Array of second entry positions)
+    """
+    firsts, seconds = [], []
+    for distance in range(1, window):
+        second = np.arange(max(first, distance), count)
+        firsts.append(second - distance)
+        seconds.append(second)
 
-        return d.apply(abs_diff, args=(threshold,))
+    firsts = np.concatenate(firsts) if firsts else np.array([], dtype=np.int64)
+    seconds = np.concatenate(seconds) if seconds else np.array([], dtype=np.int64)
+    if sides is not None:
+        crossed = sides[firsts] != sides[seconds]
+        firsts, seconds = firsts[crossed], seconds[crossed]
+    return firsts, seconds
+
+
+class SortedNeighbourhood(AlgorithmProvider):
+    """
+    Pairs the records that are close to each other in the sort order of their blocking keys.
+    The left and right records are sorted together by their transformed blocking keys, then by side and record id.
+    Each record is paired with the records of the other side among the next window - 1 records, so the number of
+    candidate pairs grows linearly and keys with small differences are still paired.
+    The pairs depend on all the records, so they can not be found chunk pair by chunk pair.
+    :param window: Size of the sliding window.
+    """
+    name = 'SORTED_NEIGHBOURHOOD'
+    title = 'Sorted neighbourhood'
+    type = 'BLK'
+    tags = ['all']
+    args = ['window']
+    pairwise = False
+
+    def exact_keys(self, count, **args):
+        return []
+
+    @staticmethod
+    def sort_order(keys, sides, ids):
+        """
+        Sorts the entries by their blocking keys, side and id.
+        :param keys: Data frame of the blocking keys.
+        :return: Array of the entry positions in sort order.
+        """
+        key_values = [keys.iloc[:, col].astype(str).values for col in range(len(keys.columns))]
+        return np.lexsort([ids, sides] + key_values[::-1])
+
+    def apply(self, left, right, window=5):
+        """
+        :param right: Right blocking keys. If None, the left records are paired with each other and the lower
+            position of each pair is returned as its left position.
+        """
+        window = int(window)
+        if right is None:
+            ids = np.arange(len(left.index))
+            order = self.sort_order(left, np.zeros(len(ids), dtype=np.int8), ids)
+            firsts, seconds = window_pairs(len(order), window)
+            left_pos = np.minimum(order[firsts], order[seconds])
+            right_pos = np.maximum(order[firsts], order[seconds])
+        else:
+            keys = pd.concat([left, right])
+            sides = np.r_[np.zeros(len(left.index), dtype=np.int8), np.ones(len(right.index), dtype=np.int8)]
+            ids = np.r_[np.arange(len(left.index)), np.arange(len(right.index))]
+            order = self.sort_order(keys, sides, ids)
+            firsts, seconds = window_pairs(len(order), window, sides[order])
+            first_left = sides[order[firsts]] == 0
+            left_pos = ids[order[np.where(first_left, firsts, seconds)]]
+            right_pos = ids[order[np.where(first_left, seconds, firsts)]]
+
+        order = np.lexsort((right_pos, left_pos))
+        return left_pos[order], right_pos[order]
 
 
 AVAILABLE_ALGORITHMS = [alg() for alg in AlgorithmProvider.plugins]
@@ -322,9 +545,66 @@ def apply_comparison(s1, s2, method='EXACT', **args):
     return alg.apply(s1, s2, **args)
 
 
+def comparison_cost(method='EXACT'):
+    """
+    :return: Relative cost of comparing a pair of values with a comparison method.
+    """
+    return DETERMINISTIC_COMPARISONS.get(method).cost
+
+
+def comparison_join_encoding(method='EXACT'):
+    """
+    Finds the transformation that lets the blocking join apply a comparison method.
+    :return: (Name of the transformation, True if missing values match), or None if the join can not apply it.
+    """
+    alg = DETERMINISTIC_COMPARISONS.get(method)
+    if alg is None or alg.join_encoding is None:
+        return None
+    return alg.join_encoding, alg.join_missing
+
+
 TRANSFORMATIONS = get_algorithms(types=['TSF'])
 
 
 def apply_encoding(s, method='EXACT'):
     alg = TRANSFORMATIONS.get(method)
     return alg.apply(s)
+
+
+BLOCKING_METHODS = get_algorithms(types=['BLK'])
+
+
+def apply_blocking(left, right, method, **args):
+    """
+    Finds the candidate record pairs of a blocking method.
+    :param left: Data frame of the transformed left blocking keys, one column per blocking variable.
+    :param right: Data frame of the transformed right blocking keys, with the same columns as left.
+    :param method: Name of the blocking method.
+    :return: (Array of left row positions, Array of right row positions) of the candidate pairs.
+    """
+    alg = BLOCKING_METHODS.get(method)
+    return alg.apply(left, right, **args)
+
+
+def blocking_is_pairwise(method=None):
+    """
+    Checks if the candidate pairs of a blocking method can be found chunk pair by chunk pair.
+    :param method: Blocking method of the step, {'name': ..., 'args': {...}}. None for the exact join.
+    """
+    if not method:
+        return True
+    return getattr(BLOCKING_METHODS.get(method['name']), 'pairwise', True)
+
+
+def blocking_exact_keys(count, method=None):
+    """
+    Returns the blocking keys that must be equal in every candidate pair of a blocking method.
+    Records can be hash partitioned by these keys without losing any pair.
+    :param count: Number of blocking variables.
+    :param method: Blocking method of the step, {'name': ..., 'args': {...}}. None for the exact join.
+    :return: List of key positions.
+    """
+    if not method:
+        return list(range(count))
+    alg = BLOCKING_METHODS.get(method['name'])
+    return alg.exact_keys(count, **(method.get('args') or {}))
@@ -1,9 +1,6 @@
-import os
-import subprocess
 import numpy as np
 import logging
 
-from string import Template
 from linker.config.config import config
 from linker.plugins.field_category import FieldCategory
 
@@ -13,6 +10,20 @@ logger = logging.getLogger(__name__)
 # Get linking configuration
 link_config = config.get_section('LINKER')
 CHUNK_SIZE = int(link_config.get('chunk_size') or '100000')
+# Number of hash partitions used by the chunked engines. 0 or 1 disables partitioning.
+PARTITIONS = int(link_config.get('partitions') or '0')
+WORKING_FORMAT = link_config.get('working_format') or 'csv'
+WORKERS = int(link_config.get('workers') or '1')
+# Maximum number of distinct values kept by each phonetic encoding cache.
+ENCODING_CACHE_SIZE = int(link_config.get('encoding_cache_size') or '1000000')
+# Maximum number of record pairs of a single blocking key in a chunk pair.
+# 0 disables the block size guard.
+MAX_BLOCK_PAIRS = int(link_config.get('max_block_pairs') or '0')
+BLOCK_POLICY = link_config.get('block_policy') or 'FAIL'
+# Record pairs compared per second and worker, used to estimate the running time of a project.
+PAIRS_PER_SECOND = int(link_config.get('pairs_per_second') or '500000')
+# Normalizations of the datasets that do not define their own, see linker.core.normalization.
+NORMALIZATION = [name.strip() for name in (link_config.get('normalization') or '').split(',') if name.strip()]
 
 
 LINKING_RELATIONSHIPS = (
@@ -45,49 +56,3 @@ def _save_pairs(file_path, data, append=False):
     else:
         with open(file_path, 'a') as f:
             data.to_csv(f, header=False)
-
-
-def sort_csv(filename, appendfile, cols, types, work_dir=None):
-
-    if not work_dir:
-        work_dir = os.path.split(filename)[0]
-
-    # Remove the trailing / at the end of path if it exists
-    if work_dir and work_dir[-1] == '/':
-        work_dir = work_dir[:-1]
-
-    template_file = os.path.dirname(__file__) + '/sort_script_template.txt'
-    template_script_file = open(template_file)
-    sort_script = Template(template_script_file.read())
-    import csv
-    header = []
-    with open(filename, 'r') as in_file:
-        reader = csv.reader(in_file)
-        header = next(reader)
-
-    col_index = {key: index + 1 for index, key in enumerate(header)}
-
-    sort_cols = []
-    for col in cols:
-        sort_cols.append('-k {0},{0}{1}'.format(col_index[col], 'n' if types[col] == 'numeric' else ''))
-
-    sort_cols = ' '.join(sort_cols)
-
-    params = {
-        'filename': filename,
-        'sort_cols': sort_cols,
-        'chunksize': CHUNK_SIZE,
-        'appendfile': appendfile,
-        'work_dir': work_dir
-    }
-
-    sort_script = sort_script.substitute(params)
-    script_filename = os.path.join(work_dir, 'sort_script.sh')
-
-    with open(script_filename, 'w') as script_file:
-        script_file.write(sort_script)
-    os.chmod(script_filename, 0o700)
-    subprocess.call([script_filename])
-
-    if os.path.isfile(script_filename):
-        os.remove(script_filename)
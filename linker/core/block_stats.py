@@ -0,0 +1,99 @@
+"""
+Block size statistics of the exact blocking join.
+
+A block is the set of records of a left and a right data chunk that share the same transformed
+blocking key. The records of a block are all paired with each other, so a block of l left and
+r right records produces l * r record pairs, or n * (n - 1) / 2 pairs if a de-duplicated chunk
+of n records is paired with itself. The statistics are collected before the records are merged.
+"""
+import numpy as np
+
+
+class BlockStats(object):
+    # Number of largest blocks kept for the report
+    TOP_BLOCKS = 5
+
+    def __init__(self):
+        self.blocks = 0
+        self.pairs = 0
+        self.largest = 0
+        # histogram[i] is the number of blocks with 10^i to 10^(i+1) - 1 record pairs.
+        self.histogram = []
+        self.top_blocks = {}
+        self.split_blocks = 0
+        self.skipped_blocks = 0
+        self.skipped_pairs = 0
+
+    @staticmethod
+    def key_name(key):
+        return ' / '.join(str(value) for value in key) if isinstance(key, tuple) else str(key)
+
+    def _add_top(self, blocks):
+        for key, pairs in blocks:
+            self.top_blocks[key] = self.top_blocks.get(key, 0) + pairs
+        top = sorted(self.top_blocks.items(), key=lambda block: (-block[1], block[0]))
+        self.top_blocks = dict(top[:BlockStats.TOP_BLOCKS])
+
+    def _add_histogram(self, counts):
+        self.histogram += [0] * (len(counts) - len(self.histogram))
+        for i, count in enumerate(counts):
+            self.histogram[i] += count
+
+    def add_blocks(self, sizes, key_name=None):
+        """
+        Adds the blocks of a chunk pair. The largest blocks of different chunk pairs are added up
+        by key, so the reported pairs of a key only include the chunk pairs where it was among the
+        largest blocks.
+        :param sizes: Data frame indexed by the block keys with the number of record pairs of each
+            block in the PAIRS column.
+        :param key_name: Function giving the name of a block key. By default the key values are
+            joined.
+        """
+        key_name = key_name or self.key_name
+        pairs = sizes['PAIRS'].values
+        if len(pairs) == 0:
+            return
+
+        self.blocks += len(pairs)
+        self.pairs += int(pairs.sum())
+        self.largest = max(self.largest, int(pairs.max()))
+
+        self._add_histogram(np.bincount(np.floor(np.log10(pairs)).astype(np.int64)).tolist())
+
+        top = sizes['PAIRS'].nlargest(BlockStats.TOP_BLOCKS)
+        self._add_top((key_name(key), int(count)) for key, count in top.items())
+
+    def add_split(self, sizes):
+        self.split_blocks += len(sizes.index)
+
+    def add_skipped(self, sizes):
+        self.skipped_blocks += len(sizes.index)
+        self.skipped_pairs += int(sizes['PAIRS'].sum())
+
+    def merge(self, other):
+        """
+        Adds the statistics of another BlockStats object.
+        """
+        self.blocks += other.blocks
+        self.pairs += other.pairs
+        self.largest = max(self.largest, other.largest)
+        self._add_histogram(other.histogram)
+        self._add_top(other.top_blocks.items())
+        self.split_blocks += other.split_blocks
+        self.skipped_blocks += other.skipped_blocks
+        self.skipped_pairs += other.skipped_pairs
+
+    def to_dict(self):
+        return {
+            'blocks': self.blocks,
+            'estimated_pairs': self.pairs,
+            'largest_block': self.largest,
+            'histogram': [{'min_pairs': 10 ** i, 'max_pairs': 10 ** (i + 1) - 1, 'blocks': count}
+                          for i, count in enumerate(self.histogram) if count > 0],
+            'top_blocks': [{'key': key, 'pairs': pairs} for key, pairs in
+                           sorted(self.top_blocks.items(),
+                                  key=lambda block: (-block[1], block[0]))],
+            'split_blocks': self.split_blocks,
+            'skipped_blocks': self.skipped_blocks,
+            'skipped_pairs': self.skipped_pairs
+        }
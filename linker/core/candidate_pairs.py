@@ -0,0 +1,69 @@
+"""
+Candidate record pairs of two data chunks.
+
+The blocking rules only find the row positions of the paired records in their data chunks. The columns of the
+pairs are gathered from the chunks when a linking rule compares them, so a candidate pair takes two integers
+instead of a copy of all the columns of both records. Only the matched pairs are materialized.
+"""
+import numpy as np
+import pandas as pd
+
+
+class CandidatePairs(object):
+    # Bytes of a candidate pair while a linking rule compares it: two row positions and the two compared values.
+    PAIR_BYTES = 32
+
+    def __init__(self, left_chunk, right_chunk, left_pos, right_pos):
+        """
+        :param left_chunk: Data frame of the left records indexed by the left record ids.
+        :param right_chunk: Data frame of the right records indexed by the right record ids.
+        :param left_pos: Array of the left row position of each pair.
+        :param right_pos: Array of the right row position of each pair.
+        """
+        dtype = CandidatePairs.position_type(max(len(left_chunk.index), len(right_chunk.index)))
+        self.left_chunk = left_chunk
+        self.right_chunk = right_chunk
+        self.left_pos = np.asarray(left_pos).astype(dtype, copy=False)
+        self.right_pos = np.asarray(right_pos).astype(dtype, copy=False)
+
+    @staticmethod
+    def position_type(rows):
+        """
+        :return: Smallest integer type of the row positions of a chunk.
+        """
+        return np.int32 if rows <= np.iinfo(np.int32).max else np.int64
+
+    def __len__(self):
+        return len(self.left_pos)
+
+    def __getitem__(self, column):
+        """
+        Gathers a column of the record pairs from the left or the right chunk.
+        :param column: Name of a left (LEFT_) or right (RIGHT_) column.
+        :return: Series of the column values of each pair.
+        """
+        if column in self.left_chunk.columns:
+            values = self.left_chunk[column].values.take(self.left_pos)
+        elif column in self.right_chunk.columns:
+            values = self.right_chunk[column].values.take(self.right_pos)
+        else:
+            raise KeyError(column)
+        return pd.Series(values, name=column)
+
+    def take(self, positions):
+        """
+        :param positions: Array of the positions of the pairs to keep.
+        :return: CandidatePairs of the selected pairs.
+        """
+        return CandidatePairs(self.left_chunk, self.right_chunk,
+                              self.left_pos.take(positions), self.right_pos.take(positions))
+
+    def to_frame(self):
+        """
+        Materializes the record pairs.
+        :return: Data frame with the left and right columns of each pair, indexed by the left and right record ids.
+        """
+        left = self.left_chunk.iloc[self.left_pos].reset_index()
+        right = self.right_chunk.iloc[self.right_pos].reset_index()
+        pairs = pd.concat([left, right], axis=1)
+        return pairs.set_index([self.left_chunk.index.name, self.right_chunk.index.name])
@@ -9,10 +9,16 @@ import shutil
 from linker.core.base import (link_config,
                                    CHUNK_SIZE,
                                    COLUMN_TYPES,
-                                   _save_pairs,
-                                   sort_csv)
+                                   _save_pairs)
 from linker.core.chunked_link_base import ChunkedLinkBase
+from linker.core.external_sort import (sort_csv,
+                                       ensure_sorted,
+                                       get_sort_orders,
+                                       set_sort_orders,
+                                       clear_sort_orders)
 from linker.core.files import LinkFiles
+from linker.core.normalization import get_normalization
+from linker.core.union_find import UnionFind
 from linker.reports.report import generate_linking_summary
 
 logger = logging.getLogger(__name__)
@@ -71,7 +77,9 @@ class ChunkedDedup(ChunkedLinkBase):
                                               usecols,
                                               self.left_file,
                                               front_cols=[self.left_index],
-                                              data_types=self.left_dtypes)
+                                              data_types=self.left_dtypes,
+                                              sort_orders=[[self.left_index]],
+                                              normalization=get_normalization(dataset))
 
         logger.debug('<<--- load_data ---<<')
 
@@ -79,10 +87,8 @@ class ChunkedDedup(ChunkedLinkBase):
         logger.debug('>>--- link_pairs --->>')
         logger.info('Assigning entity id to linked records.')
 
-        from linker.core.union_find import UnionFind
         matched_file = self.temp_path + LinkFiles.MATCHED_RECORDS
 
-        link_index = pd.Index([], name='REC_ID')
         left_index = 'LEFT_' + self.left_index
         right_index = 'RIGHT_' + self.right_index
 
@@ -90,44 +96,32 @@ class ChunkedDedup(ChunkedLinkBase):
                 matched_file) == 0:
             return 0
 
-        matched_reader = pd.read_csv(matched_file,
-                                     index_col=[left_index, right_index],
-                                     chunksize=CHUNK_SIZE)
-
-        logger.debug('Loading linked records chunk by chunk.')
-        for chunk in matched_reader:
-            # Create a union of left record and right record indices
-            left_set = chunk.index.get_level_values(0).drop_duplicates()
-            right_set = chunk.index.get_level_values(1).drop_duplicates()
-            union_set = left_set.union(right_set)
-            union_set = union_set.rename('REC_ID')
-
-            # Merge the result with the union index of all record id's
-            link_index = link_index.union(union_set)
-
-        # Create mapping from selected records index to their position in disjoin set.
-        rec_len = len(link_index)
-        index_loc = pd.Series(list(range(rec_len)), index=link_index)
-        entity_ids = [None] * rec_len
-
-        # Create disjoint set of entities
-        entts = UnionFind(rec_len)
-
-        linked = pd.DataFrame(columns=['ENTITY_ID'], index=link_index)
-        linked['ENTITY_ID'].fillna(0, inplace=True)
+        # The union-find holds one element per record of the data file, so its memory does not grow with
+        # the number of matched pairs. Record ids are mapped to their positions in the sorted ids.
+        data_reader = pd.read_csv(self.left_file, usecols=[self.left_index], chunksize=CHUNK_SIZE)
+        rec_ids = np.unique(np.concatenate([chunk[self.left_index].values for chunk in data_reader]))
 
-        # Find all connected records and make entity groups
-        matched_reader = pd.read_csv(matched_file,
-                                     index_col=[left_index, right_index],
-                                     chunksize=CHUNK_SIZE)
+        entities = UnionFind(len(rec_ids))
+        linked = np.zeros(len(rec_ids), dtype=bool)
 
         logger.debug(
             'Finding chains of connected records that belong to the same entity')
+        matched_reader = pd.read_csv(matched_file,
+                                     usecols=[left_index, right_index],
+                                     chunksize=CHUNK_SIZE)
         for chunk in matched_reader:
-            for left_id, right_id in chunk.index.values:
-                entts.union(index_loc[left_id], index_loc[right_id])
-
-        # Assign entity id's
+            left_codes = np.searchsorted(rec_ids, chunk[left_index].values)
+            right_codes = np.searchsorted(rec_ids, chunk[right_index].values)
+            entities.union_many(left_codes, right_codes)
+            linked[left_codes] = True
+            linked[right_codes] = True
+
+        roots = entities.find_many(np.arange(len(rec_ids)))
+        first_id = ChunkedLinkBase.reserve_ids(len(np.unique(roots[linked])))
+
+        # Assign entity id's, numbered in the order that the entities first appear in the pairs.
+        rank = np.full(len(rec_ids), -1, dtype=np.int64)
+        next_rank = 0
         append = False
         entity_file = self.temp_path + LinkFiles.TEMP_MATCHED_ENTITY_FILE
         matched_reader = pd.read_csv(matched_file,
@@ -135,14 +129,13 @@ class ChunkedDedup(ChunkedLinkBase):
                                      chunksize=CHUNK_SIZE)
 
         for chunk in matched_reader:
-            chunk.insert(0, 'ENTITY_ID', np.nan)
-            for left_id, right_id in chunk.index.values:
-                entt = entts.find(index_loc[left_id])
-                entity_ids[entt] = entity_ids[entt] or ChunkedLinkBase.get_next_id()
-                chunk.set_value((left_id, right_id), 'ENTITY_ID',
-                                entity_ids[entt])
-                linked.set_value(left_id, 'ENTITY_ID', entity_ids[entt])
-                linked.set_value(right_id, 'ENTITY_ID', entity_ids[entt])
+            pair_roots = roots[np.searchsorted(rec_ids, chunk.index.get_level_values(0).values)]
+            new_roots = pd.unique(pair_roots)
+            new_roots = new_roots[rank[new_roots] < 0]
+            rank[new_roots] = np.arange(next_rank, next_rank + len(new_roots))
+            next_rank += len(new_roots)
+
+            chunk.insert(0, 'ENTITY_ID', (first_id + rank[pair_roots]).astype(np.float64))
 
             _save_pairs(entity_file, chunk, append)
             if (not append) and os.path.isfile(entity_file):
@@ -154,11 +147,12 @@ class ChunkedDedup(ChunkedLinkBase):
             os.rename(entity_file, matched_file)
 
         linked_file = self.temp_path + LinkFiles.TEMP_ENTITIES_FILE
-        linked.replace(np.nan, '', regex=True)
-        linked.to_csv(linked_file, index=True)
+        linked = pd.Series(first_id + rank[roots[linked]], index=pd.Index(rec_ids[linked], name='REC_ID'),
+                           name='ENTITY_ID')
+        linked.to_frame().to_csv(linked_file, index=True)
 
         logger.debug('<<--- link_pairs ---<<')
-        return entts.count()
+        return linked.nunique()
 
     def extract_rows(self, data_filename, data_id, index_filename, index_id,
                      index_cols, selected_filename=None):
@@ -231,12 +225,14 @@ class ChunkedDedup(ChunkedLinkBase):
             for data_row in data_reader:
                 remained_writer.writerow(data_row)
 
-        # Replace the data file with remained file
+        # Replace the data file with remained file. The remained rows keep the order of the data file.
+        data_orders = get_sort_orders(data_filename)
         if os.path.isfile(data_filename):
             os.remove(data_filename)
 
         if os.path.isfile(remained_filename):
             os.rename(remained_filename, data_filename)
+        set_sort_orders(data_filename, data_orders)
 
         logger.debug('<<--- extract_rows ---<<')
 
@@ -266,6 +262,13 @@ class ChunkedDedup(ChunkedLinkBase):
 
         open(matched_file, 'w').close()
 
+        # Pairing only compares each chunk with the chunks that follow it and extract_rows merges
+        # the data file with the entity file, so the data file must be ordered by record id.
+        ensure_sorted(self.left_file,
+                      cols=[self.left_index],
+                      types={self.left_index: 'numeric'},
+                      work_dir=self.temp_path)
+
         linked_stats = {}
         prev_total = 0
         self.total_entities = 0
@@ -281,6 +284,7 @@ class ChunkedDedup(ChunkedLinkBase):
                                             blocking=step['blocking_schema'],
                                             linking=step['linking_schema'],
                                             matched_file=matched_file)
+            self.steps[step['seq']]['block_stats'] = self.block_stats.to_dict()
 
             # This is required in case some intermediate steps have no results.
             # The results from previous steps will not be merged and counted.
@@ -381,7 +385,21 @@ class ChunkedDedup(ChunkedLinkBase):
         logger.info('Total number of entities after de-duplication: %s',
                     self.total_entities)
 
+        # The matched records only hold the record ids. Their data columns are taken from a copy of the dataset,
+        # since the data file no longer has the linked records.
+        dedup_results_file = self.output_root + link_config.get('dedup_matched_file', 'dedup_matched.csv')
+        if os.path.isfile(dedup_results_file):
+            matched_file = self.temp_path + LinkFiles.MATCHED_RECORDS
+            os.rename(dedup_results_file, matched_file)
+            records_file = self.import_records(self.project['datasets'][0], self.left_columns, [self.left_index],
+                                               self.left_dtypes, self.temp_path + LinkFiles.TEMP_RECORDS.format('left'))
+            self.attach_data(matched_file, dedup_results_file,
+                             [('LEFT_' + self.left_index, records_file, self.left_index, 'LEFT_'),
+                              ('RIGHT_' + self.right_index, records_file, self.right_index, 'RIGHT_')],
+                             before_col='DEDUP_STEP')
+
         # Clean all remaining temp files
+        clear_sort_orders(self.left_file)
         if os.path.exists(self.temp_path):
             shutil.rmtree(self.temp_path)
 
@@ -7,10 +7,15 @@ import shutil
 
 from linker.core.base import (link_config,
                                    COLUMN_TYPES,
-                                   LINKING_RELATIONSHIPS,
-                                   sort_csv)
+                                   LINKING_RELATIONSHIPS)
 from linker.core.chunked_link_base import ChunkedLinkBase
+from linker.core.external_sort import (sort_csv,
+                                       ensure_sorted,
+                                       get_sort_orders,
+                                       set_sort_orders,
+                                       clear_sort_orders)
 from linker.core.files import LinkFiles
+from linker.core.normalization import get_normalization
 from linker.reports.report import generate_linking_summary
 
 
@@ -85,7 +90,10 @@ class ChunkedLink(ChunkedLinkBase):
                                              dest_filename=self.left_file,
                                              front_cols=[self.left_index,
                                                          self.left_entity],
-                                             data_types=self.left_dtypes)
+                                             data_types=self.left_dtypes,
+                                             sort_orders=[[self.left_index],
+                                                          [self.left_entity, self.left_index]],
+                                             normalization=get_normalization(left_data))
 
         right_data = self.project['datasets'][1]
         self.right_columns.append(right_data['index_field'])
@@ -117,7 +125,10 @@ class ChunkedLink(ChunkedLinkBase):
                                              self.right_file,
                                              front_cols=[self.right_index,
                                                          self.right_entity],
-                                             data_types=self.right_dtypes)
+                                             data_types=self.right_dtypes,
+                                             sort_orders=[[self.right_index],
+                                                          [self.right_entity, self.right_index]],
+                                             normalization=get_normalization(right_data))
 
         logger.debug('<<--- load_data ---<<')
 
@@ -234,8 +245,7 @@ class ChunkedLink(ChunkedLinkBase):
         matched_file = self.temp_path + LinkFiles.MATCHED_RECORDS
         filtered_filename = self.temp_path + LinkFiles.TEMP_FILTER_RECORDS
 
-        matched_not_linked_filename = self.output_root + link_config \
-            .get('matched_not_linked_filename', 'matched_not_linked_data.csv')
+        matched_not_linked_filename = self.temp_path + LinkFiles.TEMP_MATCHED_NOT_LINKED
 
         linked_filename = self.temp_path + LinkFiles.TEMP_STEP_LINKED_FILE
 
@@ -289,8 +299,10 @@ class ChunkedLink(ChunkedLinkBase):
 
             extra_row = [None] * len(linked_header)
             for index, value in enumerate(row):
-                col_name = data_header[index]
-                extra_row[linked_map[prefix + col_name]] = value
+                col_name = prefix + data_header[index]
+                # The linked records only keep the id columns of the data.
+                if col_name in linked_map:
+                    extra_row[linked_map[col_name]] = value
             extra_row[linked_map['LINK_ID']] = link_id
 
             writer.writerow(extra_row)
@@ -392,10 +404,13 @@ class ChunkedLink(ChunkedLinkBase):
                     data_writer.writerow(data_row)
                     previous_link_row = None
 
+        # The remaining data rows keep the order of the data file.
+        data_orders = get_sort_orders(data_filename)
         if os.path.isfile(data_filename):
             os.remove(data_filename)
         if os.path.isfile(temp_data_file):
             os.rename(temp_data_file, data_filename)
+        set_sort_orders(data_filename, data_orders)
 
         if os.path.isfile(linked_filename):
             os.remove(linked_filename)
@@ -417,11 +432,9 @@ class ChunkedLink(ChunkedLinkBase):
 
         matched_file = self.temp_path + LinkFiles.MATCHED_RECORDS
 
-        matched_not_linked_filename = self.output_root \
-            + link_config.get('matched_not_linked_filename', 'matched_not_linked_data.csv')
+        matched_not_linked_filename = self.temp_path + LinkFiles.TEMP_MATCHED_NOT_LINKED
         linked_filename = self.temp_path + LinkFiles.TEMP_LINKED_RECORDS
         step_linked = self.temp_path + LinkFiles.TEMP_STEP_LINKED_FILE
-        temp_sorted_file = self.temp_path + LinkFiles.TEMP_SORTED_FILE
 
         open(linked_filename, 'w').close()
         open(matched_not_linked_filename, 'w').close()
@@ -429,23 +442,6 @@ class ChunkedLink(ChunkedLinkBase):
         first_batch = True
 
         for step in self.project['steps']:
-            # Sort input files based on entity_id and ingestion id:
-            sort_csv(self.left_file,
-                     appendfile=temp_sorted_file,
-                     cols=[self.left_index],
-                     types={self.left_index: 'numeric'},
-                     work_dir=self.temp_path)
-
-            os.remove(self.left_file)
-            os.rename(temp_sorted_file, self.left_file)
-            sort_csv(self.right_file,
-                     appendfile=temp_sorted_file,
-                     cols=[self.right_index],
-                     types={self.right_index: 'numeric'},
-                     work_dir=self.temp_path)
-            os.remove(self.right_file)
-            os.rename(temp_sorted_file, self.right_file)
-
             self.steps[step['seq']] = {}
             logger.info("Linking Step %s :", step['seq'])
             logger.info("%s.1) Finding record pairs satisfying blocking and linking constraints...",
@@ -457,6 +453,7 @@ class ChunkedLink(ChunkedLinkBase):
                                             blocking=step['blocking_schema'],
                                             linking=step['linking_schema'],
                                             matched_file=matched_file)
+            self.steps[step['seq']]['block_stats'] = self.block_stats.to_dict()
 
             linked_stats[step['seq']] = pairs_count
 
@@ -477,21 +474,16 @@ class ChunkedLink(ChunkedLinkBase):
             self.steps[step['seq']]['total_entities'] = link_stats['total_linked']
             self.total_entities += self.steps[step['seq']]['total_entities']
 
-            # Sort input files based on entity_id and ingestion id:
-            sort_csv(self.left_file,
-                     appendfile=temp_sorted_file,
-                     cols=[self.left_entity, self.left_index],
-                     types={self.left_entity: 'numeric', self.left_index: 'numeric'},
-                     work_dir=self.temp_path)
-            os.remove(self.left_file)
-            os.rename(temp_sorted_file, self.left_file)
-            sort_csv(self.right_file,
-                     appendfile=temp_sorted_file,
-                     cols=[self.right_entity, self.right_index],
-                     types={self.right_entity: 'numeric', self.right_index: 'numeric'},
-                     work_dir=self.temp_path)
-            os.remove(self.right_file)
-            os.rename(temp_sorted_file, self.right_file)
+            # Sort input files based on entity_id and ingestion id. The files keep this order
+            # after the linked records are extracted, so the sort is done at most once.
+            ensure_sorted(self.left_file,
+                          cols=[self.left_entity, self.left_index],
+                          types={self.left_entity: 'numeric', self.left_index: 'numeric'},
+                          work_dir=self.temp_path)
+            ensure_sorted(self.right_file,
+                          cols=[self.right_entity, self.right_index],
+                          types={self.right_entity: 'numeric', self.right_index: 'numeric'},
+                          work_dir=self.temp_path)
 
             self.extract_linked_records(linked_filename=step_linked, prefix='LEFT_')
             self.extract_linked_records(linked_filename=step_linked, prefix='RIGHT_')
@@ -514,43 +506,49 @@ class ChunkedLink(ChunkedLinkBase):
                     self.project['name'], self.project['task_uuid'])
 
         linked_file_path = self.output_root + link_config.get('linked_data_file', 'linked_data.csv')
+        matched_not_linked_file_path = self.output_root + \
+            link_config.get('matched_not_linked_filename', 'matched_not_linked_data.csv')
 
         linked_filename = self.temp_path + LinkFiles.TEMP_LINKED_RECORDS
+        matched_not_linked_filename = self.temp_path + LinkFiles.TEMP_MATCHED_NOT_LINKED
         temp_sorted_file = self.temp_path + LinkFiles.TEMP_SORTED_FILE
 
+        # The linked and matched not linked records only hold the record ids. Their data columns are taken
+        # from a copy of each dataset, since the working data files no longer have the linked records.
+        datasets = self.project['datasets']
+        left_records = self.import_records(datasets[0], self.left_columns, [self.left_index, self.left_entity],
+                                           self.left_dtypes, self.temp_path + LinkFiles.TEMP_RECORDS.format('left'))
+        right_records = self.import_records(datasets[1], self.right_columns, [self.right_index, self.right_entity],
+                                            self.right_dtypes,
+                                            self.temp_path + LinkFiles.TEMP_RECORDS.format('right'))
+        sides = [('LEFT_' + self.left_index, left_records, self.left_index, 'LEFT_'),
+                 ('RIGHT_' + self.right_index, right_records, self.right_index, 'RIGHT_')]
+
         if self.total_records_linked > 0:
             sort_csv(linked_filename,
                      appendfile=temp_sorted_file,
                      cols=['LINK_ID'],
                      types={'LINK_ID': 'numeric'},
                      work_dir=self.temp_path)
-            if os.path.isfile(temp_sorted_file):
-                os.rename(temp_sorted_file, linked_file_path)
+            self.attach_data(temp_sorted_file, linked_file_path, sides, before_col='LINK_STEP')
+
+        if os.path.isfile(matched_not_linked_filename):
+            self.attach_data(matched_not_linked_filename, matched_not_linked_file_path, sides,
+                             header=self.matched_columns(), before_col='LINK_STEP')
 
         if os.path.isfile(linked_filename):
             os.remove(linked_filename)
 
-        sort_csv(self.left_file,
-                 appendfile=temp_sorted_file,
-                 cols=[self.left_index],
-                 types={self.left_index: 'numeric'},
-                 work_dir=self.temp_path)
-
-        if os.path.isfile(self.left_file):
-            os.remove(self.left_file)
-        if os.path.isfile(temp_sorted_file):
-            os.rename(temp_sorted_file, self.left_file)
-
-        sort_csv(self.right_file,
-                 appendfile=temp_sorted_file,
-                 cols=[self.right_index],
-                 types={self.right_index: 'numeric'},
-                 work_dir=self.temp_path)
-
-        if os.path.isfile(self.right_file):
-            os.remove(self.right_file)
-        if os.path.isfile(temp_sorted_file):
-            os.rename(temp_sorted_file, self.right_file)
+        ensure_sorted(self.left_file,
+                      cols=[self.left_index],
+                      types={self.left_index: 'numeric'},
+                      work_dir=self.temp_path)
+        ensure_sorted(self.right_file,
+                      cols=[self.right_index],
+                      types={self.right_index: 'numeric'},
+                      work_dir=self.temp_path)
+        clear_sort_orders(self.left_file)
+        clear_sort_orders(self.right_file)
 
         # Clean all remaining temp files
         if os.path.exists(self.temp_path):
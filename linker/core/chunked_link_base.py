@@ -1,11 +1,23 @@
 import os
 import csv
+import shutil
+import heapq
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, Future
 import pandas as pd
 import numpy as np
 
-from linker.core.base import (CHUNK_SIZE)
+from linker.core.base import (CHUNK_SIZE, PARTITIONS, WORKING_FORMAT, WORKERS)
 
+from linker.core.algorithms import (apply_encoding, blocking_exact_keys, blocking_is_pairwise,
+                                    window_pairs)
+from linker.core.block_stats import BlockStats
+from linker.core.candidate_pairs import CandidatePairs
+from linker.core.columnar import ColumnStore
+from linker.core.external_sort import (is_sorted_chunk, set_sort_orders, ensure_sorted,
+                                       clear_sort_orders, external_sort, numeric_key, SORT_FAN_IN)
 from linker.core.link_base import LinkBase
+from linker.core.normalization import normalize, get_normalization
 from linker.core.files import LinkFiles
 
 import logging
@@ -13,9 +25,20 @@ import logging
 logger = logging.getLogger(__name__)
 
 
+def _run_job(match_job, job, args):
+    """
+    Process pool job calling a matching method of a MatchJob. Defined at module level so it can be
+    pickled.
+    """
+    return getattr(match_job, job)(*args)
+
+
 class ChunkedLinkBase(LinkBase):
     def __init__(self, project):
         super(ChunkedLinkBase, self).__init__(project)
+        self.partitions = PARTITIONS
+        self.working_format = WORKING_FORMAT
+        self.workers = WORKERS
 
     @staticmethod
     def append_rows(append_filename, source_filename, first_batch=True):
@@ -32,6 +55,130 @@ class ChunkedLinkBase(LinkBase):
 
         logger.debug('<<--- append_rows ---<<')
 
+    def column_store_dir(self, filename):
+        return self.temp_path + LinkFiles.TEMP_COLUMN_STORE.format(os.path.basename(filename))
+
+    def read_chunks(self, filename, index_col, columns, dtypes):
+        """
+        Reads a data file chunk by chunk.
+        With the npy working format, the chunks are loaded from a columnar copy of the file. The csv
+        file is parsed again only if it has changed since the copy was built.
+        :param filename: Data file
+        :param index_col: Index column of the chunks.
+        :param columns: Columns to be read.
+        :param dtypes: Column data types.
+        :return: Iterator of data frames.
+        """
+        if self.working_format == 'npy':
+            store = ColumnStore.open(filename, self.column_store_dir(filename),
+                                     index_col, columns, dtypes, CHUNK_SIZE)
+            return store.read_chunks()
+
+        return pd.read_csv(filename,
+                           index_col=[index_col],
+                           usecols=columns,
+                           skipinitialspace=True,
+                           dtype=dtypes,
+                           chunksize=CHUNK_SIZE)
+
+    def partition_file(self, filename, fields, transformations, columns, dtypes, partition_file):
+        """
+        Splits a data file into self.partitions files by the hash of the transformed blocking key.
+        Records that agree on the transformed blocking key always end up in the same partition.
+        Records with an empty blocking variable can not be paired and are not copied.
+        :param filename: Data file to be partitioned.
+        :param fields: Blocking variables.
+        :param transformations: Encoding method of each blocking variable.
+        :param columns: Columns to be copied into the partition files.
+        :param dtypes: Column data types.
+        :param partition_file: Partition file name template.
+        :return: List of partition file names.
+        """
+        logger.debug('>>--- partition_file --->>')
+        logger.info('Partitioning data file %s into %s partitions.', filename, self.partitions)
+
+        part_filenames = [self.temp_path + partition_file.format(part)
+                          for part in range(self.partitions)]
+        header = pd.read_csv(filename, usecols=columns, nrows=0).columns.tolist()
+        part_files = [open(part_filename, 'w') for part_filename in part_filenames]
+        try:
+            for part_file in part_files:
+                csv.writer(part_file, lineterminator='\n').writerow(header)
+
+            reader = pd.read_csv(filename,
+                                 usecols=columns,
+                                 skipinitialspace=True,
+                                 dtype=dtypes,
+                                 chunksize=CHUNK_SIZE)
+            for chunk in reader:
+                keys = pd.DataFrame(index=chunk.index)
+                for key_no, (field, method) in enumerate(zip(fields, transformations)):
+                    keys[key_no] = apply_encoding(chunk[field], method)
+
+                keys = keys.dropna(axis=0, how='any')
+                chunk = chunk.loc[keys.index]
+                part = pd.util.hash_pandas_object(self.key_text(keys), index=False).values \
+                    % self.partitions
+
+                for part_no, part_chunk in chunk.groupby(part):
+                    part_chunk.to_csv(part_files[part_no], index=False, header=False)
+        finally:
+            for part_file in part_files:
+                part_file.close()
+
+        logger.debug('<<--- partition_file ---<<')
+        return part_filenames
+
+    @staticmethod
+    def key_text(keys):
+        """
+        Writes the blocking keys of a data chunk as the strings that are hashed into partitions.
+        Keys that the blocking join finds equal get equal strings. Pandas reads a numeric column as
+        float in the chunks that have a missing value, so the whole float values are written as
+        integers.
+        :param keys: Data frame of the transformed blocking keys.
+        :return: Data frame of the key strings.
+        """
+        text = keys.astype(str)
+        for col in keys.columns:
+            values = keys[col].values
+            if values.dtype.kind == 'f':
+                whole = (np.mod(values, 1) == 0) & (np.abs(values) < 2 ** 63)
+                text.loc[whole, col] = values[whole].astype(np.int64).astype(str)
+        return text
+
+    def partition_data(self, blocking, transformations):
+        """
+        Partitions the left and right data files by the transformed blocking key of a step.
+        :param blocking: Step blocking schema.
+        :param transformations: Encoding method of each blocking variable.
+        :return: List of (left partition, right partition) file name pairs that need to be paired.
+        """
+        left_fields = blocking.get('left')
+        if self.project_type == 'DEDUP' and not blocking.get('right'):
+            right_fields = left_fields
+        else:
+            right_fields = blocking.get('right')
+
+        # Only the keys that are equal in every candidate pair can be hashed.
+        keys = blocking_exact_keys(len(left_fields), blocking.get('method'))
+        left_fields = [left_fields[key] for key in keys]
+        right_fields = [right_fields[key] for key in keys]
+        transformations = [transformations[key] for key in keys]
+
+        left_parts = self.partition_file(self.left_file, left_fields, transformations,
+                                         self.left_columns, self.left_dtypes,
+                                         LinkFiles.TEMP_LEFT_PARTITION)
+
+        if self.project_type == 'DEDUP' and left_fields == right_fields:
+            right_parts = left_parts
+        else:
+            right_parts = self.partition_file(self.right_file, right_fields, transformations,
+                                              self.right_columns, self.right_dtypes,
+                                              LinkFiles.TEMP_RIGHT_PARTITION)
+
+        return list(zip(left_parts, right_parts))
+
     def pair_n_match(self, step, link_method, blocking, linking, matched_file):
         logger.debug('>>--- pair_n_match --->>')
         logger.info('Finding matched records.')
@@ -69,162 +216,415 @@ class ChunkedLinkBase(LinkBase):
         left_fields = ['LEFT_' + field for field in left_fields]
         right_fields = ['RIGHT_' + field for field in right_fields]
         comparison_methods = linking.get('comparisons')
+        join_rules, left_fields, right_fields, comparison_methods = LinkBase.plan_join(
+            blocking, left_fields, right_fields, comparison_methods)
 
         left_index = 'LEFT_' + self.left_index
         right_index = 'RIGHT_' + self.right_index
         merge_columns = [left_index, right_index]
 
-        logger.info('Readding input data file chunk by chunk')
-        left_reader = pd.read_csv(self.left_file,
-                                  index_col=[self.left_index],
-                                  usecols=self.left_columns,
-                                  skipinitialspace=True,
-                                  dtype=self.left_dtypes,
-                                  chunksize=CHUNK_SIZE)
+        blocking_method = blocking.get('method')
+        block_guard = self.get_block_guard(blocking)
+        self.block_stats = BlockStats()
+        file_pairs = []
+        if not blocking_is_pairwise(blocking_method):
+            tasks = (('match_pairs', (step, pairs, left_fields, right_fields, comparison_methods))
+                     for pairs in self.sorted_neighbourhood_pairs(blocking))
+        else:
+            # Records can only be partitioned by the blocking keys that every candidate pair agrees
+            # on.
+            if self.partitions > 1 and blocking_exact_keys(len(left_block_fields), blocking_method):
+                file_pairs = self.partition_data(blocking, transformations)
+            else:
+                file_pairs = [(self.left_file, self.right_file)]
+
+            tasks = (('match_chunk_pair', (step, left_chunk, right_chunk,
+                                           left_block_fields, right_block_fields, transformations,
+                                           blocking_method, block_guard, join_rules,
+                                           left_fields, right_fields, comparison_methods))
+                     for left_chunk, right_chunk in self.chunk_pairs(file_pairs))
+
+        # Matching jobs in submission order. Each job writes its own run file, so the runs are
+        # merged in the same order whatever the number of workers.
+        jobs = []
+        pending = deque()
+        executor = ProcessPoolExecutor(max_workers=self.workers) if self.workers > 1 else None
+        # The workers only get the few linker attributes that the matching jobs use, not the whole
+        # linker.
+        match_job = MatchJob(self)
+        try:
+            for job, args in tasks:
+                args = args + (self.temp_path + LinkFiles.TEMP_MATCHED_RUN.format(len(jobs)),)
+                if executor is None:
+                    jobs.append(getattr(self, job)(*args))
+                else:
+                    future = executor.submit(_run_job, match_job, job, args)
+                    jobs.append(future)
+                    pending.append(future)
+                    # Limit the number of jobs waiting in memory.
+                    while len(pending) > 2 * self.workers:
+                        pending.popleft().result()
+
+            results = [job.result() if isinstance(job, Future) else job for job in jobs]
+        finally:
+            if executor is not None:
+                executor.shutdown()
+
+        run_files = []
+        for run_file, block_stats in results:
+            if run_file is not None:
+                run_files.append(run_file)
+            if block_stats is not None:
+                self.block_stats.merge(block_stats)
+
+        if run_files:
+            logger.info('Merging %s sorted runs into the matched records file.', len(run_files))
+            if os.path.isfile(matched_file):
+                run_files.insert(0, matched_file)
+            total_pairs = self.merge_runs(run_files=run_files,
+                                          columns=merge_columns,
+                                          out_filename=temp_file)
+
+            for run_file in run_files:
+                if os.path.isfile(run_file):
+                    os.remove(run_file)
+            if os.path.isfile(temp_file):
+                os.rename(temp_file, matched_file)
+
+        for part_filename in set(sum(file_pairs, ())) - {self.left_file, self.right_file}:
+            if os.path.isfile(part_filename):
+                os.remove(part_filename)
+            if os.path.isdir(self.column_store_dir(part_filename)):
+                shutil.rmtree(self.column_store_dir(part_filename))
 
-        for left_chunk_no, left_chunk in enumerate(left_reader):
+        logger.info('Finding matched records is complete.')
+        logger.debug('<<--- pair_n_match ---<<')
+        return total_pairs
 
-            # Read right file chunk by chunck and merge each chunk with the current left chunk
-            right_reader = pd.read_csv(self.right_file,
-                                       index_col=[self.right_index],
-                                       usecols=self.right_columns,
-                                       skipinitialspace=True,
-                                       dtype=self.right_dtypes,
-                                       chunksize=CHUNK_SIZE)
+    def chunk_pairs(self, file_pairs):
+        """
+        Reads the pairs of left and right data chunks that need to be paired.
+        :param file_pairs: List of (left file, right file) pairs.
+        :return: Generator of (left chunk, right chunk) pairs with prefixed columns, sorted by their
+            index.
+        """
+        for left_filename, right_filename in file_pairs:
+            logger.info('Readding input data file chunk by chunk')
+            left_reader = self.read_chunks(left_filename, self.left_index,
+                                           self.left_columns, self.left_dtypes)
 
-            left_chunk.columns = ['LEFT_' + col for col in left_chunk.columns]
-            left_chunk.index.names = ['LEFT_' + left_chunk.index.name]
+            for left_chunk_no, left_chunk in enumerate(left_reader):
 
-            for right_chunk_no, right_chunk in enumerate(right_reader):
+                # Read right file chunk by chunck and merge each chunk with the current left chunk
+                right_reader = self.read_chunks(right_filename, self.right_index,
+                                                self.right_columns, self.right_dtypes)
 
-                logger.info("Finding record pairs for left block %s and right block %s",
-                            left_chunk_no, right_chunk_no)
-                if self.project_type == 'DEDUP' and left_chunk_no > right_chunk_no:
-                    continue
+                left_chunk.columns = ['LEFT_' + col for col in left_chunk.columns]
+                left_chunk.index.names = ['LEFT_' + left_chunk.index.name]
+                left_chunk = left_chunk.sort_index()
 
-                # Prefix each column in left data with 'LEFT_' and the right
-                # data columns with 'RIGHT_' to avoid name conflicts on merging
-                # two data chunks.
+                for right_chunk_no, right_chunk in enumerate(right_reader):
 
-                right_chunk.columns = ['RIGHT_' + col for col in right_chunk.columns]
-                right_chunk.index.names = ['RIGHT_' + right_chunk.index.name]
+                    if self.project_type == 'DEDUP' and left_filename == right_filename \
+                            and left_chunk_no > right_chunk_no:
+                        continue
 
-                left_chunk = left_chunk.sort_index()
-                right_chunk = right_chunk.sort_index()
+                    # Prefix each column in left data with 'LEFT_' and the right
+                    # data columns with 'RIGHT_' to avoid name conflicts on merging
+                    # two data chunks.
 
-                pairs = self.pair_records(left_chunk,
-                                          right_chunk,
-                                          left_block_fields, right_block_fields, transformations)
+                    right_chunk.columns = ['RIGHT_' + col for col in right_chunk.columns]
+                    right_chunk.index.names = ['RIGHT_' + right_chunk.index.name]
 
-                if len(pairs.index) == 0:
-                    continue
+                    logger.info("Finding record pairs for left block %s and right block %s",
+                                left_chunk_no, right_chunk_no)
+                    yield left_chunk, right_chunk.sort_index()
 
-                matched = LinkBase.match_records(pairs,
-                                                 left_fields,
-                                                 right_fields,
-                                                 comparison_methods)
-
-                matched[self.project_type + '_STEP'] = step
-                matched = matched.sort_index()
-
-                # Move index columns to the front
-                if self.project_type == 'LINK':
-                    entity_cols = ['LEFT_' + self.left_entity, 'RIGHT_' + self.right_entity]
-                    cols = matched.columns.tolist()
-                    cols = entity_cols + [x for x in cols if x not in entity_cols]
-                    matched = matched[cols]
-
-                # Replace all empty cells with empty string to avoid writing nan in the csv file.
-                matched.replace(np.nan, '', regex=True)
-
-                logger.info('Merging chunk result into the matched records file.')
-                with open(matched_file, 'r') as in_file, \
-                        open(temp_file, 'w') as merge_file:
-                    reader = csv.reader(in_file)
-                    merge_writer = csv.writer(merge_file, lineterminator='\n')
-                    matched = matched.reset_index()
-                    try:
-                        header = next(reader)
-                    except StopIteration:
-                        header = matched.columns
-                    matched_reader = iter(matched.values.tolist())
-                    total_pairs = self.merge(left_reader=reader,
-                                             right_reader=matched_reader,
-                                             header=header,
-                                             columns=merge_columns,
-                                             csv_writer=merge_writer)
-
-                if os.path.isfile(matched_file):
-                    os.remove(matched_file)
-                if os.path.isfile(temp_file):
-                    os.rename(temp_file, matched_file)
+    def neighbourhood_sort(self, filename, index_col, columns, dtypes, fields, transformations,
+                           side, keys_file):
+        """
+        Copies the records of a data file that have all their blocking variables into a new file,
+        together with their transformed blocking keys, and sorts the copy by the keys and the record
+        ids.
+        The keys of the copied records are also written into the open keys file.
+        :param side: Side of the records in the keys file, 0 for left and 1 for right.
+        :return: Name of the sorted copy.
+        """
+        side_filename = self.temp_path + LinkFiles.TEMP_NEIGHBOURHOOD.format(side)
+        key_cols = ['_KEY_{}'.format(key_no) for key_no in range(len(fields))]
+
+        with open(side_filename, 'w') as side_file:
+            chunks = self.read_chunks(filename, index_col, columns, dtypes)
+            for chunk_no, chunk in enumerate(chunks):
+                chunk = chunk.dropna(axis=0, how='any', subset=np.unique(fields))
+                chunk = chunk.assign(**{
+                    key_col: apply_encoding(chunk[field], method).astype(str)
+                    for key_col, field, method in zip(key_cols, fields, transformations)
+                })
+                chunk.to_csv(side_file, header=chunk_no == 0)
+                keys = chunk[key_cols].assign(_SIDE=side, _ID=chunk.index.values)
+                keys[key_cols + ['_SIDE', '_ID']].to_csv(keys_file, index=False, header=False)
+
+        ensure_sorted(side_filename, key_cols + [index_col], {index_col: 'numeric'})
+        return side_filename
+
+    def sorted_neighbourhood_pairs(self, blocking):
+        """
+        Finds the candidate pairs of the sorted neighbourhood blocking method.
+        Both data files are sorted by their transformed blocking keys, then the sorted records are
+        streamed chunk by chunk. The last window - 1 records of each chunk are kept to be paired
+        with the records of the next chunk.
+        :param blocking: Step blocking schema.
+        :return: Generator of the CandidatePairs of each sorted chunk.
+        """
+        logger.debug('>>--- sorted_neighbourhood_pairs --->>')
 
-        logger.info('Finding matched records is complete.')
-        logger.debug('<<--- pair_n_match ---<<')
-        return total_pairs
+        left_fields = blocking.get('left')
+        if self.project_type == 'DEDUP' and not blocking.get('right'):
+            right_fields = left_fields
+        else:
+            right_fields = blocking.get('right')
+        transformations = blocking.get('transformations')
+        window = int((blocking['method'].get('args') or {}).get('window', 5))
+        dedup = self.project_type == 'DEDUP'
+
+        keys_filename = self.temp_path + LinkFiles.TEMP_NEIGHBOURHOOD_KEYS
+        key_cols = ['_KEY_{}'.format(key_no) for key_no in range(len(left_fields))]
+        sides = [(self.left_file, self.left_index, self.left_columns, self.left_dtypes,
+                  left_fields)]
+        if not dedup:
+            sides.append((self.right_file, self.right_index, self.right_columns, self.right_dtypes,
+                          right_fields))
+
+        logger.info('Sorting the data files by the blocking keys.')
+        with open(keys_filename, 'w') as keys_file:
+            csv.writer(keys_file, lineterminator='\n').writerow(key_cols + ['_SIDE', '_ID'])
+            side_filenames = [self.neighbourhood_sort(filename, index_col, columns, dtypes, fields,
+                                                      transformations, side, keys_file)
+                              for side, (filename, index_col, columns, dtypes, fields)
+                              in enumerate(sides)]
+        ensure_sorted(keys_filename, key_cols + ['_SIDE', '_ID'],
+                      {'_SIDE': 'numeric', '_ID': 'numeric'})
+
+        readers = []
+        try:
+            # The records of each side are read in the order of the keys file.
+            rows = []
+            for side_filename, (_, index_col, columns, dtypes, _) in zip(side_filenames, sides):
+                read_args = dict(index_col=[index_col], usecols=columns, skipinitialspace=True,
+                                 dtype=dtypes)
+                rows.append(pd.read_csv(side_filename, nrows=0, **read_args))
+                readers.append(pd.read_csv(side_filename, iterator=True, **read_args))
+
+            entry_sides = np.array([], dtype=np.int64)
+            for keys in pd.read_csv(keys_filename, usecols=['_SIDE'], chunksize=CHUNK_SIZE):
+                chunk_sides = keys['_SIDE'].values
+                for side, reader in enumerate(readers):
+                    count = int((chunk_sides == side).sum())
+                    if count > 0:
+                        rows[side] = pd.concat([rows[side], reader.get_chunk(count)])
+
+                first = len(entry_sides)
+                entry_sides = np.r_[entry_sides, chunk_sides]
+                side_pos = np.empty(len(entry_sides), dtype=np.int64)
+                for side in range(len(readers)):
+                    in_side = entry_sides == side
+                    side_pos[in_side] = np.arange(in_side.sum())
+
+                firsts, seconds = window_pairs(len(entry_sides), window,
+                                               None if dedup else entry_sides, first)
+                if dedup:
+                    ids = rows[0].index.values
+                    first_left = ids[side_pos[firsts]] < ids[side_pos[seconds]]
+                    left_rows, right_rows = rows[0], rows[0]
+                else:
+                    first_left = entry_sides[firsts] == 0
+                    left_rows, right_rows = rows
+                left_pos = side_pos[np.where(first_left, firsts, seconds)]
+                right_pos = side_pos[np.where(first_left, seconds, firsts)]
+
+                if len(left_pos) > 0:
+                    left_chunk = left_rows.add_prefix('LEFT_')
+                    left_chunk.index.names = ['LEFT_' + self.left_index]
+                    right_chunk = right_rows.add_prefix('RIGHT_')
+                    right_chunk.index.names = ['RIGHT_' + self.right_index]
+                    yield CandidatePairs(left_chunk, right_chunk, left_pos, right_pos)
+
+                # Keep the records of the last window - 1 entries.
+                tail = max(len(entry_sides) - (window - 1), 0)
+                for side in range(len(readers)):
+                    kept = int((entry_sides[tail:] == side).sum())
+                    rows[side] = rows[side].iloc[len(rows[side]) - kept:]
+                entry_sides = entry_sides[tail:]
+        finally:
+            for reader in readers:
+                reader.close()
+            for filename in side_filenames + [keys_filename]:
+                clear_sort_orders(filename)
+                if os.path.isfile(filename):
+                    os.remove(filename)
+
+        logger.debug('<<--- sorted_neighbourhood_pairs ---<<')
+
+    def matched_columns(self):
+        """
+        :return: Columns of the matched records files: the record ids, the entity ids of the linked
+            records and the step number.
+        """
+        columns = ['LEFT_' + self.left_index, 'RIGHT_' + self.right_index]
+        if self.project_type == 'LINK':
+            columns += ['LEFT_' + self.left_entity, 'RIGHT_' + self.right_entity]
+        return columns + [self.project_type + '_STEP']
+
+    def match_chunk_pair(self, step, left_chunk, right_chunk, left_block_fields, right_block_fields,
+                         transformations, blocking_method, block_guard, join_rules,
+                         left_fields, right_fields, comparison_methods, run_file):
+        """
+        Finds the matched records of a single pair of data chunks and writes them into a sorted run
+        file.
+        :return: (Name of the run file, or None if no records matched, BlockStats of the chunk pair)
+        """
+        block_stats = BlockStats()
+        pairs = self.pair_records(left_chunk,
+                                  right_chunk,
+                                  left_block_fields, right_block_fields, transformations,
+                                  blocking_method=blocking_method,
+                                  block_guard=block_guard,
+                                  block_stats=block_stats,
+                                  join_rules=join_rules)
+
+        return self.match_pairs(step, pairs, left_fields, right_fields, comparison_methods,
+                                run_file, block_stats=block_stats)
+
+    def match_pairs(self, step, pairs, left_fields, right_fields, comparison_methods, run_file,
+                    block_stats=None):
+        """
+        Applies the linking rules to the candidate record pairs and writes the matched pairs into
+        a sorted run file.
+        :param block_stats: Block statistics of the pairs, returned along with the run file.
+        :return: (Name of the run file, or None if no records matched, block_stats)
+        """
+        if len(pairs) == 0:
+            return None, block_stats
 
-    @staticmethod
-    def merge(left_reader, right_reader, header, columns, csv_writer):
-        logger.debug('>>--- merge --->>')
+        matched = LinkBase.match_records(pairs,
+                                         left_fields,
+                                         right_fields,
+                                         comparison_methods)
 
-        csv_writer.writerow(header)
-        header_index = {key: index for index, key in enumerate(header)}
-        col_index = [header_index[col] for col in columns]
+        # Only the ids of the matched records are kept, their data columns are attached to the
+        # output by save.
+        matched = matched.sort_index().reset_index()
+        matched[self.project_type + '_STEP'] = step
 
-        left_row = right_row = None
+        logger.info('Writing chunk result into sorted run file %s.', run_file)
+        matched[self.matched_columns()].to_csv(run_file, index=False)
 
-        count = 0
+        return run_file, block_stats
+
+    @staticmethod
+    def merge_runs(run_files, columns, out_filename):
+        """
+        Merges a list of csv files, each sorted by the given columns, into a single sorted file.
+        Rows that have the same values in the given columns are written only once. In that case the
+        row from the earliest file in the list is kept. At most SORT_FAN_IN files are opened at
+        once, more runs are first merged group by group into the directory of the output file.
+        :param run_files: Sorted input files. Empty files are ignored.
+        :param columns: Sort columns. All values in these columns must be numeric.
+        :param out_filename: Merged output file.
+        :return: Number of rows written to the output file.
+        """
+        logger.debug('>>--- merge_runs --->>')
+
+        merged_runs = []
         try:
-            left_row = next(left_reader)
-            right_row = next(right_reader)
-
-            while True:
-                left_cols = [left_row[i] for i in col_index]
-                right_cols = [right_row[i] for i in col_index]
-                left_cols = [float(x) for x in left_cols]
-                right_cols = [float(x) for x in right_cols]
-                count += 1
-                if left_cols < right_cols:
-                    csv_writer.writerow(left_row)
-                    left_row = None
-                    left_row = next(left_reader)
-                elif left_cols > right_cols:
-                    csv_writer.writerow(right_row)
-                    right_row = None
-                    right_row = next(right_reader)
-                else:
-                    csv_writer.writerow(left_row)
-                    left_row = right_row = None
-                    left_row = next(left_reader)
-                    right_row = next(right_reader)
-        except StopIteration:
-            pass
-
-        if left_row is not None:
-            csv_writer.writerow(left_row)
-            count += 1
-        if right_row is not None:
-            csv_writer.writerow(right_row)
-            count += 1
-
-        for left_row in left_reader:
-            csv_writer.writerow(left_row)
-            count += 1
-        for right_row in right_reader:
-            csv_writer.writerow(right_row)
-            count += 1
+            # Reduce the number of runs until they can be merged in a single pass. Merging
+            # consecutive groups of runs keeps the rows of the earliest files first.
+            while len(run_files) > SORT_FAN_IN:
+                logger.info('Merging %s sorted runs.', len(run_files))
+                group_runs = []
+                for start in range(0, len(run_files), SORT_FAN_IN):
+                    merged_run = os.path.join(os.path.dirname(out_filename),
+                                              LinkFiles.TEMP_MERGED_RUN.format(len(merged_runs)))
+                    merged_runs.append(merged_run)
+                    group = run_files[start:start + SORT_FAN_IN]
+                    ChunkedLinkBase.merge_pass(group, columns, merged_run)
+                    group_runs.append(merged_run)
+                    # Runs merged by an earlier pass are no longer needed, the others belong to the
+                    # caller.
+                    for run_file in group:
+                        if run_file in merged_runs and os.path.isfile(run_file):
+                            os.remove(run_file)
+                run_files = group_runs
+
+            count = ChunkedLinkBase.merge_pass(run_files, columns, out_filename)
+        finally:
+            for merged_run in merged_runs:
+                if os.path.isfile(merged_run):
+                    os.remove(merged_run)
 
         logger.debug('Number of records merged: %s', count)
-        logger.debug('<<--- merge ---<<')
+        logger.debug('<<--- merge_runs ---<<')
         return count
 
-    def import_data(self, src_filename, columns, dest_filename, front_cols=None, data_types=None):
+    @staticmethod
+    def merge_pass(run_files, columns, out_filename):
+        """
+        Merges sorted csv files in a single pass, see merge_runs.
+        :return: Number of rows written to the output file.
+        """
+        in_files = [open(run_file, 'r') for run_file in run_files]
+        try:
+            header = None
+            readers = []
+            for in_file in in_files:
+                reader = csv.reader(in_file)
+                try:
+                    run_header = next(reader)
+                except StopIteration:
+                    continue
+                header = header or run_header
+                readers.append(reader)
+
+            header_index = {key: index for index, key in enumerate(header or [])}
+            col_index = [header_index[col] for col in columns]
+
+            def sort_key(row):
+                return [numeric_key(row[i]) for i in col_index]
+
+            count = 0
+            with open(out_filename, 'w') as out_file:
+                csv_writer = csv.writer(out_file, lineterminator='\n')
+                if header is not None:
+                    csv_writer.writerow(header)
+
+                # heapq.merge keeps the order of the input files for rows with equal keys.
+                last_key = None
+                for row in heapq.merge(*readers, key=sort_key):
+                    key = sort_key(row)
+                    if key == last_key:
+                        continue
+                    csv_writer.writerow(row)
+                    last_key = key
+                    count += 1
+        finally:
+            for in_file in in_files:
+                in_file.close()
+
+        return count
+
+    def import_data(self, src_filename, columns, dest_filename, front_cols=None, data_types=None,
+                    sort_orders=None, normalization=None):
         """
         Reads and imports the selected columns of a csv file into a new csv file.
         The copied files is used during linking process to leave the source file unchanged.
+        The text columns other than front_cols are normalized, see linker.core.normalization.
         :param src_file: Original csv file
         :param columns: Columns from the file that need to be imported.
         :param dest_file: Copied file with selected column
+        :param sort_orders: List of numeric column lists. The orders satisfied by the source rows
+            are recorded for the copied file, so later sorts by these columns can be skipped.
+        :param normalization: List of normalizations of the text columns.
         :return:
         """
 
@@ -232,18 +632,168 @@ class ChunkedLinkBase(LinkBase):
         logger.info('Importing datafile %s...', src_filename)
 
         open(dest_filename, 'w').close()
-        reader = pd.read_csv(src_filename, usecols=columns, skipinitialspace=True, chunksize=CHUNK_SIZE,
-                             dtype=data_types)
+        reader = pd.read_csv(src_filename, usecols=columns, skipinitialspace=True,
+                             chunksize=CHUNK_SIZE, dtype=data_types)
+
+        orders = [(cols, {col: 'numeric' for col in cols}) for cols in sort_orders or []]
+        in_order = [True] * len(orders)
+        last_keys = [None] * len(orders)
+
         with open(dest_filename, 'a') as dest_file:
             first_chunk = True
             for chunk in reader:
+                normalize(chunk, normalization or [], exclude=front_cols)
                 if front_cols is not None:
                     cols = chunk.columns.tolist()
                     cols = front_cols + [x for x in cols if x not in front_cols]
                     chunk = chunk[cols]
+                for i, (cols, types) in enumerate(orders):
+                    if in_order[i]:
+                        in_order[i], last_keys[i] = is_sorted_chunk(chunk, cols, types,
+                                                                    last_keys[i])
                 chunk.replace(np.nan, '', regex=True)
                 chunk.to_csv(dest_file, index=False, header=first_chunk)
                 first_chunk = False
 
+        set_sort_orders(dest_filename,
+                        [order for order, satisfied in zip(orders, in_order) if satisfied])
+
         logger.info('Datafile %s is imported successfully.', src_filename)
         logger.debug('<<--- import_data ---<<')
+
+    def import_records(self, dataset, columns, front_cols, data_types, filename):
+        """
+        Imports a copy of all the records of a dataset sorted by record id. The working data files
+        lose the linked records at each step, so the output files take the data columns of the
+        records from this copy.
+        :param dataset: Project dataset
+        :param front_cols: Record id column followed by the other columns that come first in the
+            copy.
+        :return: Name of the copied file.
+        """
+        index_col = front_cols[0]
+        self.import_data(dataset['url'], columns, filename, front_cols=front_cols,
+                         data_types=data_types, sort_orders=[[index_col]],
+                         normalization=get_normalization(dataset))
+        ensure_sorted(filename, cols=[index_col], types={index_col: 'numeric'},
+                      work_dir=self.temp_path)
+        return filename
+
+    def attach_data(self, filename, out_filename, sides, header=None, before_col=None):
+        """
+        Attaches the data columns of the records to a file of record pairs that only holds their
+        ids. The pairs are joined with each data file by a merge on the record ids and keep their
+        order in the file.
+        The pairs without a record id of a side get empty data columns for that side.
+        :param filename: Csv file of the record pairs.
+        :param out_filename: Output file.
+        :param sides: List of (Record id column of the pairs, Data file sorted by record id, Data id
+            column, Prefix of the data columns). The data columns already in the pairs file are not
+            attached again.
+        :param header: Columns of the pairs file if it has no header row. The output is then written
+            without a header row too.
+        :param before_col: Column of the pairs file written after the attached data columns.
+        :return: Number of record pairs.
+        """
+        logger.debug('>>--- attach_data --->>')
+        logger.info('Attaching the data columns of the records to %s.', filename)
+
+        row_col = '_ROW'
+        temp_files = [self.temp_path + LinkFiles.TEMP_ATTACHED.format(i) for i in range(2)]
+
+        # Number the pairs to restore their order after they are sorted by the record ids of each
+        # side.
+        count = 0
+        with open(filename, 'r') as in_file, open(temp_files[0], 'w') as out_file:
+            reader = csv.reader(in_file)
+            writer = csv.writer(out_file, lineterminator='\n')
+            columns = header or next(reader, None)
+            if columns is not None:
+                writer.writerow(columns + [row_col])
+                for count, row in enumerate(reader, 1):
+                    writer.writerow(row + [count])
+
+        if columns is None or count == 0:
+            with open(out_filename, 'w') as out_file:
+                if columns is not None and header is None:
+                    csv.writer(out_file, lineterminator='\n').writerow(columns)
+            os.remove(temp_files[0])
+            logger.debug('<<--- attach_data ---<<')
+            return 0
+
+        data_columns = []
+        for id_col, data_filename, data_id, prefix in sides:
+            external_sort(temp_files[0], temp_files[1], [id_col], {id_col: 'numeric'},
+                          work_dir=self.temp_path)
+
+            with open(temp_files[1], 'r') as pairs_file, open(data_filename, 'r') as data_file, \
+                    open(temp_files[0], 'w') as out_file:
+                pairs_reader = csv.reader(pairs_file)
+                data_reader = csv.reader(data_file)
+                writer = csv.writer(out_file, lineterminator='\n')
+
+                pairs_header = next(pairs_reader)
+                data_header = next(data_reader)
+                id_index = pairs_header.index(id_col)
+                data_id_index = data_header.index(data_id)
+                col_index = [index for index, col in enumerate(data_header)
+                             if index != data_id_index and prefix + col not in pairs_header]
+                side_columns = [prefix + data_header[index] for index in col_index]
+                data_columns += side_columns
+                writer.writerow(pairs_header + side_columns)
+
+                data_row = next(data_reader, None)
+                empty = [''] * len(col_index)
+                for row in pairs_reader:
+                    values = empty
+                    if row[id_index] != '':
+                        rec_id = numeric_key(row[id_index])
+                        while data_row is not None and \
+                                numeric_key(data_row[data_id_index]) < rec_id:
+                            data_row = next(data_reader, None)
+                        if data_row is not None and numeric_key(data_row[data_id_index]) == rec_id:
+                            values = [data_row[index] for index in col_index]
+                    writer.writerow(row + values)
+
+        external_sort(temp_files[0], temp_files[1], [row_col], {row_col: 'numeric'},
+                      work_dir=self.temp_path)
+
+        # Write the data columns before the given column and drop the row numbers.
+        split = columns.index(before_col) if before_col in columns else len(columns)
+        out_columns = columns[:split] + data_columns + columns[split:]
+        with open(temp_files[1], 'r') as in_file, open(out_filename, 'w') as out_file:
+            reader = csv.reader(in_file)
+            writer = csv.writer(out_file, lineterminator='\n')
+            attached_header = next(reader)
+            col_index = [attached_header.index(col) for col in out_columns]
+            if header is None:
+                writer.writerow(out_columns)
+            for row in reader:
+                writer.writerow([row[index] for index in col_index])
+
+        for temp_file in temp_files:
+            if os.path.isfile(temp_file):
+                os.remove(temp_file)
+
+        logger.debug('<<--- attach_data ---<<')
+        return count
+
+
+class MatchJob(object):
+    """
+    Picklable stand-in of a chunked linker, sent to the process pool workers with each matching job.
+    It holds only the record and entity id columns and runs the pairing and matching methods of the
+    linker.
+    """
+    def __init__(self, linker):
+        self.project_type = linker.project_type
+        self.left_index = linker.left_index
+        self.right_index = linker.right_index
+        self.left_entity = getattr(linker, 'left_entity', None)
+        self.right_entity = getattr(linker, 'right_entity', None)
+
+    guard_blocks = LinkBase.guard_blocks
+    pair_records = LinkBase.pair_records
+    matched_columns = ChunkedLinkBase.matched_columns
+    match_chunk_pair = ChunkedLinkBase.match_chunk_pair
+    match_pairs = ChunkedLinkBase.match_pairs
@@ -0,0 +1,200 @@
+"""
+Typed binary columnar copy of the csv working files used by the chunked linking engines.
+
+A column store keeps the rows of a csv data file as a sequence of segments. Each segment holds the rows
+of one csv chunk as one .npy file per column, so a stored chunk is exactly the data frame that pd.read_csv
+returns for that chunk. Numeric columns are memory mapped on read and short text columns are stored as fixed
+width unicode arrays with a separate missing value mask. Text is converted to python strings only for the rows
+that are read. The csv file is parsed only when the store is built.
+A store is rebuilt automatically when its csv file or the read parameters have changed.
+"""
+import os
+import json
+import shutil
+import logging
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+
+class ColumnStore(object):
+    META_FILE = 'meta.json'
+
+    # Storage kinds of the column arrays
+    ARRAY = 'array'  # Numeric and boolean arrays, memory mapped on read
+    TEXT = 'text'  # Strings with missing values, stored as a unicode array and a mask
+    OBJECT = 'object'  # Any other python objects and wide text, pickled
+
+    # Longest text stored as a unicode array. Every entry of a unicode array takes the width of the longest
+    # value, so columns with longer values are pickled instead.
+    MAX_TEXT_WIDTH = 64
+
+    def __init__(self, store_dir):
+        self.store_dir = store_dir
+        with open(os.path.join(store_dir, ColumnStore.META_FILE), 'r') as meta_file:
+            self.meta = json.load(meta_file)
+
+    @property
+    def columns(self):
+        return self.meta['columns'][1:]
+
+    @property
+    def index_name(self):
+        return self.meta['columns'][0]
+
+    def __len__(self):
+        return sum(self.meta['segments'])
+
+    @staticmethod
+    def signature(filename):
+        """
+        Identifies the current version of a file.
+        """
+        stat = os.stat(filename)
+        return [stat.st_ino, stat.st_size, stat.st_mtime_ns]
+
+    @staticmethod
+    def read_params(index_col, columns, dtypes, chunk_size):
+        if dtypes is not None:
+            dtypes = {col: np.dtype(col_type).name for col, col_type in dtypes.items()}
+        return {
+            'index_col': index_col,
+            'columns': sorted(columns) if columns is not None else None,
+            'dtypes': dtypes,
+            'chunk_size': chunk_size
+        }
+
+    @classmethod
+    def open(cls, filename, store_dir, index_col, columns=None, dtypes=None, chunk_size=None):
+        """
+        Opens the column store of a csv file. The store is built if it does not exist or is out of date.
+        :param filename: Source csv file.
+        :param store_dir: Directory of the column store.
+        :param index_col: Index column of the data frames.
+        :param columns: Columns imported from the csv file.
+        :param dtypes: Column data types.
+        :param chunk_size: Number of rows in each segment.
+        :return: ColumnStore object.
+        """
+        params = cls.read_params(index_col, columns, dtypes, chunk_size)
+        try:
+            store = cls(store_dir)
+            if store.meta['signature'] == cls.signature(filename) and store.meta['params'] == params:
+                return store
+        except (OSError, ValueError, KeyError):
+            pass
+
+        return cls.build(filename, store_dir, index_col, columns, dtypes, chunk_size)
+
+    @classmethod
+    def build(cls, filename, store_dir, index_col, columns=None, dtypes=None, chunk_size=None):
+        """
+        Parses a csv file and writes it into a new column store.
+        :return: ColumnStore object.
+        """
+        logger.debug('>>--- build --->>')
+        logger.info('Building column store of %s.', filename)
+
+        if os.path.exists(store_dir):
+            shutil.rmtree(store_dir)
+        os.makedirs(store_dir)
+
+        signature = cls.signature(filename)
+        read_args = dict(index_col=[index_col], usecols=columns, skipinitialspace=True, dtype=dtypes)
+
+        names = None
+        segments = []
+        kinds = []
+        for seg_no, chunk in enumerate(pd.read_csv(filename, chunksize=chunk_size, **read_args)):
+            names = names or [chunk.index.name] + chunk.columns.tolist()
+            arrays = [chunk.index.values] + [chunk[col].values for col in chunk.columns]
+            kinds.append([cls._save_array(store_dir, seg_no, col_no, values)
+                          for col_no, values in enumerate(arrays)])
+            segments.append(len(chunk.index))
+
+        if names is None:
+            header = pd.read_csv(filename, nrows=0, **read_args)
+            names = [header.index.name] + header.columns.tolist()
+
+        meta = {
+            'source': filename,
+            'signature': signature,
+            'params': cls.read_params(index_col, columns, dtypes, chunk_size),
+            'columns': names,
+            'segments': segments,
+            'kinds': kinds
+        }
+        with open(os.path.join(store_dir, ColumnStore.META_FILE), 'w') as meta_file:
+            json.dump(meta, meta_file)
+
+        logger.info('Column store of %s is ready. Total rows: %s', filename, sum(segments))
+        logger.debug('<<--- build ---<<')
+        return cls(store_dir)
+
+    @staticmethod
+    def _array_file(store_dir, seg_no, col_no, suffix=''):
+        return os.path.join(store_dir, '{0}_{1}{2}.npy'.format(seg_no, col_no, suffix))
+
+    @classmethod
+    def _save_array(cls, store_dir, seg_no, col_no, values):
+        if values.dtype != np.object_:
+            np.save(cls._array_file(store_dir, seg_no, col_no), values)
+            return cls.ARRAY
+
+        nulls = pd.isnull(values)
+        strings = values[~nulls]
+        if all(isinstance(value, str) for value in strings) and \
+                max((len(value) for value in strings), default=0) <= cls.MAX_TEXT_WIDTH:
+            text = values.copy()
+            text[nulls] = ''
+            np.save(cls._array_file(store_dir, seg_no, col_no), text.astype(str))
+            np.save(cls._array_file(store_dir, seg_no, col_no, '_nulls'), nulls)
+            return cls.TEXT
+
+        np.save(cls._array_file(store_dir, seg_no, col_no), values)
+        return cls.OBJECT
+
+    def _load_array(self, seg_no, col_no, rows=None):
+        if rows is None:
+            rows = slice(None)
+
+        kind = self.meta['kinds'][seg_no][col_no]
+        array_file = self._array_file(self.store_dir, seg_no, col_no)
+        if kind == self.ARRAY:
+            # Native typed view of the memory mapped file.
+            return np.load(array_file, mmap_mode='r')[rows]
+        if kind == self.OBJECT:
+            return np.load(array_file, allow_pickle=True)[rows]
+
+        # Only the selected rows of the unicode array are converted to python strings.
+        values = np.load(array_file, mmap_mode='r')[rows].astype(object)
+        values[np.load(self._array_file(self.store_dir, seg_no, col_no, '_nulls'), mmap_mode='r')[rows]] = np.nan
+        return values
+
+    def read_segment(self, seg_no, columns=None, rows=None):
+        """
+        Reads the data frame of a stored segment.
+        :param seg_no: Segment number
+        :param columns: Columns to be loaded. All columns are loaded by default.
+        :param rows: Slice or array of the row positions to be loaded. All rows are loaded by default.
+        :return: Data frame indexed by the index column.
+        """
+        names = self.meta['columns']
+        col_nos = [col_no for col_no, name in enumerate(names) if col_no > 0 and
+                   (columns is None or name in columns)]
+
+        index = pd.Index(self._load_array(seg_no, 0, rows), name=names[0])
+        data = OrderedDict((names[col_no], self._load_array(seg_no, col_no, rows)) for col_no in col_nos)
+        return pd.DataFrame(data, index=index, columns=[names[col_no] for col_no in col_nos])
+
+    def read_chunks(self, columns=None):
+        """
+        Reads the stored data frames segment by segment.
+        :param columns: Columns to be loaded. All columns are loaded by default.
+        :return: Generator of data frames indexed by the index column.
+        """
+        for seg_no in range(len(self.meta['segments'])):
+            yield self.read_segment(seg_no, columns)
@@ -1,11 +1,21 @@
+import numpy as np
 import pandas as pd
 import logging
 
+from  linker.core.algorithms import apply_encoding, blocking_exact_keys, blocking_is_pairwise
+from  linker.core.base import CHUNK_SIZE, COLUMN_TYPES, PAIRS_PER_SECOND
+from  linker.core.block_stats import BlockStats
+from  linker.core.candidate_pairs import CandidatePairs
+from  linker.core.link_base import LinkBase
 from  linker.core.linker_factory import LinkerFactory
+from  linker.core.normalization import get_normalization, invalid_normalizations, normalize
 from  linker.core.validation import LinkError, ValidationError
 
 logger = logging.getLogger(__name__)
 
+# Key of the missing values counted by explain.
+MISSING_KEY = '\0'
+
 
 def get_fields(file_path):
     df = pd.read_csv(file_path, nrows=1)
@@ -37,6 +47,9 @@ def validate_dataset(dataset, errors, type='DEDUP'):
             entity_field = dataset['entity_field']
             if entity_field not in fields:
                 errors.append(LinkError.INVALID_ENTITY_FIELD)
+
+    if invalid_normalizations(get_normalization(dataset)):
+        errors.append(LinkError.INVALID_NORMALIZATION)
     return errors
 
 
@@ -131,3 +144,220 @@ def execute_project(project):
     task.load_data()
     task.run()
     return task.save()
+
+
+def linker_columns(dataset, columns):
+    """
+    :return: Dataset columns loaded by a linker that uses the given blocking and linking variables.
+    """
+    if dataset.get('columns'):
+        return dataset['columns']
+    id_columns = [dataset[field] for field in ('index_field', 'entity_field') if field in dataset]
+    return list(set(columns + id_columns))
+
+
+def count_block_keys(dataset, usecols, step_keys):
+    """
+    Counts the records of each transformed join key of the project steps with a single pass over
+    a dataset.
+    :param dataset: Project dataset.
+    :param usecols: Dataset columns loaded by the linker.
+    :param step_keys: Join keys of each step, see join_keys. None for the steps that are not
+        counted.
+    :return: (Number of records, Average memory of a loaded record in bytes,
+        List of the record counts of each step indexed by the join keys)
+    """
+    logger.debug('>>--- count_block_keys --->>')
+    dtypes = None
+    if 'data_types' in dataset:
+        dtypes = {col_name: COLUMN_TYPES[col_type]
+                  for col_name, col_type in dataset['data_types'].items()}
+
+    records = 0
+    record_bytes = 0
+    counts = [None] * len(step_keys)
+    id_columns = [dataset[field] for field in ('index_field', 'entity_field') if field in dataset]
+    for chunk in pd.read_csv(dataset['url'], usecols=usecols, skipinitialspace=True, dtype=dtypes,
+                             chunksize=CHUNK_SIZE):
+        records += len(chunk.index)
+        record_bytes += chunk.memory_usage(index=True, deep=True).sum()
+        normalize(chunk, get_normalization(dataset), exclude=id_columns)
+
+        for i, step_key in enumerate(step_keys):
+            if step_key is None:
+                continue
+            fields, transformations, required = step_key
+            rows = chunk.dropna(axis=0, how='any', subset=np.unique(required))
+            keys = pd.DataFrame({pos: rows[field] for pos, field in enumerate(fields)},
+                                index=rows.index)
+            for pos, method in enumerate(transformations):
+                # Missing values of the EXACT linking rules match each other, so they are counted
+                # as a key.
+                keys[pos] = apply_encoding(keys[pos], method).fillna(MISSING_KEY)
+
+            chunk_counts = keys.groupby(list(range(len(fields)))).size()
+            counts[i] = chunk_counts if counts[i] is None \
+                else counts[i].add(chunk_counts, fill_value=0)
+
+    logger.debug('<<--- count_block_keys ---<<')
+    return records, record_bytes / max(records, 1), counts
+
+
+def join_keys(step, side, project_type):
+    """
+    Finds the variables that a step joins the records of a dataset on. These are the blocking
+    variables and the variables of the linking rules applied by the blocking join.
+    :param side: 'left' or 'right'
+    :return: (Variables, Transformations, Variables that can not be missing), or None if the step
+        uses a blocking method other than the default join.
+    """
+    blocking = step['blocking_schema']
+    linking = step['linking_schema']
+    if blocking.get('method'):
+        return None
+
+    if project_type == 'DEDUP':
+        block_fields = blocking.get(side) or blocking['left']
+        link_fields = linking.get(side) or linking['left']
+    else:
+        block_fields, link_fields = blocking[side], linking[side]
+    transformations = (blocking.get('transformations') or [])[:len(block_fields)]
+    transformations += ['EXACT'] * (len(block_fields) - len(transformations))
+
+    join_rules = LinkBase.plan_join(blocking, link_fields, link_fields, linking['comparisons'])[0]
+    return (block_fields + [field for field, _, _, _ in join_rules],
+            transformations + [method for _, _, method, _ in join_rules],
+            block_fields + [field for field, _, _, match_missing in join_rules
+                            if not match_missing])
+
+
+def count_chunks(task, records, blocking):
+    """
+    Counts the data chunks of a dataset that the linker pairs at a step.
+    :return: (Number of partitions, Number of chunks of each partition)
+    """
+    partitions = 1
+    if getattr(task, 'partitions', 0) > 1 and \
+            blocking_exact_keys(len(blocking['left']), blocking.get('method')):
+        partitions = task.partitions
+
+    return partitions, int(np.ceil(records / float(partitions) / CHUNK_SIZE))
+
+
+def count_chunk_pairs(task, left_records, right_records, blocking):
+    """
+    Counts the pairs of data chunks that the linker pairs and matches at a step.
+    """
+    if not blocking_is_pairwise(blocking.get('method')):
+        # The records of all the chunks are paired in a single pass.
+        return 1
+
+    partitions, left_chunks = count_chunks(task, left_records, blocking)
+    right_chunks = count_chunks(task, right_records, blocking)[1]
+    if task.project_type == 'DEDUP':
+        return partitions * left_chunks * (left_chunks + 1) // 2
+    return partitions * left_chunks * right_chunks
+
+
+def explain(project):
+    """
+    Estimates the work of a linking/De-duplication project without running it.
+    The join keys of every step are counted with a streaming pass over each dataset. The estimates
+    are upper bounds since the records linked at a step are not paired at the next steps. The
+    candidate pairs of the blocking methods other than the default blocking join are not estimated.
+    The largest and oversized blocks are counted per chunk pair, since the block size limit of
+    a step applies to the blocks of each chunk pair.
+    :param project: The project json object
+    :return: Dictionary of the linker engine, the dataset sizes and the estimated candidate pairs,
+        chunk pairs, memory (bytes) and time (seconds) of each step.
+    """
+    logger.debug('>>--- explain --->>')
+    validate(project)
+
+    task = LinkerFactory.create_linker(project)
+    datasets = project['datasets']
+    steps = project['steps']
+    workers = getattr(task, 'workers', 1)
+
+    left_records, left_bytes, left_counts = count_block_keys(
+        datasets[0], linker_columns(datasets[0], task.left_columns),
+        [join_keys(step, 'left', task.project_type) for step in steps])
+
+    if task.project_type == 'DEDUP':
+        right_records, right_bytes, right_counts = left_records, left_bytes, left_counts
+    else:
+        right_records, right_bytes, right_counts = count_block_keys(
+            datasets[1], linker_columns(datasets[1], task.right_columns),
+            [join_keys(step, 'right', task.project_type) for step in steps])
+
+    plan = {
+        'engine': type(task).__name__,
+        'left_records': left_records,
+        'right_records': right_records,
+        'dataset_memory': int(left_bytes * left_records + (right_bytes * right_records
+                                                           if task.project_type == 'LINK' else 0)),
+        'chunk_size': CHUNK_SIZE,
+        'partitions': getattr(task, 'partitions', 0),
+        'workers': workers,
+        'steps': []
+    }
+
+    for step, left_count, right_count in zip(steps, left_counts, right_counts):
+        blocking = step['blocking_schema']
+        block_guard = task.get_block_guard(blocking)
+        chunk_pairs = count_chunk_pairs(task, left_records, right_records, blocking)
+        step_plan = {
+            'seq': step['seq'],
+            'blocking_method': (blocking.get('method') or {}).get('name'),
+            'chunk_pairs': chunk_pairs,
+            'max_block_pairs': block_guard['max_pairs'],
+            'block_policy': block_guard['policy']
+        }
+
+        if left_count is not None:
+            dedup = task.project_type == 'DEDUP'
+            if dedup:
+                sizes = left_count.to_frame('LEFT').astype(np.int64)
+                sizes['RIGHT'] = sizes['LEFT']
+            else:
+                sizes = pd.concat([left_count.rename('LEFT'), right_count.rename('RIGHT')],
+                                  axis=1, join='inner').astype(np.int64)
+            sizes['PAIRS'] = LinkBase.block_pairs(sizes['LEFT'].values, sizes['RIGHT'].values,
+                                                  dedup)
+            sizes = sizes.loc[sizes['PAIRS'] > 0]
+
+            # The block size limit applies to the blocks of each chunk pair, as it does when the
+            # step runs. The records of a block are taken to be spread evenly over the chunks of
+            # its partition.
+            left_chunks = count_chunks(task, left_records, blocking)[1]
+            right_chunks = count_chunks(task, right_records, blocking)[1]
+            left_block = np.ceil(sizes['LEFT'].values / float(max(left_chunks, 1)))
+            right_block = np.ceil(sizes['RIGHT'].values / float(max(right_chunks, 1)))
+            chunk_blocks = LinkBase.block_pairs(left_block, right_block, dedup and left_chunks <= 1)
+            largest = int(chunk_blocks.max()) if len(chunk_blocks) > 0 else 0
+
+            block_stats = BlockStats()
+            block_stats.add_blocks(sizes)
+            pairs = block_stats.pairs
+            step_plan.update({
+                'blocks': block_stats.blocks,
+                'estimated_pairs': pairs,
+                'largest_block': largest,
+                'top_blocks': block_stats.to_dict()['top_blocks'],
+                'oversized_blocks': int((chunk_blocks > block_guard['max_pairs']).sum())
+                if block_guard['max_pairs'] > 0 else 0,
+                # Memory of the candidate pairs of an average chunk pair, or of the largest block
+                # if it is bigger.
+                'estimated_memory': int(CandidatePairs.PAIR_BYTES *
+                                        max(np.ceil(pairs / float(chunk_pairs)), largest)),
+                'estimated_seconds': round(pairs / float(PAIRS_PER_SECOND * workers), 1)
+            })
+
+        plan['steps'].append(step_plan)
+
+    plan['estimated_pairs'] = sum(step.get('estimated_pairs', 0) for step in plan['steps'])
+    plan['estimated_seconds'] = round(sum(step.get('estimated_seconds', 0)
+                                          for step in plan['steps']), 1)
+
+    logger.debug('<<--- explain ---<<')
+    return plan
@@ -0,0 +1,290 @@
+"""
+In-process external sort of csv files.
+
+The rows of the input file are read in memory bounded chunks. Each chunk is sorted by its typed key
+columns and spilled into a sorted run file. The runs are then merged into the output file with a
+heap based k-way merge. Quoted fields are handled by the csv parser, so values with embedded commas
+are sorted and written correctly.
+"""
+import os
+import csv
+import json
+import heapq
+import logging
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from linker.core.base import link_config, CHUNK_SIZE
+
+logger = logging.getLogger(__name__)
+
+# Maximum number of rows held in memory while generating a sorted run.
+SORT_CHUNK_SIZE = int(link_config.get('sort_chunk_size') or CHUNK_SIZE)
+# Directory used for the sorted run files. Defaults to the working directory of each sort.
+SORT_DIR = link_config.get('sort_dir') or None
+# Maximum number of runs merged in a single pass.
+SORT_FAN_IN = int(link_config.get('sort_fan_in') or '128')
+
+# Suffix of the file that keeps the known sort orders of a csv file.
+SORT_ORDER_SUFFIX = '.order'
+
+
+def get_sort_orders(filename):
+    """
+    Returns the known sort orders of a file.
+    :param filename: Csv file
+    :return: List of (columns, types) pairs. The file rows are in the order of each of the pairs.
+    """
+    order_file = filename + SORT_ORDER_SUFFIX
+    if not os.path.isfile(order_file):
+        return []
+    with open(order_file) as in_file:
+        return [(order['cols'], order['types']) for order in json.load(in_file)]
+
+
+def set_sort_orders(filename, orders):
+    """
+    Records the sort orders of a file. Must be called every time the file is rewritten.
+    :param filename: Csv file
+    :param orders: List of (columns, types) pairs.
+    """
+    clear_sort_orders(filename)
+    if orders:
+        with open(filename + SORT_ORDER_SUFFIX, 'w') as out_file:
+            json.dump([{'cols': cols, 'types': types} for cols, types in orders], out_file)
+
+
+def clear_sort_orders(filename):
+    order_file = filename + SORT_ORDER_SUFFIX
+    if os.path.isfile(order_file):
+        os.remove(order_file)
+
+
+def _key_types(cols, types):
+    return {col: 'numeric' if types.get(col) == 'numeric' else 'string' for col in cols}
+
+
+def is_sorted(filename, cols, types):
+    """
+    Checks the recorded sort orders of a file.
+    :return: True if the file is known to be sorted by the given columns, False otherwise.
+    """
+    key_types = _key_types(cols, types)
+    for order_cols, order_types in get_sort_orders(filename):
+        if order_cols[:len(cols)] == cols and all(order_types.get(col) == key_types[col] for col in cols):
+            return True
+    return False
+
+
+def numeric_key(value):
+    """
+    Converts a text value into a numeric sort key. Empty and non numeric values sort first.
+    Integers are kept exact, since record ids above 2^53 do not fit a float.
+    """
+    try:
+        return int(value)
+    except ValueError:
+        pass
+    try:
+        value = float(value)
+    except ValueError:
+        return -np.inf
+    return -np.inf if value != value else value
+
+
+def _sort_keys(chunk, cols, types):
+    """
+    Creates the typed key arrays of a chunk of rows. Numeric columns are compared as numbers,
+    all other columns are compared as strings.
+    """
+    keys = []
+    for col in cols:
+        if types.get(col) == 'numeric':
+            values = chunk[col]
+            missing = values.isnull().values
+            if values.dtype == np.object_:
+                missing |= values.values == ''
+            values = pd.to_numeric(values[~missing], errors='coerce')
+            if values.dtype.kind == 'i':
+                # Integer columns, such as record ids, are compared as int64 to keep them exact.
+                key = np.full(len(missing), np.iinfo(np.int64).min, dtype=np.int64)
+                key[~missing] = values.values
+            else:
+                key = np.full(len(missing), -np.inf)
+                key[~missing] = values.values.astype(np.float64)
+                key[np.isnan(key)] = -np.inf
+        else:
+            key = chunk[col].values
+        keys.append(key)
+    return keys
+
+
+def is_sorted_chunk(chunk, cols, types, previous=None):
+    """
+    Checks if the rows of a data frame are in the order of the given typed columns.
+    :param chunk: Data frame
+    :param cols: Sort columns. The data frame index may be used as a column.
+    :param types: Dictionary of column types.
+    :param previous: Keys of the last row of the previous chunk, if any.
+    :return: (sorted, keys of the last row of this chunk)
+    """
+    if chunk.empty:
+        return True, previous
+
+    data = chunk.reset_index() if any(col not in chunk.columns for col in cols) else chunk
+    keys = _sort_keys(data, cols, types)
+    if previous is not None:
+        keys = [np.concatenate([[prev], key]) for prev, key in zip(previous, keys)]
+
+    in_order = np.ones(len(keys[0]) - 1, dtype=bool)
+    for key in reversed(keys):
+        in_order = (key[:-1] < key[1:]) | ((key[:-1] == key[1:]) & in_order)
+
+    return bool(in_order.all()), [key[-1] for key in keys]
+
+
+def _row_key(header, cols, types):
+    """
+    Creates the key function of the rows read from the sorted runs. The keys must order the rows exactly
+    like the key arrays created by _sort_keys.
+    """
+    converters = [numeric_key if types.get(col) == 'numeric' else str for col in cols]
+    index = [header.index(col) for col in cols]
+
+    def key(row):
+        return [convert(row[i]) for convert, i in zip(converters, index)]
+
+    return key
+
+
+def _merge(run_files, out_file, key):
+    """
+    Merges sorted run files (without header) into an open output file.
+    Rows with equal keys are written in the order of the run files.
+    """
+    in_files = [open(run_file, 'r') for run_file in run_files]
+    try:
+        readers = [csv.reader(in_file) for in_file in in_files]
+        writer = csv.writer(out_file, lineterminator='\n')
+        count = 0
+        for row in heapq.merge(*readers, key=key):
+            writer.writerow(row)
+            count += 1
+    finally:
+        for in_file in in_files:
+            in_file.close()
+    return count
+
+
+def _new_run_file(spill_dir):
+    handle, run_file = tempfile.mkstemp(prefix='sort_run_', suffix='.csv', dir=spill_dir)
+    os.close(handle)
+    return run_file
+
+
+def external_sort(filename, out_filename, cols, types, work_dir=None, append=False, chunk_size=None):
+    """
+    Sorts a csv file by a list of typed columns.
+    :param filename: Input csv file with a header row.
+    :param out_filename: Sorted output file.
+    :param cols: Sort columns, the first column is the primary sort key.
+    :param types: Dictionary of column types. 'numeric' columns are compared as numbers, all other
+        columns are compared as strings.
+    :param work_dir: Spill directory of the sorted runs. Defaults to the sort_dir config option or the
+        directory of the input file.
+    :param append: If True, the sorted rows are appended to the output file without a header row.
+    :param chunk_size: Maximum number of rows sorted in memory.
+    :return: Number of sorted rows.
+    """
+    logger.debug('>>--- external_sort --->>')
+    logger.info('Sorting %s by %s.', filename, cols)
+
+    spill_dir = work_dir or SORT_DIR or os.path.dirname(filename) or '.'
+    chunk_size = chunk_size or SORT_CHUNK_SIZE
+
+    with open(filename, 'r') as in_file:
+        header = next(csv.reader(in_file), None)
+
+    if header is None:
+        logger.info('Nothing to sort, %s is empty.', filename)
+        if not append:
+            open(out_filename, 'w').close()
+        clear_sort_orders(out_filename)
+        return 0
+
+    run_files = []
+    total = 0
+    try:
+        reader = pd.read_csv(filename, dtype=str, na_filter=False, chunksize=chunk_size)
+        for chunk in reader:
+            if chunk.empty:
+                continue
+            keys = _sort_keys(chunk, cols, types)
+            # np.lexsort uses the last key as the primary key.
+            order = np.lexsort(keys[::-1])
+
+            run_file = _new_run_file(spill_dir)
+            chunk.iloc[order].to_csv(run_file, index=False, header=False)
+            run_files.append(run_file)
+            total += len(chunk.index)
+            logger.info('Sorted run %s: %s rows, %s rows in total.', len(run_files), len(chunk.index), total)
+
+        key = _row_key(header, cols, types)
+
+        # Reduce the number of runs until they can be merged in a single pass.
+        while len(run_files) > SORT_FAN_IN:
+            logger.info('Merging %s sorted runs.', len(run_files))
+            merged_runs = []
+            for start in range(0, len(run_files), SORT_FAN_IN):
+                run_file = _new_run_file(spill_dir)
+                with open(run_file, 'w') as out_file:
+                    _merge(run_files[start:start + SORT_FAN_IN], out_file, key)
+                for merged_file in run_files[start:start + SORT_FAN_IN]:
+                    os.remove(merged_file)
+                merged_runs.append(run_file)
+            run_files = merged_runs
+
+        with open(out_filename, 'a' if append else 'w') as out_file:
+            if not append:
+                csv.writer(out_file, lineterminator='\n').writerow(header)
+            count = _merge(run_files, out_file, key)
+    finally:
+        for run_file in run_files:
+            if os.path.isfile(run_file):
+                os.remove(run_file)
+
+    # Recorded orders of the output file are no longer valid.
+    clear_sort_orders(out_filename)
+
+    logger.info('Sorting %s is complete. Total rows: %s', filename, count)
+    logger.debug('<<--- external_sort ---<<')
+    return count
+
+
+def sort_csv(filename, appendfile, cols, types, work_dir=None):
+    """
+    Sorts a csv file and writes the result into appendfile. If appendfile already exists, the sorted rows
+    are appended to it, otherwise it is created with the header row of the input file.
+    :return: Number of sorted rows.
+    """
+    return external_sort(filename, appendfile, cols, types,
+                         work_dir=work_dir,
+                         append=os.path.isfile(appendfile))
+
+
+def ensure_sorted(filename, cols, types, work_dir=None):
+    """
+    Sorts a csv file in place unless it is already known to be sorted by the given columns.
+    :return: True if the file was sorted, False if the sort was skipped.
+    """
+    if is_sorted(filename, cols, types):
+        logger.info('%s is already sorted by %s.', filename, cols)
+        return False
+
+    sorted_file = _new_run_file(work_dir or SORT_DIR or os.path.dirname(filename) or '.')
+    external_sort(filename, sorted_file, cols, types, work_dir=work_dir)
+    os.replace(sorted_file, filename)
+    set_sort_orders(filename, [(cols, _key_types(cols, types))])
+    return True
@@ -5,6 +5,25 @@ class LinkFiles:
     """
 
     MATCHED_RECORDS = 'matched_records.csv'
+    # Sorted matched records of a single chunk pair
+    TEMP_MATCHED_RUN = 'matched_run_{}.csv'
+    # Matched records of a group of runs, merged when there are too many runs to merge in a single pass
+    TEMP_MERGED_RUN = 'merged_run_{}.csv'
+
+    # Copy of a dataset sorted by record id, and the record pairs with their data columns attached
+    TEMP_RECORDS = '{}_records.csv'
+    TEMP_ATTACHED = 'attached_{}.csv'
+
+    # Hash partitions of the left and right data files
+    TEMP_LEFT_PARTITION = 'left_partition_{}.csv'
+    TEMP_RIGHT_PARTITION = 'right_partition_{}.csv'
+
+    # Columnar copy of a data file
+    TEMP_COLUMN_STORE = '{}_columns'
+
+    # Data files and blocking keys sorted for the sorted neighbourhood blocking method
+    TEMP_NEIGHBOURHOOD = 'neighbourhood_{}.csv'
+    TEMP_NEIGHBOURHOOD_KEYS = 'neighbourhood_keys.csv'
 
     # De-Duplication files
     TEMP_MATCHED_FILE = 'matched_temp.csv'
@@ -22,4 +41,5 @@ class LinkFiles:
     TEMP_LINK_SORTED = 'temp_link_sorted.csv'
     TEMP_LINKING_DATA = 'temp_linking_data.csv'
     TEMP_LINKED_RECORDS = 'linked_records.csv'
+    TEMP_MATCHED_NOT_LINKED = 'matched_not_linked.csv'
     TEMP_SORTED_FILE = 'temp_sorted_data.csv'
@@ -1,9 +1,16 @@
 import json
 import logging
 import numpy as np
+import pandas as pd
 
 from abc import ABCMeta, abstractmethod
-from linker.core.algorithms import apply_encoding, apply_comparison
+from linker.core.algorithms import (apply_encoding, apply_comparison, comparison_cost, comparison_join_encoding,
+                                   apply_blocking, blocking_is_pairwise)
+from linker.core.base import MAX_BLOCK_PAIRS, BLOCK_POLICY
+from linker.core.block_stats import BlockStats
+from linker.core.candidate_pairs import CandidatePairs
+from linker.core.union_find import UnionFind
+from linker.core.validation import LinkError, ValidationError, BlockSizeError
 
 logger = logging.getLogger(__name__)
 
@@ -12,6 +19,12 @@ class LinkBase(metaclass=ABCMeta):
 
     id = 0
 
+    # Actions on the blocks that pair more records than the step maximum.
+    BLOCK_POLICIES = ('FAIL', 'SPLIT', 'SKIP')
+
+    # Largest number of distinct composite blocking keys encoded without recoding.
+    MAX_KEY_CODES = 2 ** 62
+
     @classmethod
     def get_next_id(cls):
         cls.id += 1
@@ -21,6 +34,42 @@ class LinkBase(metaclass=ABCMeta):
     def reset_id(cls):
         cls.id = 0
 
+    @classmethod
+    def reserve_ids(cls, count):
+        """
+        Reserves a block of sequential ids.
+        :param count: Number of ids
+        :return: The first reserved id.
+        """
+        first_id = cls.id + 1
+        cls.id += count
+        return first_id
+
+    @classmethod
+    def assign_entities(cls, left_ids, right_ids):
+        """
+        Groups the records of the matched pairs into entities of connected records and assigns a new id to
+        each entity. Entity ids are assigned in the order that entities first appear in the pairs.
+        :param left_ids: Array of left record ids of the pairs.
+        :param right_ids: Array of right record ids of the pairs.
+        :return: (Array of entity ids of the pairs, Series of entity ids indexed by the sorted record ids)
+        """
+        pairs_count = len(left_ids)
+        codes, rec_ids = pd.factorize(np.concatenate([left_ids, right_ids]), sort=True)
+
+        entities = UnionFind(len(rec_ids))
+        entities.union_many(codes[:pairs_count], codes[pairs_count:])
+        labels = entities.components()
+
+        # Number the entities by their first pair.
+        first_seen = pd.unique(labels[codes[:pairs_count]])
+        rank = np.empty(len(first_seen), dtype=np.int64)
+        rank[first_seen] = np.arange(len(first_seen))
+        entity_ids = cls.reserve_ids(len(first_seen)) + rank[labels]
+
+        linked = pd.Series(entity_ids, index=pd.Index(rec_ids, name='REC_ID'), name='ENTITY_ID')
+        return entity_ids[codes[:pairs_count]], linked
+
     @abstractmethod
     def load_data(self):
         raise NotImplementedError('Abstract method. No implementation.')
@@ -46,20 +95,33 @@ class LinkBase(metaclass=ABCMeta):
 
     @staticmethod
     def match_records(pairs, left_fields, right_fields, comparisons_methods):
+        """
+        Finds the record pairs that satisfy all the linking rules. The rules are applied from the cheapest to the
+        most expensive comparison method, and each rule only compares the pairs that passed the previous ones.
+        :param pairs: CandidatePairs, or data frame of the record pairs.
+        :return: Data frame of the matched pairs sorted by index.
+        """
         logger.debug('>>--- match_records --->>')
         logger.info('Applying linking rules.')
 
-        pairs['matched'] = 1
-        for left, right, fn in zip(left_fields, right_fields,
-                                   comparisons_methods):
+        rules = sorted(zip(left_fields, right_fields, comparisons_methods),
+                       key=lambda rule: comparison_cost(rule[2].get('name', 'EXACT')))
+
+        # Positions of the pairs that passed all the rules applied so far.
+        matched = np.arange(len(pairs))
+        for left, right, fn in rules:
+            if len(matched) == 0:
+                break
             method = fn.get('name', 'EXACT')
             args = fn.get('args') or {}
             logger.info("Left : %s, Right: %s, Args: %s", left, right, fn)
-            result = LinkBase.compare_fields(pairs, left, right, method, **args)
-            pairs['matched'] &= result
+            candidates = pairs if len(matched) == len(pairs) else pairs.take(matched)
+            result = LinkBase.compare_fields(candidates, left, right, method, **args)
+            matched = matched[np.asarray(result, dtype=bool)]
 
-        pairs = pairs.loc[lambda df: df.matched == 1, :]
-        pairs = pairs.drop('matched', axis=1)
+        pairs = pairs.take(matched)
+        if isinstance(pairs, CandidatePairs):
+            pairs = pairs.to_frame()
         pairs = pairs.sort_index()
 
         logger.debug('<<--- match_records ---<<')
@@ -87,13 +149,17 @@ class LinkBase(metaclass=ABCMeta):
         self.total_linked = None
         self.transformations = None
         self.comparison_methods = None
+        self.block_stats = None
 
         for step in project['steps']:
+            split = step['blocking_schema'].get('split') or {}
             self.left_columns = list(set(self.left_columns +
                                          step['blocking_schema'].get('left', []) +
+                                         split.get('left', []) +
                                          step['linking_schema'].get('left', [])))
             self.right_columns = list(set(self.right_columns +
                                           step['blocking_schema'].get('right', []) +
+                                          split.get('right', []) +
                                           step['linking_schema'].get('right', [])))
 
     def __str__(self):
@@ -117,20 +183,260 @@ class LinkBase(metaclass=ABCMeta):
 
         return json.dumps(data_dict, indent=4)
 
-    def pair_records(self, left_chunk, right_chunk, left_fields, right_fields, transformations):
+    @staticmethod
+    def plan_join(blocking, left_fields, right_fields, comparison_methods):
+        """
+        Moves the linking rules that compare transformed values for equality, such as EXACT, SOUNDEX and NYSIIS,
+        into the blocking join, so the pairs that fail them are never created. Only the default blocking join can
+        apply linking rules.
+        :param blocking: Step blocking schema.
+        :param left_fields: Left linking variables.
+        :param right_fields: Right linking variables.
+        :param comparison_methods: Linking comparison methods.
+        :return: (List of join rules (left variable, right variable, transformation, True if missing values match),
+            the left variables, right variables and comparison methods of the remaining linking rules)
+        """
+        join_rules = []
+        rules = []
+        for left, right, fn in zip(left_fields, right_fields, comparison_methods):
+            encoding = None
+            if not blocking.get('method') and not fn.get('args'):
+                encoding = comparison_join_encoding(fn.get('name', 'EXACT'))
+            if encoding is None:
+                rules.append((left, right, fn))
+            else:
+                join_rules.append((left, right) + encoding)
+
+        if join_rules:
+            logger.info('Linking rules applied by the blocking join: %s', join_rules)
+        left_fields, right_fields, comparison_methods = (list(values) for values in zip(*rules)) if rules \
+            else ([], [], [])
+        return join_rules, left_fields, right_fields, comparison_methods
+
+    def get_block_guard(self, blocking):
+        """
+        Reads the block size limit of a step. The project settings can be overridden by the
+        max_block_pairs, block_policy and split variables of the step blocking schema.
+        :param blocking: Step blocking schema.
+        :return: Dictionary of the maximum record pairs per block, the block policy and the prefixed
+            split variables.
+        """
+        max_pairs = blocking.get('max_block_pairs')
+        max_pairs = MAX_BLOCK_PAIRS if max_pairs is None else int(max_pairs)
+        policy = blocking.get('block_policy') or BLOCK_POLICY
+
+        split = blocking.get('split') or {}
+        left_fields = split.get('left') or []
+        if self.project_type == 'DEDUP' and not split.get('right'):
+            right_fields = left_fields
+        else:
+            right_fields = split.get('right') or []
+        transformations = split.get('transformations') or ['EXACT'] * len(left_fields)
+
+        if policy not in LinkBase.BLOCK_POLICIES or (policy == 'SPLIT' and (
+                not left_fields or len(left_fields) != len(right_fields) or
+                len(left_fields) != len(transformations))):
+            raise ValidationError([LinkError.INVALID_BLOCK_POLICY])
+
+        return {
+            'max_pairs': max_pairs,
+            'policy': policy,
+            'left': ['LEFT_' + field for field in left_fields],
+            'right': ['RIGHT_' + field for field in right_fields],
+            'transformations': transformations
+        }
+
+    @staticmethod
+    def block_pairs(left, right, self_pairs=False):
+        """
+        Counts the distinct record pairs of blocks.
+        :param left: Array of the left record counts of the blocks.
+        :param right: Array of the right record counts of the blocks.
+        :param self_pairs: True if the left and right records of each block are the same
+            de-duplicated records. Each two of them are then paired once and no record is paired
+            with itself.
+        :return: Array of the record pairs of the blocks.
+        """
+        left = np.asarray(left, dtype=np.int64)
+        if self_pairs:
+            return left * (left - 1) // 2
+        return left * np.asarray(right, dtype=np.int64)
+
+    @staticmethod
+    def block_sizes(left_codes, right_codes, self_pairs=False):
+        """
+        Counts the records of each blocking key shared by two data chunks.
+        :param left_codes: Array of the left composite key codes, see composite_keys.
+        :param right_codes: Array of the right composite key codes.
+        :param self_pairs: True if a de-duplicated chunk is paired with itself, see block_pairs.
+        :return: Data frame indexed by the key codes with the LEFT and RIGHT record counts and the
+            number of record PAIRS of each block. Blocks that pair no records are left out.
+        """
+        sizes = pd.concat([pd.Series(left_codes).value_counts(sort=False).rename('LEFT'),
+                           pd.Series(right_codes).value_counts(sort=False).rename('RIGHT')],
+                          axis=1, join='inner')
+        sizes = sizes.sort_index()
+        sizes['PAIRS'] = LinkBase.block_pairs(sizes['LEFT'].values, sizes['RIGHT'].values,
+                                              self_pairs)
+        return sizes.loc[sizes['PAIRS'] > 0]
+
+    @staticmethod
+    def block_key_name(chunk, fields, codes):
+        """
+        :return: Function giving the blocking key values of a key code of the chunk records.
+        """
+        def key_name(code):
+            row = np.flatnonzero(codes == code)[0]
+            key = tuple(chunk[field].values[row] for field in fields)
+            return BlockStats.key_name(key if len(key) > 1 else key[0])
+        return key_name
+
+    def guard_blocks(self, left_chunk, right_chunk, left_on, right_on, block_guard, block_stats):
+        """
+        Pairs the records of two data chunks that have equal blocking keys. The blocks are profiled
+        before the records are paired and the block policy is applied to the blocks that pair more
+        records than the maximum. FAIL raises a BlockSizeError, SKIP leaves out the records of the
+        oversized blocks and SPLIT pairs them only if their split variables are also equal. Split
+        blocks that are still oversized are skipped.
+        :return: (Array of left row positions, Array of right row positions) of the record pairs.
+        """
+        left_codes, right_codes = LinkBase.composite_keys(
+            [left_chunk[col].values for col in left_on],
+            [right_chunk[col].values for col in right_on])
+        # A de-duplicated chunk paired with itself has the same records and keys on both sides.
+        self_pairs = self.project_type == 'DEDUP' and np.array_equal(left_codes, right_codes) and \
+            np.array_equal(left_chunk.index.values, right_chunk.index.values)
+        sizes = LinkBase.block_sizes(left_codes, right_codes, self_pairs)
+        key_name = LinkBase.block_key_name(left_chunk, left_on, left_codes)
+        if block_stats is not None:
+            block_stats.add_blocks(sizes, key_name)
+
+        max_pairs = block_guard['max_pairs'] if block_guard else 0
+        oversized = sizes.loc[sizes['PAIRS'] > max_pairs] if max_pairs > 0 else sizes.iloc[:0]
+        if len(oversized.index) == 0:
+            return LinkBase.join_codes(left_codes, right_codes)
+
+        policy = block_guard['policy']
+        if policy == 'FAIL':
+            largest = oversized['PAIRS'].idxmax()
+            raise BlockSizeError(key_name(largest), int(oversized.loc[largest, 'PAIRS']), max_pairs)
+
+        logger.info('Applying %s block policy to %s block(s) above %s record pairs.',
+                    policy, len(oversized.index), max_pairs)
+        left_mask = np.isin(left_codes, oversized.index.values)
+        right_mask = np.isin(right_codes, oversized.index.values)
+        left_rows, right_rows = np.flatnonzero(~left_mask), np.flatnonzero(~right_mask)
+        left_pos, right_pos = LinkBase.join_codes(left_codes[left_rows], right_codes[right_rows])
+        left_pos, right_pos = left_rows.take(left_pos), right_rows.take(right_pos)
+
+        if policy == 'SKIP':
+            if block_stats is not None:
+                block_stats.add_skipped(oversized)
+            return left_pos, right_pos
+
+        if block_stats is not None:
+            block_stats.add_split(oversized)
+
+        # Records of the oversized blocks without a value for the split variables can not be paired.
+        left_rows, right_rows = np.flatnonzero(left_mask), np.flatnonzero(right_mask)
+        left_block, right_block = left_chunk.iloc[left_rows], right_chunk.iloc[right_rows]
+        left_valid = left_block[np.unique(block_guard['left'])].notnull().all(axis=1).values
+        right_valid = right_block[np.unique(block_guard['right'])].notnull().all(axis=1).values
+        left_rows, left_block = left_rows[left_valid], left_block.iloc[left_valid]
+        right_rows, right_block = right_rows[right_valid], right_block.iloc[right_valid]
+
+        left_split_codes, right_split_codes = LinkBase.composite_keys(
+            [left_block[col].values for col in left_on] +
+            [apply_encoding(left_block[field], method).values
+             for field, method in zip(block_guard['left'], block_guard['transformations'])],
+            [right_block[col].values for col in right_on] +
+            [apply_encoding(right_block[field], method).values
+             for field, method in zip(block_guard['right'], block_guard['transformations'])])
+        split_self_pairs = self_pairs and np.array_equal(left_split_codes, right_split_codes)
+        split_sizes = LinkBase.block_sizes(left_split_codes, right_split_codes, split_self_pairs)
+        skipped = split_sizes.loc[split_sizes['PAIRS'] > max_pairs]
+        if len(skipped.index) > 0:
+            if block_stats is not None:
+                block_stats.add_skipped(skipped)
+            left_valid = ~np.isin(left_split_codes, skipped.index.values)
+            right_valid = ~np.isin(right_split_codes, skipped.index.values)
+            left_rows, left_split_codes = left_rows[left_valid], left_split_codes[left_valid]
+            right_rows, right_split_codes = right_rows[right_valid], right_split_codes[right_valid]
+
+        split_left_pos, split_right_pos = LinkBase.join_codes(left_split_codes, right_split_codes)
+        return (np.concatenate([left_pos, left_rows.take(split_left_pos)]),
+                np.concatenate([right_pos, right_rows.take(split_right_pos)]))
+
+    @staticmethod
+    def composite_keys(left_keys, right_keys):
+        """
+        Encodes the blocking keys of two data chunks as single int64 codes. The values of each blocking variable
+        are factorized against a dictionary shared by both chunks, so the records with equal keys get equal codes.
+        :param left_keys: List of the left blocking key arrays.
+        :param right_keys: List of the right blocking key arrays, in the same order.
+        :return: (Array of left codes, Array of right codes)
+        """
+        left_count = len(left_keys[0])
+        codes = np.zeros(left_count + len(right_keys[0]), dtype=np.int64)
+        cardinality = 1
+        for left, right in zip(left_keys, right_keys):
+            key_codes, uniques = pd.factorize(np.concatenate([left, right]))
+            # Missing values are paired with each other, as they are by a merge.
+            key_codes[key_codes < 0] = len(uniques)
+            size = len(uniques) + 1
+
+            # Recode the keys of the previous variables to the distinct ones if the codes could overflow.
+            if cardinality * size > LinkBase.MAX_KEY_CODES:
+                codes, uniques = pd.factorize(codes)
+                cardinality = len(uniques)
+
+            codes = codes * size + key_codes
+            cardinality *= size
+
+        return codes[:left_count], codes[left_count:]
+
+    @staticmethod
+    def join_codes(left_codes, right_codes):
+        """
+        Pairs the records of two data chunks that have equal composite key codes, without copying their columns.
+        :param left_codes: Array of the left composite key codes, see composite_keys.
+        :param right_codes: Array of the right composite key codes.
+        :return: (Array of left row positions, Array of right row positions) of the record pairs.
+        """
+        dtype = CandidatePairs.position_type(max(len(left_codes), len(right_codes)))
+        order = np.argsort(right_codes, kind='mergesort').astype(dtype)
+        right_sorted = right_codes[order]
+        first = np.searchsorted(right_sorted, left_codes, side='left')
+        counts = np.searchsorted(right_sorted, left_codes, side='right') - first
+
+        # Each left record is paired with the run of sorted right records that have its code.
+        left_pos = np.repeat(np.arange(len(left_codes), dtype=dtype), counts)
+        offsets = np.arange(counts.sum()) + np.repeat(first - (np.cumsum(counts) - counts), counts)
+        return left_pos, order.take(offsets)
+
+    def pair_records(self, left_chunk, right_chunk, left_fields, right_fields, transformations,
+                     blocking_method=None, block_guard=None, block_stats=None, join_rules=None):
+        """
+        Pairs the records of two data chunks that satisfy the blocking rules.
+        :param blocking_method: Blocking method, {'name': ..., 'args': {...}}. By default the records are paired
+            if all their transformed blocking variables are equal.
+        :param join_rules: Linking rules also applied by the default blocking join, see plan_join.
+        :param block_guard: Block size limit of the default blocking, see get_block_guard.
+        :param block_stats: BlockStats object that collects the block sizes of the default blocking.
+        :return: CandidatePairs of the record pairs.
+        """
         logger.debug('>>--- pair_records --->>')
         logger.info('Applying blocking rules.')
 
         left_index = 'LEFT_' + self.left_index
         right_index = 'RIGHT_' + self.right_index
 
-        # Remove all rows that their blocking columns are empty.
+        # Remove all rows that their blocking columns are empty. Blank values are already missing values,
+        # since the datasets are normalized when they are loaded.
         left_chunk = left_chunk.sort_index()
-        left_chunk.replace(r'^\s+$', np.nan, regex=True, inplace=True)
         left_chunk = left_chunk.dropna(axis=0, how='any', subset=np.unique(left_fields))
 
         right_chunk = right_chunk.sort_index()
-        right_chunk.replace(r'^\s+$', np.nan, regex=True, inplace=True)
         right_chunk = right_chunk.dropna(axis=0, how='any', subset=np.unique(right_fields))
 
         # Create copies of blocking columns to apply encoding methods
@@ -160,21 +466,40 @@ class LinkBase(metaclass=ABCMeta):
         left_chunk.index.names = [left_index]
         right_chunk.index.names = [right_index]
 
-        chunk_pairs = left_chunk.reset_index().merge(
-            right_chunk.reset_index(),
-            how='inner',
-            left_on=left_on,
-            right_on=right_on,
-        )
+        if blocking_method:
+            logger.info('Blocking method: %s', blocking_method)
+            left_keys = left_chunk[left_on]
+            right_keys = right_chunk[right_on]
+            left_keys.columns = right_keys.columns = range(len(left_on))
+            # Methods that pair all the records together see each de-duplicated record only once.
+            if self.project_type == 'DEDUP' and not blocking_is_pairwise(blocking_method):
+                right_keys = None
+            left_pos, right_pos = apply_blocking(left_keys, right_keys, blocking_method['name'],
+                                                 **(blocking_method.get('args') or {}))
+        else:
+            blocking_keys = list(zip(left_fields, right_fields, transformations))
+            for i, (left, right, method, match_missing) in enumerate(join_rules or []):
+                if (left, right, method) in blocking_keys:
+                    continue
+                if not match_missing:
+                    left_chunk = left_chunk.dropna(axis=0, how='any', subset=[left])
+                    right_chunk = right_chunk.dropna(axis=0, how='any', subset=[right])
+                left_key, right_key = '{}_J{}'.format(left, i), '{}_J{}'.format(right, i)
+                left_chunk = left_chunk.assign(**{left_key: apply_encoding(left_chunk[left], method)})
+                right_chunk = right_chunk.assign(**{right_key: apply_encoding(right_chunk[right], method)})
+                left_on.append(left_key)
+                right_on.append(right_key)
+
+            left_pos, right_pos = self.guard_blocks(left_chunk, right_chunk, left_on, right_on,
+                                                    block_guard, block_stats)
 
         # Skip comparing a record with itself for de-duplication projects
         if self.project_type == 'DEDUP':
-            chunk_pairs = chunk_pairs.loc[chunk_pairs[left_index] < chunk_pairs[right_index]]
-
-        chunk_pairs = chunk_pairs.set_index([left_index, right_index])
+            distinct = left_chunk.index.values.take(left_pos) < right_chunk.index.values.take(right_pos)
+            left_pos, right_pos = left_pos[distinct], right_pos[distinct]
 
-        # Remove temporary columns.
-        chunk_pairs = chunk_pairs.drop(left_on + right_on, axis=1)
+        chunk_pairs = CandidatePairs(left_chunk.drop(left_on, axis=1), right_chunk.drop(right_on, axis=1),
+                                     left_pos, right_pos)
 
         logger.debug('<<--- pair_records ---<<')
         return chunk_pairs
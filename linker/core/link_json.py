@@ -3,7 +3,7 @@ import sys
 import json
 import getopt
 
-from linker.core.commands import execute_project
+from linker.core.commands import execute_project, explain
 
 
 import logging
@@ -26,18 +26,37 @@ def run_json(project_file):
             return execute_project(project)
 
 
+def explain_json(project_file):
+    """
+    Loads a linking project from a json file and estimates its work without running it.
+    :param project_file: The json file of the linking project.
+    :return: Estimated work of the project, see commands.explain.
+    """
+
+    if not os.path.exists(project_file):
+        logger.error("The project file %s was not found.", project_file)
+    else:
+        with open(project_file) as json_file:
+            project = json.load(json_file)
+            return explain(project)
+
+
 def main(argv):
     try:
-        opts, args = getopt.getopt(argv, "hp:", ["--help", "--project"])
+        opts, args = getopt.getopt(argv, "hp:e:", ["help", "project=", "explain="])
     except getopt.GetoptError:
-        logger.info('link_json.py -p <json file>')
+        logger.info('link_json.py -p <json file> | -e <json file>')
         sys.exit(2)
     for opt, arg in opts:
         if opt in ('-h', '--help'):
-            logger.info('link_json.py -p <json file>')
+            logger.info('link_json.py -p <json file> | -e <json file>')
             sys.exit()
         elif opt in ("-p", "--project"):
             run_json(arg)
+        elif opt in ("-e", "--explain"):
+            plan = explain_json(arg)
+            if plan is not None:
+                print(json.dumps(plan, indent=4))
 
 
 if __name__ == "__main__":
@@ -8,6 +8,7 @@ import shutil
 from linker.core.base import (link_config, COLUMN_TYPES)
 from linker.core.files import LinkFiles
 from linker.core.memory_link_base import MemoryLinkBase
+from linker.core.normalization import get_normalization, normalize
 from linker.reports.report import generate_linking_summary
 
 
@@ -76,49 +77,20 @@ class MemoryDedup(MemoryLinkBase):
                                             usecols=usecols,
                                             skipinitialspace=True,
                                             dtype=self.left_dtypes)
+            normalize(self.left_dataset, get_normalization(dataset))
         logger.debug('<<--- load_data ---<<')
 
     def link(self):
         logger.debug('>>--- link --->>')
-        from .union_find import UnionFind
 
         logger.info('Assigning entity id to linked records.')
-        left_index = self.matched.index.get_level_values(0).drop_duplicates()
-        right_index = self.matched.index.get_level_values(1).drop_duplicates()
-        link_index = left_index.union(right_index)
-        link_index = link_index.rename('REC_ID')
-
-        # Create index to location map
-        rec_len = len(link_index)
-        index_loc = pd.Series(list(range(rec_len)), index=link_index)
-        entity_ids = [None] * rec_len
-
-        # Create disjoint set of entities
-        entts = UnionFind(rec_len)
-
-        linked = pd.DataFrame(columns=['ENTITY_ID'], index=link_index)
-        linked['ENTITY_ID'].fillna(0, inplace=True)
-        linked['ENTITY_ID'] = linked['ENTITY_ID'].map(
-            lambda x: '{:.0f}'.format(x)
-            if pd.notnull(x)
-            else np.nan)
-
-        # Find all connected records and make entity groups
-        for left_id, right_id in self.matched.index.values:
-            entts.union(index_loc[left_id], index_loc[right_id])
+        pair_entities, linked = MemoryLinkBase.assign_entities(self.matched.index.get_level_values(0).values,
+                                                               self.matched.index.get_level_values(1).values)
 
-        self.matched.insert(0, 'ENTITY_ID', np.nan)
-        # Assign entity id's
-        for left_id, right_id in self.matched.index.values:
-            entt = entts.find(index_loc[left_id])
-            entity_ids[entt] = entity_ids[entt] or MemoryLinkBase.get_next_id()
-            self.matched.set_value((left_id, right_id), 'ENTITY_ID',
-                                   entity_ids[entt])
-            linked.set_value(left_id, 'ENTITY_ID', entity_ids[entt])
-            linked.set_value(right_id, 'ENTITY_ID', entity_ids[entt])
+        self.matched.insert(0, 'ENTITY_ID', pair_entities.astype(np.float64))
 
         logger.debug('<<--- link ---<<')
-        return linked
+        return linked.to_frame()
 
     def run(self):
         logger.debug('>>--- run --->>')
@@ -140,6 +112,7 @@ class MemoryDedup(MemoryLinkBase):
                               link_method=step['linking_method'],
                               blocking=step['blocking_schema'],
                               linking=step['linking_schema'])
+            self.steps[step['seq']]['block_stats'] = self.block_stats.to_dict()
 
             match_file_path = \
                 self.temp_path + LinkFiles.TEMP_MATCHED_FILE
@@ -10,6 +10,7 @@ from linker.core.base import (link_config,
                                    LINKING_RELATIONSHIPS)
 from linker.core.files import LinkFiles
 from linker.core.memory_link_base import MemoryLinkBase
+from linker.core.normalization import get_normalization, normalize
 from linker.reports.report import generate_linking_summary
 
 logger = logging.getLogger(__name__)
@@ -95,6 +96,7 @@ class MemoryLink(MemoryLinkBase):
                                         usecols=left_usecols,
                                         skipinitialspace=True,
                                         dtype=left_dtypes)
+        normalize(self.left_dataset, get_normalization(datasets[0]), exclude=[self.left_entity])
 
         try:
             right_usecols = datasets[1]['columns'] or self.right_columns
@@ -109,6 +111,7 @@ class MemoryLink(MemoryLinkBase):
                                          usecols=right_usecols,
                                          skipinitialspace=True,
                                          dtype=right_dtypes)
+        normalize(self.right_dataset, get_normalization(datasets[1]), exclude=[self.right_entity])
 
         logger.debug('<<--- load_data ---<<')
 
@@ -190,6 +193,7 @@ class MemoryLink(MemoryLinkBase):
                               link_method=step['linking_method'],
                               blocking=step['blocking_schema'],
                               linking=step['linking_schema'])
+            self.steps[step['seq']]['block_stats'] = self.block_stats.to_dict()
 
             logger.info("%s.2) Identifying the linked records based on the relationship type...",
                         step['seq'])
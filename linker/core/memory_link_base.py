@@ -4,6 +4,8 @@ import pandas as pd
 from abc import abstractmethod
 
 from  linker.core.base import (CHUNK_SIZE, _save_pairs)
+from  linker.core.algorithms import blocking_is_pairwise
+from  linker.core.block_stats import BlockStats
 from  linker.core.files import LinkFiles
 from  linker.core.link_base import LinkBase
 
@@ -55,6 +57,8 @@ class MemoryLinkBase(LinkBase):
         right_fields = ['RIGHT_' + field for field in right_fields]
 
         transformations = blocking.get('transformations')
+        block_guard = self.get_block_guard(blocking)
+        self.block_stats = BlockStats()
 
         left_link_fields = linking.get('left')
         if self.project_type == 'DEDUP' and (not linking.get('right')):
@@ -65,17 +69,25 @@ class MemoryLinkBase(LinkBase):
         left_link_fields = ['LEFT_' + field for field in left_link_fields]
         right_link_fields = ['RIGHT_' + field for field in right_link_fields]
         comparison_methods = linking.get('comparisons')
+        join_rules, left_link_fields, right_link_fields, comparison_methods = LinkBase.plan_join(
+            blocking, left_link_fields, right_link_fields, comparison_methods)
 
         if self.project_type == 'DEDUP':
             right_df = left_df
         else:
             right_df = self.right_dataset
 
-        left_chunks = int(np.ceil(len(left_df.index) / float(CHUNK_SIZE)))
-        right_chunks = int(np.ceil(len(right_df.index) / float(CHUNK_SIZE)))
+        # Blocking methods that pair all the records together need the whole datasets in a single block.
+        if blocking_is_pairwise(blocking.get('method')):
+            block_size = CHUNK_SIZE
+        else:
+            block_size = max(len(left_df.index), len(right_df.index), 1)
+
+        left_chunks = int(np.ceil(len(left_df.index) / float(block_size)))
+        right_chunks = int(np.ceil(len(right_df.index) / float(block_size)))
 
         for i in range(0, left_chunks):
-            left_block = left_df.iloc[i * CHUNK_SIZE: (i + 1) * CHUNK_SIZE]
+            left_block = left_df.iloc[i * block_size: (i + 1) * block_size]
             left_block.columns = ['LEFT_' + col for col in left_block.columns]
             left_block.index.names = ['LEFT_' + left_block.index.name]
 
@@ -83,7 +95,7 @@ class MemoryLinkBase(LinkBase):
                 if self.project_type == 'DEDUP' and i > j:
                     continue
 
-                right_block = right_df.iloc[j * CHUNK_SIZE: (j + 1) * CHUNK_SIZE]
+                right_block = right_df.iloc[j * block_size: (j + 1) * block_size]
 
                 right_block.columns = ['RIGHT_' + col for col in
                                        right_block.columns]
@@ -93,9 +105,13 @@ class MemoryLinkBase(LinkBase):
                             i, j)
                 pairs = self.pair_records(left_block,
                                           right_block,
-                                          left_fields, right_fields, transformations)
+                                          left_fields, right_fields, transformations,
+                                          blocking_method=blocking.get('method'),
+                                          block_guard=block_guard,
+                                          block_stats=self.block_stats,
+                                          join_rules=join_rules)
 
-                if len(pairs.index) == 0:
+                if len(pairs) == 0:
                     continue
 
                 matched = LinkBase.match_records(pairs,
@@ -0,0 +1,67 @@
+"""
+Normalization of the text columns of the datasets.
+
+The records of a dataset are normalized once, when the dataset is loaded, so the blocking and linking rules work
+on clean values. Blank values are always replaced by missing values. The other normalizations are chosen by the
+"normalization" list of each project dataset, or by the normalization option of the LINKER config section, and
+are applied in the order of the list with vectorized string operations.
+"""
+from collections import OrderedDict
+
+from linker.core.base import NORMALIZATION
+
+# Combining marks left by the unicode decomposition of accented letters.
+ACCENTS = '[\u0300-\u036f]'
+PUNCTUATION = r'[^\w\s]'
+
+NORMALIZATIONS = OrderedDict([
+    ('TRIM', lambda s: s.str.strip()),
+    ('UPPER', lambda s: s.str.upper()),
+    # Series.replace takes an explicit regex flag on all the supported pandas versions, str.replace does not.
+    ('STRIP_ACCENTS', lambda s: s.str.normalize('NFKD').replace(ACCENTS, '', regex=True)),
+    ('STRIP_PUNCTUATION', lambda s: s.replace(PUNCTUATION, '', regex=True)),
+])
+
+
+def get_normalization(dataset):
+    """
+    :param dataset: Project dataset
+    :return: List of the normalizations of the dataset.
+    """
+    return dataset.get('normalization', NORMALIZATION) or []
+
+
+def invalid_normalizations(normalization):
+    """
+    :return: List of the unknown normalizations of a list.
+    """
+    return [name for name in normalization if name not in NORMALIZATIONS]
+
+
+def normalize_series(s, normalization):
+    """
+    Normalizes the strings of a series. Other values are left unchanged.
+    :param s: Input series
+    :param normalization: List of normalizations, applied in order.
+    :return: Normalized series. Blank strings are replaced by missing values.
+    """
+    for name in normalization:
+        normalized = NORMALIZATIONS[name](s)
+        # The string methods return missing values for the values that are not strings.
+        s = normalized.where(normalized.notnull() | s.isnull(), s)
+
+    return s.where(s.str.strip() != '')
+
+
+def normalize(data, normalization, exclude=None):
+    """
+    Normalizes the text columns of a data frame in place.
+    :param data: Data frame
+    :param normalization: List of normalizations, applied in order.
+    :param exclude: Columns that are not normalized, like the record and entity ids.
+    :return: The normalized data frame.
+    """
+    for col in data.columns:
+        if data[col].dtype == object and col not in (exclude or []):
+            data[col] = normalize_series(data[col], normalization)
+    return data
@@ -1,10 +1,14 @@
+import numpy as np
+
+
 class UnionFind:
     """
-    Union-Find with path compression implementation
+    Union-Find with path compression implementation.
+    The sets are kept in an int32 parent array. Single elements are joined and looked up by union and find,
+    whole arrays of elements by union_many and find_many.
     """
     size = 0
-    parent = []
-    weight = []
+    parent = None
 
     def __init__(self, n):
         """
@@ -12,9 +16,10 @@ class UnionFind:
         :param n: Total number of elements
         :return:
         """
+        if n > np.iinfo(np.int32).max:
+            raise ValueError('Too many elements for the union-find: {}'.format(n))
         self.size = n
-        self.parent = list(range(n))
-        self.weight = [0] * n
+        self.parent = np.arange(n, dtype=np.int32)
 
     def count(self):
         """
@@ -28,13 +33,14 @@ class UnionFind:
         :param x: input element
         :return: the root of the set containing x
         """
+        parent = self.parent
         i = x
 
-        while i != self.parent[i]:
-            self.parent[i] = self.parent[self.parent[i]]
-            i = self.parent[i]
+        while i != parent[i]:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
 
-        return i
+        return int(i)
 
     def linked(self, x, y):
         """
@@ -59,12 +65,72 @@ class UnionFind:
         if i == j:
             return
 
-        if self.weight[i] < self.weight[j]:
-            self.parent[i] = j
-        elif self.weight[i] > self.weight[j]:
+        # The smaller root always becomes the parent, so parent pointers never form a cycle.
+        if i < j:
             self.parent[j] = i
         else:
-            self.parent[j] = i
-            self.weight[i] += 1
+            self.parent[i] = j
 
         self.size -= 1
+
+    def compress(self):
+        """
+        Points every element directly to the root of its set by iterative pointer jumping.
+        """
+        parent = self.parent
+        while True:
+            grand_parent = parent[parent]
+            if np.array_equal(grand_parent, parent):
+                break
+            parent[:] = grand_parent
+
+    def union_many(self, x, y):
+        """
+        Joins the sets of each pair of elements (x[i], y[i]).
+        :param x: Array of elements
+        :param y: Array of elements, same length as x
+        :return:
+        """
+        x = np.asarray(x, dtype=np.int32)
+        y = np.asarray(y, dtype=np.int32)
+
+        while len(x) > 0:
+            self.compress()
+            root_x = self.parent[x]
+            root_y = self.parent[y]
+
+            # Drop the pairs that are already in the same set.
+            joined = root_x != root_y
+            low = np.minimum(root_x[joined], root_y[joined])
+            high = np.maximum(root_x[joined], root_y[joined])
+            if len(high) == 0:
+                break
+
+            # Hook each higher root to the smallest lower root it is paired with. The other pairs of that
+            # root are joined in the next round.
+            order = np.lexsort((low, high))
+            low, high = low[order], high[order]
+            first = np.ones(len(high), dtype=bool)
+            first[1:] = high[1:] != high[:-1]
+            self.parent[high[first]] = low[first]
+            self.size -= int(first.sum())
+
+            x, y = low[~first], high[~first]
+
+    def find_many(self, x):
+        """
+        Finds the roots of the sets of an array of elements.
+        :param x: Array of elements
+        :return: Array of roots
+        """
+        self.compress()
+        return self.parent[np.asarray(x, dtype=np.int32)]
+
+    def components(self):
+        """
+        Labels every element with the number of its set. Sets are numbered 0..count()-1 in the order of
+        their smallest element.
+        :return: int32 array of set labels.
+        """
+        self.compress()
+        return np.unique(self.parent, return_inverse=True)[1].astype(np.int32)
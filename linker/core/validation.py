@@ -19,6 +19,8 @@ class LinkError(Exception):
     INVALID_INDEX = 'INVALID_INDEX'
     INVALID_ENTITY_FIELD = 'INVALID_ENTITY_FIELD'
     DATASET_MISSING = 'DATASET_MISSING'
+    INVALID_BLOCK_POLICY = 'INVALID_BLOCK_POLICY'
+    INVALID_NORMALIZATION = 'INVALID_NORMALIZATION'
 
     ERROR_MESSAGES = {
         NO_PROJECT: 'No project is provided. Project cannot be empty.',
@@ -37,7 +39,11 @@ class LinkError(Exception):
         INVALID_PATH: 'Invalid file path. Dataset file does not exist.',
         INVALID_INDEX: 'Invalid Index Field. Index field does not exist in dataset.',
         INVALID_ENTITY_FIELD: 'Invalid Entity ID Field. Entity ID does not exist in dataset.',
-        DATASET_MISSING: 'Project dataset is missing.'
+        DATASET_MISSING: 'Project dataset is missing.',
+        INVALID_BLOCK_POLICY: 'Invalid block policy. Block policy should be FAIL, SPLIT or SKIP. '
+                              'The SPLIT policy requires the split variable(s).',
+        INVALID_NORMALIZATION: 'Invalid dataset normalization. Normalizations should be TRIM, UPPER, '
+                               'STRIP_ACCENTS or STRIP_PUNCTUATION.'
     }
 
     @classmethod
@@ -62,3 +68,23 @@ class ValidationError(LinkError):
 
     def __str__(self):
         return self.message
+
+
+class BlockSizeError(LinkError):
+    """
+    Exception raised when a blocking key pairs more records than the step allows and the step
+    block policy is FAIL.
+
+    Attributes:
+        message -- Details of the oversized block.
+
+    """
+
+    def __init__(self, key, pairs, max_pairs):
+        self.key = key
+        self.pairs = pairs
+        self.message = ('Blocking key {0} has {1} record pairs, more than the maximum of {2} '
+                        'record pairs.').format(key, pairs, max_pairs)
+
+    def __str__(self):
+        return self.message
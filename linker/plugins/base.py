@@ -48,8 +48,16 @@ class AlgorithmProvider(metaclass=PluginMount):
             For example, for the forlllowing Levenshtein strings similarity algorithm,
             the only required parameter is max_edits:
             levenshtein(x, y, max_edits=2)
+    cost : Relative cost of comparing a pair of values. Comparisons of a step are applied from the cheapest to the
+            most expensive one, so the expensive ones only compare the pairs that passed the others.
+    join_encoding : Comparisons only. Name of the transformation such that two values match if and only if their
+            transformed values are equal. The blocking join can then apply the comparison. None by default.
+    join_missing : Comparisons only. True if two missing values match, False if a missing value never matches.
 
     """
+    cost = 10
+    join_encoding = None
+    join_missing = False
 
     def apply(self, *args):
         raise NotImplementedError('Abstract method. No implementation.')
@@ -33,7 +33,8 @@ def generate_linking_summary(data, dest_dir):
             "linking_schema": step['linking_schema'],
             "total_records_linked": data.steps[step['seq']].get('total_records_linked', None),
             "total_entities": data.steps[step['seq']].get('total_entities', None),
-            "total_matched_not_linked": data.steps[step['seq']].get('total_matched_not_linked', None)
+            "total_matched_not_linked": data.steps[step['seq']].get('total_matched_not_linked', None),
+            "block_stats": data.steps[step['seq']].get('block_stats', None)
         }
 
         steps.append(step)
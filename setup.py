@@ -53,6 +53,8 @@ setup(
         [linking.plugins]
         lev_alg = ext.algorithms:Levenshtein
         jaro_alg =  ext.algorithms:JaroWinkler
+        synonyms_tsf = ext.algorithms:SynonymEncoding
+        deletions_blk = ext.algorithms:DeletionNeighbourhood
   """,
 
 
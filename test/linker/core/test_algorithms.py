@@ -0,0 +1,155 @@
+import numpy as np
+import pandas as pd
+from jellyfish import jaro_winkler
+
+from linker.core.algorithms import (apply_comparison, apply_encoding, apply_blocking, blocking_exact_keys,
+                                   cached_soundex)
+from ext.algorithms import jaro_winkler_above
+
+
+def series(*values):
+    return pd.Series(values, index=range(10, 10 + len(values)))
+
+
+def test_empty_comparisons():
+    """Missing values and empty strings should both count as empty"""
+    s1 = series('A', '', np.nan, 'B')
+    s2 = series(np.nan, '', 'C', 'B')
+
+    assert apply_comparison(s1, s2, 'BOTH_EMPTY').tolist() == [0, 1, 0, 0]
+    assert apply_comparison(s1, s2, 'ONE_EMPTY').tolist() == [1, 0, 1, 0]
+    assert apply_comparison(s1, s2, 'BOTH_EXIST').tolist() == [0, 0, 0, 1]
+
+
+def test_string_comparisons():
+    """Substring comparisons should never match missing values"""
+    s1 = series('ABCD', 'ABXY', np.nan, 'WXYZ')
+    s2 = series('ABCE', 'ZBXY', np.nan, 'WXYZ')
+
+    result = apply_comparison(s1, s2, 'HEAD_MATCH', n=3)
+    assert result.tolist() == [1, 0, 0, 1]
+    assert result.index.equals(s1.index)
+    assert result.dtype == np.int8
+
+    assert apply_comparison(s1, s2, 'TAIL_MATCH', n=2).tolist() == [0, 1, 0, 1]
+    assert apply_comparison(s1, s2, 'SLICE_MATCH', start=1, end=3).tolist() == [1, 1, 0, 1]
+    assert apply_comparison(s1, s2, 'FIXED_LEN', length=4).tolist() == [1, 1, 0, 1]
+
+
+def test_string_comparisons_no_values():
+    """Substring comparisons should not match a column without values, which is read as float"""
+    s1 = series(np.nan, np.nan)
+    s2 = series('ABCD', np.nan)
+
+    for method, args in [('HEAD_MATCH', {'n': 3}), ('TAIL_MATCH', {'n': 2}),
+                         ('SLICE_MATCH', {'start': 1, 'end': 3}), ('FIXED_LEN', {'length': 4})]:
+        assert apply_comparison(s1, s2, method, **args).tolist() == [0, 0]
+        assert apply_comparison(s2, s1, method, **args).tolist() == [0, 0]
+
+
+def test_numeric_comparisons():
+    """Missing values are equal for EXACT and never within the ABS_DIFF threshold"""
+    s1 = series(1.0, 5.0, np.nan, np.nan)
+    s2 = series(1.5, 1.0, 2.0, np.nan)
+
+    assert apply_comparison(s1, s2, 'EXACT').tolist() == [0, 0, 0, 1]
+    assert apply_comparison(s1, s2, 'ABS_DIFF', threshold=1).tolist() == [1, 0, 0, 0]
+
+
+def test_encoding_distinct_values():
+    """Phonetic encodings should be computed once per distinct value and keep missing values"""
+    cached_soundex.cache_clear()
+    s = series('SMITH', 'SMYTH', np.nan, 'SMITH', 'JONES')
+
+    encoded = apply_encoding(s, 'SOUNDEX')
+    assert encoded.index.equals(s.index)
+    assert encoded[[10, 11, 13, 14]].tolist() == ['S530', 'S530', 'S530', 'J520']
+    assert pd.isnull(encoded[12])
+    assert cached_soundex.cache_info().misses == 3
+
+
+def test_levenshtein():
+    """Bounded Levenshtein should accept pairs within max_edits, treating missing values as empty strings"""
+    s1 = series('JOHN', 'JOHN', 'ELIZABETH', 'MARY', np.nan, np.nan, 'AB')
+    s2 = series('JON', 'JOAN', 'ELISABETTA', 'RAMY', np.nan, 'A', '')
+
+    assert apply_comparison(s1, s2, 'LEVENSHTEIN', max_edits=1).tolist() == [1, 1, 0, 0, 1, 1, 0]
+    assert apply_comparison(s1, s2, 'LEVENSHTEIN', max_edits=2).tolist() == [1, 1, 0, 1, 1, 1, 1]
+    assert apply_comparison(s1, s2, 'LEVENSHTEIN').tolist() == [0, 0, 0, 0, 1, 0, 0]
+
+
+def test_jaro_winkler():
+    """Pairs below the threshold should be rejected whether or not they pass the length bound"""
+    # The strings are longer than 3 characters, so every jellyfish version adds the prefix bonus.
+    s1 = series('MARTHA', 'MARTHA', 'DWAYNE', 'JOHN', 'ABCD', 'WXYZ', np.nan)
+    s2 = series('MARHTA', 'MARTHA', 'DUANE', 'JONATHAN', 'WXYZABCD', 'PQRSTUVWXYZ', np.nan)
+
+    assert apply_comparison(s1, s2, 'JARO_WINKLER', threshold=0.9).tolist() == [1, 1, 0, 0, 0, 0, 0]
+    assert apply_comparison(s1, s2, 'JARO_WINKLER', threshold=0.75).tolist() == [1, 1, 1, 1, 0, 0, 0]
+
+    # The pruned comparison should agree with scoring every pair.
+    a, b = s1.dropna().values, s2.dropna().values
+    for threshold in [0.5, 0.7, 0.75, 0.8, 0.85, 0.9, 0.95, 1.0]:
+        expected = [1 if jaro_winkler(x, y) >= threshold else 0 for x, y in zip(a, b)]
+        assert jaro_winkler_above(a, b, threshold).tolist() == expected
+
+
+def test_synonyms():
+    """Synonym names should match case-insensitively, unknown names only match if both are empty"""
+    s1 = series('Bill', 'BOB', 'Zzyzx', '', np.nan, 'MARY')
+    s2 = series('WILLIAM', 'robert', 'Zzyzx', np.nan, np.nan, 'WILLIAM')
+
+    assert apply_comparison(s1, s2, 'SYNONYMS').tolist() == [1, 1, 0, 1, 1, 0]
+
+
+def test_synonym_encoding():
+    """Synonym names should be encoded with the same root name"""
+    encoded = apply_encoding(series('Bob', 'ROBERT', 'Zzyzx', np.nan), 'SYNONYMS')
+
+    assert encoded[10] == encoded[11]
+    assert encoded[12] == 'ZZYZX'
+    assert pd.isnull(encoded[13])
+
+
+def test_deletions_blocking():
+    """Deletion neighbourhood blocking should pair exactly the keys within max_edits edits"""
+    left = pd.DataFrame({0: ['JOHN', 'ANNA', 'AB', 'MARY'], 1: ['X', 'X', 'X', 'Y']})
+    right = pd.DataFrame({0: ['JON', 'BA', 'HANNA', 'MARY', 'JOHN'], 1: ['X', 'X', 'X', 'X', 'Y']})
+
+    left_pos, right_pos = apply_blocking(left, right, 'DELETIONS', max_edits=[1, 0])
+    assert list(zip(left_pos, right_pos)) == [(0, 0), (1, 2)]
+
+    left_pos, right_pos = apply_blocking(left, right, 'DELETIONS', max_edits=2)
+    assert list(zip(left_pos, right_pos)) == [(0, 0), (0, 4), (1, 2), (2, 1), (3, 3)]
+
+    assert blocking_exact_keys(2, {'name': 'DELETIONS', 'args': {'max_edits': [1, 0]}}) == [1]
+    assert blocking_exact_keys(2) == [0, 1]
+
+
+def test_minhash_blocking():
+    """MinHash blocking should pair the similar texts and always pair equal texts"""
+    left = pd.DataFrame({0: ['123 MAIN STREET', '45 OAK AVENUE', 'ACME WIDGETS LTD'],
+                         1: ['VICTORIA', 'VICTORIA', 'VANCOUVER']})
+    right = pd.DataFrame({0: ['123 MAIN STRET', 'ACME WIDGETS LIMITED', '99 PINE ROAD'],
+                          1: ['VICTORIA', 'VANCOUVER', 'VICTORIA']})
+
+    left_pos, right_pos = apply_blocking(left, right, 'MINHASH')
+    assert list(zip(left_pos, right_pos)) == [(0, 0), (2, 1)]
+
+    left_pos, right_pos = apply_blocking(left, left, 'MINHASH', q=2, bands=1, rows=50)
+    assert {(0, 0), (1, 1), (2, 2)} <= set(zip(left_pos, right_pos))
+
+    assert blocking_exact_keys(2, {'name': 'MINHASH'}) == []
+
+
+def test_sorted_neighbourhood_blocking():
+    """Sorted neighbourhood blocking should pair the records of the other side within the window"""
+    left = pd.DataFrame({0: ['SMITH', 'SMYTH', 'JONES', 'BROWN']})
+    right = pd.DataFrame({0: ['SMITHE', 'JONAS', 'BROWNE', 'ADAMS']})
+
+    # Sort order: ADAMS, BROWN, BROWNE, JONAS, JONES, SMITH, SMITHE, SMYTH
+    left_pos, right_pos = apply_blocking(left, right, 'SORTED_NEIGHBOURHOOD', window=2)
+    assert list(zip(left_pos, right_pos)) == [(0, 0), (1, 0), (2, 1), (3, 2), (3, 3)]
+
+    left_pos, right_pos = apply_blocking(left, None, 'SORTED_NEIGHBOURHOOD', window=2)
+    assert list(zip(left_pos, right_pos)) == [(0, 1), (0, 2), (2, 3)]
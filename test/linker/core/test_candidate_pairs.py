@@ -0,0 +1,25 @@
+import numpy as np
+import pandas as pd
+
+from linker.core.candidate_pairs import CandidatePairs
+from linker.core.link_base import LinkBase
+
+
+def test_join_codes():
+    """Pairs joined on key codes should only hold row positions"""
+    left_pos, right_pos = LinkBase.join_codes(np.array([7, 3, 7, 5]), np.array([7, 1, 7, 3]))
+    assert left_pos.dtype == np.int32
+    assert sorted(zip(left_pos.tolist(), right_pos.tolist())) == [(0, 0), (0, 2), (1, 3), (2, 0), (2, 2)]
+
+
+def test_candidate_pairs():
+    """Candidate pairs should gather the compared columns and only materialize the matched pairs"""
+    left = pd.DataFrame({'LEFT_CITY': ['A', 'B', 'A']}, index=pd.Index([10, 11, 12], name='LEFT_ID'))
+    right = pd.DataFrame({'RIGHT_CITY': ['A', 'B']}, index=pd.Index([20, 21], name='RIGHT_ID'))
+    pairs = CandidatePairs(left, right, [0, 1, 2, 2], [0, 0, 0, 1])
+    assert len(pairs) == 4
+    assert pairs['RIGHT_CITY'].tolist() == ['A', 'A', 'A', 'B']
+
+    matched = LinkBase.match_records(pairs, ['LEFT_CITY'], ['RIGHT_CITY'], [{'name': 'EXACT'}])
+    assert matched.index.tolist() == [(10, 20), (12, 20)]
+    assert matched.columns.tolist() == ['LEFT_CITY', 'RIGHT_CITY']
@@ -2,6 +2,7 @@ import os
 import pytest
 import shutil
 
+import linker.core.chunked_link_base
 from linker.core.chunked_dedup import ChunkedDedup
 from linker.core.files import LinkFiles
 from test.linker.utils import Utils
@@ -95,6 +96,35 @@ def test_link_pairs(project, ddp):
     assert value == 0
 
 
+def test_pair_n_match_partitioned_missing_key(project, tmpdir, monkeypatch):
+    """Partitions should keep equal numeric keys together when some chunks read them as floats"""
+    data_file = str(tmpdir.join('data.csv'))
+    with open(data_file, 'w') as out_file:
+        out_file.write('ID,YEAR,NAME\n1,1980,ANN\n2,,BOB\n3,1975,CAT\n'
+                       '4,1980,ANN\n5,1975,CAT\n6,1990,DAN\n')
+    # The missing year makes the first chunk read the years as floats.
+    monkeypatch.setattr(linker.core.chunked_link_base, 'CHUNK_SIZE', 3)
+
+    dataset = dict(project['datasets'][0], url=data_file, index_field='ID',
+                   columns=['ID', 'YEAR', 'NAME'])
+    del dataset['data_types']
+    ddp = ChunkedDedup(dict(project, datasets=[dataset],
+                            temp_path=str(tmpdir) + '/', output_root=str(tmpdir) + '/'))
+    matched_file = ddp.temp_path + LinkFiles.MATCHED_RECORDS
+    blocking = {'left': ['YEAR'], 'transformations': ['EXACT']}
+    linking = {'left': ['NAME'], 'comparisons': [{'name': 'EXACT'}]}
+
+    ddp.load_data()
+    totals = []
+    for partitions in [0, 4]:
+        ddp.partitions = partitions
+        open(matched_file, 'w').close()
+        totals.append(ddp.pair_n_match(step=1, link_method='DTR', blocking=blocking,
+                                       linking=linking, matched_file=matched_file))
+
+    assert totals == [2, 2]
+
+
 def test_extract_rows(project, ddp):
     """Tests if linked records are removed from input data"""
     step = project['steps'][1]
@@ -1,9 +1,13 @@
 import os
+import pickle
 import pytest
 import shutil
 
+from linker.core import chunked_link_base
 from linker.core.chunked_link import ChunkedLink
+from linker.core.chunked_link_base import MatchJob
 from linker.core.files import LinkFiles
+from linker.core.validation import BlockSizeError, ValidationError
 from test.linker.utils import Utils
 
 
@@ -96,6 +100,241 @@ def test_load_data(project, linker):
     assert os.path.isfile(project['output_root'] + 'right_file.csv')
 
 
+def pair_n_match(linker, step, matched_file):
+    """Runs the pairing and matching of a step into an empty matched records file"""
+    open(matched_file, 'w').close()
+    total = linker.pair_n_match(step=step['seq'],
+                                link_method=step['linking_method'],
+                                blocking=step['blocking_schema'],
+                                linking=step['linking_schema'],
+                                matched_file=matched_file)
+    with open(matched_file) as in_file:
+        return total, in_file.read()
+
+
+@pytest.mark.parametrize('options', [
+    {'partitions': 4},
+    {'working_format': 'npy'},
+    {'workers': 2, 'partitions': 4}
+])
+def test_pair_n_match_options(project, linker, options):
+    """Hash partitioning, the columnar working format and the process pool should find the same matched records"""
+    step = project['steps'][0]
+    matched_file = project['temp_path'] + LinkFiles.MATCHED_RECORDS
+
+    linker.load_data()
+    expected = pair_n_match(linker, step, matched_file)
+    for name, value in options.items():
+        setattr(linker, name, value)
+
+    assert pair_n_match(linker, step, matched_file) == expected
+    assert expected[0] == 72
+    assert not os.path.isfile(project['temp_path'] + LinkFiles.TEMP_LEFT_PARTITION.format(0))
+    assert not os.path.isfile(project['temp_path'] + LinkFiles.TEMP_RIGHT_PARTITION.format(0))
+    assert not os.path.isfile(project['temp_path'] + LinkFiles.TEMP_MATCHED_RUN.format(0))
+
+
+def test_match_job(linker):
+    """The workers should get a small job description instead of the linker"""
+    linker.load_data()
+    match_job = pickle.loads(pickle.dumps(MatchJob(linker)))
+
+    assert match_job.matched_columns() == linker.matched_columns()
+    assert len(pickle.dumps(MatchJob(linker))) < 1024
+
+
+def test_pair_n_match_deletions(project, linker):
+    """Deletion neighbourhood blocking on the names should find all the pairs within the linking max_edits"""
+    step = project['steps'][0]
+    matched_file = project['temp_path'] + LinkFiles.MATCHED_RECORDS
+
+    # The linking rules require equal postal codes, so blocking on them finds all the matched records.
+    linker.load_data()
+    open(matched_file, 'w').close()
+    total = linker.pair_n_match(step=step['seq'],
+                                link_method=step['linking_method'],
+                                blocking={'left': ['POSTAL_TXT'], 'right': ['CANADIAN_POSTAL_CODE'],
+                                          'transformations': ['EXACT']},
+                                linking=step['linking_schema'],
+                                matched_file=matched_file)
+    with open(matched_file) as in_file:
+        expected = in_file.read()
+
+    blocking = {'left': ['LAST_NAME_TXT'], 'right': ['FAMILY_NAME'], 'transformations': ['EXACT'],
+                'method': {'name': 'DELETIONS', 'args': {'max_edits': 2}}}
+    for partitions in (1, 4):
+        linker.partitions = partitions
+        open(matched_file, 'w').close()
+        assert linker.pair_n_match(step=step['seq'],
+                                   link_method=step['linking_method'],
+                                   blocking=blocking,
+                                   linking=step['linking_schema'],
+                                   matched_file=matched_file) == total == 72
+        with open(matched_file) as in_file:
+            assert in_file.read() == expected
+
+
+def test_pair_n_match_sorted_neighbourhood(project, linker):
+    """Sorted neighbourhood blocking should find more pairs with a larger window and clean its sorted files"""
+    step = project['steps'][0]
+    matched_file = project['temp_path'] + LinkFiles.MATCHED_RECORDS
+    blocking = dict(step['blocking_schema'], method={'name': 'SORTED_NEIGHBOURHOOD', 'args': {'window': 2}})
+
+    linker.load_data()
+    totals = []
+    for window, workers in ((2, 1), (5, 1), (5, 2)):
+        blocking['method']['args']['window'] = window
+        linker.workers = workers
+        open(matched_file, 'w').close()
+        totals.append(linker.pair_n_match(step=step['seq'],
+                                          link_method=step['linking_method'],
+                                          blocking=blocking,
+                                          linking=step['linking_schema'],
+                                          matched_file=matched_file))
+
+    assert totals == [15, 72, 72]
+    assert not os.path.isfile(project['temp_path'] + LinkFiles.TEMP_NEIGHBOURHOOD_KEYS)
+    assert not os.path.isfile(project['temp_path'] + LinkFiles.TEMP_NEIGHBOURHOOD.format(0))
+
+
+def test_pair_n_match_block_policy(project, linker):
+    """Blocks above max_block_pairs should fail the step, be skipped or be split"""
+    step = project['steps'][0]
+    matched_file = project['temp_path'] + LinkFiles.MATCHED_RECORDS
+    # Compare the 6 character postal codes with a rule that is not applied by the blocking join.
+    linking = dict(step['linking_schema'], comparisons=[step['linking_schema']['comparisons'][0],
+                                                        {'name': 'HEAD_MATCH', 'args': {'n': 6}}])
+
+    def pair_n_match(**blocking):
+        open(matched_file, 'w').close()
+        return linker.pair_n_match(step=step['seq'],
+                                   link_method=step['linking_method'],
+                                   blocking=dict(step['blocking_schema'], **blocking),
+                                   linking=linking,
+                                   matched_file=matched_file)
+
+    linker.load_data()
+    linker.workers = 2
+    assert pair_n_match() == 72
+    stats = linker.block_stats.to_dict()
+    assert stats['blocks'] == 18
+    assert stats['estimated_pairs'] == 90
+    assert stats['largest_block'] == 8
+    assert stats['top_blocks'][0] == {'key': '19481012', 'pairs': 8}
+
+    with pytest.raises(BlockSizeError):
+        pair_n_match(max_block_pairs=7)
+
+    assert pair_n_match(max_block_pairs=7, block_policy='SKIP') == 68
+    assert linker.block_stats.skipped_blocks == 1
+    assert linker.block_stats.skipped_pairs == 8
+
+    # The linking rules require equal postal codes, so splitting the blocks by them loses no
+    # matched records.
+    split = {'left': ['POSTAL_TXT'], 'right': ['CANADIAN_POSTAL_CODE']}
+    assert pair_n_match(max_block_pairs=7, block_policy='SPLIT', split=split) == 72
+    assert linker.block_stats.split_blocks == 1
+    assert linker.block_stats.skipped_blocks == 0
+
+    with pytest.raises(ValidationError):
+        pair_n_match(block_policy='SPLIT')
+
+
+def test_pair_n_match_join_rules(project, linker):
+    """Linking rules applied by the blocking join should give the same matched records"""
+    step = project['steps'][0]
+    matched_file = project['temp_path'] + LinkFiles.MATCHED_RECORDS
+    postal_rules = [{'name': 'EXACT'}, {'name': 'HEAD_MATCH', 'args': {'n': 6}}]
+
+    linker.load_data()
+    results = []
+    for postal_rule in postal_rules:
+        linking = dict(step['linking_schema'], comparisons=[step['linking_schema']['comparisons'][0], postal_rule])
+        open(matched_file, 'w').close()
+        total = linker.pair_n_match(step=step['seq'],
+                                    link_method=step['linking_method'],
+                                    blocking=step['blocking_schema'],
+                                    linking=linking,
+                                    matched_file=matched_file)
+        with open(matched_file) as in_file:
+            results.append((total, linker.block_stats.pairs, in_file.read()))
+
+    # Only the pairs with equal birth dates and postal codes are created when the EXACT rule joins the records.
+    assert results[0][:2] == (72, 72)
+    assert results[1][:2] == (72, 90)
+    assert results[0][2] == results[1][2]
+
+
+@pytest.mark.parametrize('fan_in', [128, 2])
+def test_merge_runs(project, linker, monkeypatch, fan_in):
+    """Sorted runs should be merged into one sorted file without duplicates, also in more than one pass"""
+    monkeypatch.setattr(chunked_link_base, 'SORT_FAN_IN', fan_in)
+    runs = [project['temp_path'] + LinkFiles.TEMP_MATCHED_RUN.format(n) for n in range(3)]
+    rows = [
+        ['1,10,a', '3,2,a', '10,1,a'],
+        [],
+        ['1,10,b', '2,5,b', '10,1,b', '10,2,b'],
+    ]
+    for run, run_rows in zip(runs, rows):
+        with open(run, 'w') as run_file:
+            run_file.write('\n'.join(['L,R,V'] + run_rows) + '\n')
+
+    out_file = project['temp_path'] + LinkFiles.TEMP_MATCHED_FILE
+    count = ChunkedLink.merge_runs(runs, columns=['L', 'R'], out_filename=out_file)
+
+    assert count == 5
+    with open(out_file) as merged:
+        assert merged.read().splitlines() == ['L,R,V', '1,10,a', '2,5,b', '3,2,a', '10,1,a', '10,2,b']
+    assert not os.path.isfile(project['temp_path'] + LinkFiles.TEMP_MERGED_RUN.format(0))
+
+
+def test_attach_data(project, linker):
+    """Data columns should be attached to the record pairs by id, keeping the order of the pairs"""
+    pairs_file = project['temp_path'] + LinkFiles.MATCHED_RECORDS
+    data_files = [project['temp_path'] + LinkFiles.TEMP_RECORDS.format(side) for side in ('left', 'right')]
+    with open(pairs_file, 'w') as out_file:
+        out_file.write('\n'.join(['LINK_ID,LEFT_ID,RIGHT_ID,LEFT_E,LINK_STEP',
+                                  '1,3,20,7,1', '1,,10,7,1', '2,1,20,8,2']) + '\n')
+    with open(data_files[0], 'w') as out_file:
+        out_file.write('\n'.join(['ID,E,NAME', '1,8,ANN', '2,9,BOB', '3,7,"LI, JO"']) + '\n')
+    with open(data_files[1], 'w') as out_file:
+        out_file.write('\n'.join(['ID,NAME', '10,', '20,ANNA']) + '\n')
+
+    out_file = project['temp_path'] + LinkFiles.TEMP_SORTED_FILE
+    count = linker.attach_data(pairs_file, out_file,
+                               [('LEFT_ID', data_files[0], 'ID', 'LEFT_'), ('RIGHT_ID', data_files[1], 'ID', 'RIGHT_')],
+                               before_col='LINK_STEP')
+
+    assert count == 3
+    with open(out_file) as attached:
+        assert attached.read().splitlines() == ['LINK_ID,LEFT_ID,RIGHT_ID,LEFT_E,LEFT_NAME,RIGHT_NAME,LINK_STEP',
+                                                '1,3,20,7,"LI, JO",ANNA,1', '1,,10,7,,,1', '2,1,20,8,ANN,ANNA,2']
+
+
+def test_large_ids(project, linker):
+    """Record ids above 2^53 should be merged and attached exactly, not as floats"""
+    ids = [str(2 ** 53 + n) for n in range(3)]
+    runs = [project['temp_path'] + LinkFiles.TEMP_MATCHED_RUN.format(n) for n in range(2)]
+    for run, rec_id in zip(runs, ids[1::-1]):
+        with open(run, 'w') as run_file:
+            run_file.write('LEFT_ID,RIGHT_ID\n{},1\n'.format(rec_id))
+
+    pairs_file = project['temp_path'] + LinkFiles.MATCHED_RECORDS
+    count = ChunkedLink.merge_runs(runs, columns=['LEFT_ID', 'RIGHT_ID'], out_filename=pairs_file)
+    assert count == 2
+
+    data_file = project['temp_path'] + LinkFiles.TEMP_RECORDS.format('left')
+    with open(data_file, 'w') as out_file:
+        out_file.write('\n'.join(['ID,NAME'] + [rec_id + ',' + name
+                                                 for rec_id, name in zip(ids, 'ABC')]) + '\n')
+
+    out_file = project['temp_path'] + LinkFiles.TEMP_SORTED_FILE
+    linker.attach_data(pairs_file, out_file, [('LEFT_ID', data_file, 'ID', 'LEFT_')])
+    with open(out_file) as attached:
+        assert attached.read().splitlines() == ['LEFT_ID,RIGHT_ID,LEFT_NAME',
+                                                ids[0] + ',1,A', ids[1] + ',1,B']
+
+
 def test_groupby_unique_filter(project, linker):
     """Checks unique grouping is behaving correctly"""
     step = project['steps'][0]
@@ -0,0 +1,76 @@
+import os
+
+import numpy as np
+import pandas as pd
+from pandas.util.testing import assert_frame_equal
+
+from linker.core.columnar import ColumnStore
+
+
+def write_rows(path, rows):
+    with open(path, 'w') as out_file:
+        out_file.write('\n'.join(rows) + '\n')
+
+
+DATA = ['ID,NAME,SCORE,CITY',
+        '1,ann,1.5,',
+        '2,,2,Victoria',
+        '3,bob,,"Prince George, BC"',
+        '4,eve,4,Surrey',
+        '5,joe,5.5,']
+
+
+def test_read_chunks(tmpdir):
+    """Stored chunks should be identical to the chunks read from the csv file"""
+    data_file = str(tmpdir.join('data.csv'))
+    write_rows(data_file, DATA)
+    dtypes = {'NAME': object, 'SCORE': np.float64}
+
+    store = ColumnStore.open(data_file, str(tmpdir.join('store')), 'ID', ['ID', 'NAME', 'SCORE', 'CITY'],
+                             dtypes, chunk_size=2)
+    expected = pd.read_csv(data_file, index_col=['ID'], skipinitialspace=True, dtype=dtypes, chunksize=2)
+
+    chunks = list(store.read_chunks())
+    assert len(store) == 5
+    assert [len(chunk.index) for chunk in chunks] == [2, 2, 1]
+    for chunk, expected_chunk in zip(chunks, expected):
+        assert_frame_equal(chunk, expected_chunk)
+
+    projected = next(store.read_chunks(columns=['CITY']))
+    assert projected.columns.tolist() == ['CITY']
+    assert projected.index.name == 'ID'
+
+
+def test_open_rebuilds_stale_store(tmpdir):
+    """A store should be reused while the csv file is unchanged and rebuilt after it changes"""
+    data_file = str(tmpdir.join('data.csv'))
+    store_dir = str(tmpdir.join('store'))
+    write_rows(data_file, DATA)
+
+    store = ColumnStore.open(data_file, store_dir, 'ID', chunk_size=10)
+    meta_file = os.path.join(store_dir, ColumnStore.META_FILE)
+    built = os.stat(meta_file).st_mtime_ns
+    assert ColumnStore.open(data_file, store_dir, 'ID', chunk_size=10).meta == store.meta
+    assert os.stat(meta_file).st_mtime_ns == built
+
+    os.remove(data_file)
+    write_rows(data_file, DATA[:3])
+    store = ColumnStore.open(data_file, store_dir, 'ID', chunk_size=10)
+    assert len(store) == 2
+    assert next(store.read_chunks())['NAME'].tolist()[0] == 'ann'
+
+
+def test_read_segment_rows(tmpdir):
+    """Selected rows should be read from the typed arrays and wide text should not be stored as unicode"""
+    data_file = str(tmpdir.join('data.csv'))
+    write_rows(data_file, DATA + ['6,' + 'x' * (ColumnStore.MAX_TEXT_WIDTH + 1) + ',6,Surrey'])
+
+    store = ColumnStore.open(data_file, str(tmpdir.join('store')), 'ID', chunk_size=3)
+    assert store.meta['kinds'][0] == [ColumnStore.ARRAY, ColumnStore.TEXT, ColumnStore.ARRAY, ColumnStore.TEXT]
+    assert store.meta['kinds'][1][1] == ColumnStore.OBJECT
+
+    rows = store.read_segment(0, columns=['NAME', 'SCORE'], rows=slice(1, 3))
+    assert rows.index.tolist() == [2, 3]
+    assert pd.isnull(rows['NAME'][2]) and rows['NAME'][3] == 'bob'
+    assert rows['SCORE'].dtype == np.float64
+    assert store.read_segment(1, rows=[2])['NAME'].tolist() == ['x' * (ColumnStore.MAX_TEXT_WIDTH + 1)]
@@ -0,0 +1,67 @@
+import pytest
+
+import linker.core.commands
+
+from linker.core.commands import explain
+from linker.core.validation import ValidationError
+from test.linker.utils import Utils
+
+
+@pytest.fixture
+def project():
+    """Read test_jtst_educ_linking project configuration"""
+    return Utils.load_project_data('test_jtst_educ_linking.json')
+
+
+def test_explain(project):
+    """The estimated pairs should be the record pairs of the join keys found by running the steps"""
+    plan = explain(project)
+
+    assert plan['engine'] == 'MemoryLink'
+    assert plan['left_records'] == plan['right_records'] == 999
+    assert [step['blocks'] for step in plan['steps']] == [15, 14]
+    assert [step['estimated_pairs'] for step in plan['steps']] == [72, 68]
+    assert [step['chunk_pairs'] for step in plan['steps']] == [1, 1]
+    assert plan['steps'][0]['top_blocks'][0] == {'key': '19461009 / V7C2Y7', 'pairs': 6}
+    assert plan['estimated_pairs'] == 140
+
+
+def test_explain_block_guard(project):
+    """Explain should count oversized blocks, skip blocking methods and reject bad policies"""
+    project['steps'][0]['blocking_schema']['max_block_pairs'] = 5
+    project['steps'][1]['blocking_schema']['method'] = {'name': 'SORTED_NEIGHBOURHOOD',
+                                                        'args': {'window': 3}}
+    plan = explain(project)
+
+    assert plan['steps'][0]['oversized_blocks'] == 6
+    assert plan['steps'][1]['blocking_method'] == 'SORTED_NEIGHBOURHOOD'
+    assert 'estimated_pairs' not in plan['steps'][1]
+    assert plan['estimated_pairs'] == 72
+
+    project['steps'][0]['blocking_schema']['block_policy'] = 'SPLIT'
+    with pytest.raises(ValidationError):
+        explain(project)
+
+
+def test_explain_dedup_block_guard(monkeypatch):
+    """Explain should count the oversized dedup blocks of each chunk pair like the block guard"""
+    project = Utils.load_project_data('test_jtst_dedup.json')
+    # The largest city block has 51 records, that is 1275 distinct record pairs.
+    project['steps'][0]['blocking_schema'] = {'left': ['CITY_GEO_AREA_ID'],
+                                              'transformations': ['EXACT'],
+                                              'max_block_pairs': 1275}
+    plan = explain(project)
+
+    assert plan['steps'][0]['estimated_pairs'] == 5786
+    assert plan['steps'][0]['largest_block'] == 1275
+    assert plan['steps'][0]['oversized_blocks'] == 0
+
+    project['steps'][0]['blocking_schema']['max_block_pairs'] = 1274
+    assert explain(project)['steps'][0]['oversized_blocks'] == 1
+
+    # With two chunks the largest block pairs 26 records of one chunk with 26 records of the other.
+    monkeypatch.setattr(linker.core.commands, 'CHUNK_SIZE', 500)
+    plan = explain(project)
+    assert plan['steps'][0]['chunk_pairs'] == 3
+    assert plan['steps'][0]['largest_block'] == 676
+    assert plan['steps'][0]['estimated_pairs'] == 5786
@@ -0,0 +1,79 @@
+import os
+
+import pandas as pd
+
+from linker.core.external_sort import (external_sort, sort_csv, ensure_sorted, is_sorted,
+                                       is_sorted_chunk)
+
+
+def write_rows(path, rows):
+    with open(path, 'w') as out_file:
+        out_file.write('\n'.join(rows) + '\n')
+
+
+def read_rows(path):
+    with open(path) as in_file:
+        return in_file.read().splitlines()
+
+
+def test_external_sort_typed_keys(tmpdir):
+    """Numeric keys should be compared as numbers and string keys as text, over several runs"""
+    in_file = str(tmpdir.join('data.csv'))
+    out_file = str(tmpdir.join('sorted.csv'))
+    write_rows(in_file, ['ID,NAME,NOTE',
+                         '10,b,"x, y"',
+                         '9,b,plain',
+                         '10,a,',
+                         '100,a,"quoted ""text"""',
+                         '9,a,last'])
+
+    count = external_sort(in_file, out_file, cols=['NAME', 'ID'],
+                          types={'ID': 'numeric', 'NAME': 'string'},
+                          work_dir=str(tmpdir), chunk_size=2)
+
+    assert count == 5
+    assert read_rows(out_file) == ['ID,NAME,NOTE',
+                                   '9,a,last',
+                                   '10,a,',
+                                   '100,a,"quoted ""text"""',
+                                   '9,b,plain',
+                                   '10,b,"x, y"']
+    # All run files must be removed from the spill directory.
+    assert sorted(os.listdir(str(tmpdir))) == ['data.csv', 'sorted.csv']
+
+
+def test_sort_csv_append(tmpdir):
+    """sort_csv should append the sorted rows without header to an existing file"""
+    in_file = str(tmpdir.join('data.csv'))
+    out_file = str(tmpdir.join('sorted.csv'))
+    write_rows(in_file, ['ID,NAME', '3,c', '1,a'])
+
+    assert sort_csv(in_file, out_file, cols=['ID'], types={'ID': 'numeric'}) == 2
+    assert sort_csv(in_file, out_file, cols=['ID'], types={'ID': 'numeric'}) == 2
+    assert read_rows(out_file) == ['ID,NAME', '1,a', '3,c', '1,a', '3,c']
+
+
+def test_ensure_sorted_skips_recorded_order(tmpdir):
+    """ensure_sorted should sort once, record the order and skip the sorts it already satisfies"""
+    data_file = str(tmpdir.join('data.csv'))
+    write_rows(data_file, ['ID,ENTITY', '3,1', '1,2', '2,1'])
+    types = {'ID': 'numeric', 'ENTITY': 'numeric'}
+
+    assert ensure_sorted(data_file, cols=['ENTITY', 'ID'], types=types, work_dir=str(tmpdir))
+    assert read_rows(data_file) == ['ID,ENTITY', '2,1', '3,1', '1,2']
+    assert is_sorted(data_file, cols=['ENTITY'], types=types)
+    assert not is_sorted(data_file, cols=['ID'], types=types)
+    assert not ensure_sorted(data_file, cols=['ENTITY', 'ID'], types=types, work_dir=str(tmpdir))
+
+
+def test_is_sorted_chunk():
+    """Order checks should compare typed keys and continue across chunks"""
+    types = {'ID': 'numeric', 'ENTITY': 'numeric'}
+    chunk = pd.DataFrame({'ENTITY': [1, 1, 2], 'ID': [9, 10, 1]})
+
+    in_order, last = is_sorted_chunk(chunk, ['ENTITY', 'ID'], types)
+    assert in_order
+    assert not is_sorted_chunk(chunk, ['ID'], types)[0]
+
+    next_chunk = pd.DataFrame({'ENTITY': [2, 3], 'ID': [0, 5]})
+    assert not is_sorted_chunk(next_chunk, ['ENTITY', 'ID'], types, previous=last)[0]
@@ -0,0 +1,46 @@
+import numpy as np
+import pandas as pd
+
+from linker.core.algorithms import comparison_cost
+from linker.core.link_base import LinkBase
+
+
+def test_composite_keys(monkeypatch):
+    """Equal multi-variable keys should get equal codes on both sides, also when the codes are recoded"""
+    left = [np.array(['a', 'b', 'a', None], dtype=object), np.array([1, 2, 2, 3])]
+    right = [np.array(['b', 'a', None, 'a'], dtype=object), np.array([2, 2, 3, 1])]
+
+    for max_key_codes in (LinkBase.MAX_KEY_CODES, 2):
+        monkeypatch.setattr(LinkBase, 'MAX_KEY_CODES', max_key_codes)
+        left_codes, right_codes = LinkBase.composite_keys(left, right)
+        assert len(set(left_codes)) == 4
+        assert right_codes.tolist() == [left_codes[1], left_codes[2], left_codes[3], left_codes[0]]
+
+
+def test_assign_entities():
+    """Connected records should get the same entity id, numbered by the first pair of each entity"""
+    LinkBase.reset_id()
+    pair_entities, linked = LinkBase.assign_entities(np.array([5, 1, 7, 2]), np.array([7, 3, 9, 5]))
+
+    assert pair_entities.tolist() == [1, 2, 1, 1]
+    assert linked.index.tolist() == [1, 2, 3, 5, 7, 9]
+    assert linked.tolist() == [2, 1, 2, 1, 1, 1]
+    assert LinkBase.get_next_id() == 3
+    LinkBase.reset_id()
+
+
+def test_match_records():
+    """Rules should be applied from the cheapest comparison and only to the pairs that passed the others"""
+    pairs = pd.DataFrame({'LEFT_NAME': ['SMITH', 'SMYTH', 'JONES', 'BROWN'],
+                          'RIGHT_NAME': ['SMITHE', 'SMITH', 'JONES', 'BRAUN'],
+                          'LEFT_CITY': ['A', 'A', 'B', 'B'],
+                          'RIGHT_CITY': ['A', 'B', 'B', 'B']},
+                         index=pd.MultiIndex.from_arrays([[4, 3, 2, 1], [5, 6, 7, 8]], names=['LEFT_ID', 'RIGHT_ID']))
+    comparisons = [{'name': 'LEVENSHTEIN', 'args': {'max_edits': 1}}, {'name': 'EXACT'}]
+
+    matched = LinkBase.match_records(pairs, ['LEFT_NAME', 'LEFT_CITY'], ['RIGHT_NAME', 'RIGHT_CITY'], comparisons)
+    assert matched.index.tolist() == [(2, 7), (4, 5)]
+    assert matched.columns.tolist() == pairs.columns.tolist()
+
+    assert comparison_cost('EXACT') < comparison_cost('SOUNDEX') < comparison_cost('LEVENSHTEIN')
+    assert LinkBase.match_records(pairs, ['LEFT_CITY'], ['RIGHT_CITY'], [{'name': 'EXACT'}]).shape == (3, 4)
@@ -4,6 +4,7 @@ import shutil
 
 from linker.core.memory_dedup import MemoryDedup
 from linker.core.files import LinkFiles
+from linker.core.validation import BlockSizeError
 from test.linker.utils import Utils
 
 
@@ -94,6 +95,28 @@ def test_run(project, ddp):
                               LinkFiles.TEMP_MATCHED_FILE)
 
 
+def test_pair_n_match_block_guard(project, ddp):
+    """A block of n de-duplicated records should count n * (n - 1) / 2 pairs against the limit"""
+    step = project['steps'][0]
+    # The largest city block has 51 records, that is 1275 distinct record pairs.
+    blocking = {'left': ['CITY_GEO_AREA_ID'], 'transformations': ['EXACT']}
+
+    def pair_n_match(**guard):
+        ddp.pair_n_match(step=step['seq'],
+                         link_method=step['linking_method'],
+                         blocking=dict(blocking, **guard),
+                         linking=step['linking_schema'])
+
+    ddp.load_data()
+    pair_n_match(max_block_pairs=1275)
+    assert ddp.block_stats.largest == 1275
+    assert ddp.block_stats.pairs == 5786
+
+    with pytest.raises(BlockSizeError) as error:
+        pair_n_match(max_block_pairs=1274)
+    assert error.value.pairs == 1275
+
+
 def test_save(project, ddp):
     """Tests if the execution results are saved"""
     ddp.load_data()
@@ -109,6 +109,8 @@ def test_run(project, linker):
 
     assert linker.steps is not None
     assert len(linker.steps) == len(project['steps'])
+    assert linker.steps[1]['block_stats']['blocks'] == 15
+    assert linker.steps[1]['block_stats']['estimated_pairs'] == 72
     assert linker.total_records_linked == 144
     assert linker.total_entities == 30
     assert linker.linked is not None
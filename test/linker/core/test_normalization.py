@@ -0,0 +1,38 @@
+import numpy as np
+import pandas as pd
+
+from linker.core.normalization import invalid_normalizations, normalize, normalize_series
+
+
+def test_normalize_series():
+    """Strings should be normalized in order, blanks replaced by missing values and other values kept"""
+    s = pd.Series(['  José-Luis ', 'o\'neil', '   ', '', np.nan, 5], index=range(10, 16))
+
+    normalized = normalize_series(s, ['TRIM', 'UPPER', 'STRIP_ACCENTS', 'STRIP_PUNCTUATION'])
+    assert normalized.index.tolist() == s.index.tolist()
+    assert normalized[:2].tolist() == ['JOSELUIS', 'ONEIL']
+    assert normalized[12:15].isnull().all()
+    assert normalized[15] == 5
+
+    assert normalize_series(s, [])[:2].tolist() == ['  José-Luis ', 'o\'neil']
+    assert normalize_series(s, [])[12:14].isnull().all()
+
+
+def test_normalize():
+    """Only the text columns that are not excluded should be normalized"""
+    data = pd.DataFrame({'ID': [' a', 'b'], 'NAME': [' smith ', ' '], 'AGE': [30, 40]})
+    normalize(data, ['TRIM', 'UPPER'], exclude=['ID'])
+
+    assert data['ID'].tolist() == [' a', 'b']
+    assert data['NAME'][0] == 'SMITH' and pd.isnull(data['NAME'][1])
+    assert data['AGE'].tolist() == [30, 40]
+    assert invalid_normalizations(['TRIM', 'LOWER']) == ['LOWER']
+
+
+def test_strip_accents_and_punctuation():
+    """Accented and punctuated values should come out as plain upper-case alphanumerics"""
+    s = pd.Series(['Ève-Marie d\'Arc', 'Zoë.Ñúñez'])
+    normalized = normalize_series(s, ['UPPER', 'STRIP_ACCENTS', 'STRIP_PUNCTUATION'])
+
+    assert normalized.tolist() == ['EVEMARIE DARC', 'ZOENUNEZ']
+    assert normalized.str.match(r'^[A-Z0-9 ]+$').all()
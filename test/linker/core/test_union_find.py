@@ -0,0 +1,44 @@
+import numpy as np
+
+from linker.core.union_find import UnionFind
+
+
+def test_union():
+    """Single unions should join the sets and keep track of the number of sets"""
+    uf = UnionFind(5)
+    uf.union(3, 4)
+    uf.union(4, 1)
+    uf.union(1, 3)
+
+    assert uf.count() == 3
+    assert uf.linked(1, 3)
+    assert not uf.linked(0, 1)
+    assert uf.find(4) == 1
+
+
+def test_union_many():
+    """Bulk unions should give the same sets as one union per pair"""
+    rng = np.random.RandomState(7)
+    x = rng.randint(0, 200, 150)
+    y = rng.randint(0, 200, 150)
+
+    expected = UnionFind(200)
+    for i, j in zip(x, y):
+        expected.union(i, j)
+
+    uf = UnionFind(200)
+    uf.union_many(x, y)
+
+    assert uf.count() == expected.count()
+    assert np.array_equal(uf.find_many(np.arange(200)),
+                          [expected.find(i) for i in range(200)])
+
+
+def test_components():
+    """Components should be numbered densely in the order of their smallest element"""
+    uf = UnionFind(6)
+    uf.union_many([5, 4, 2], [3, 5, 1])
+
+    assert uf.count() == 3
+    assert uf.components().tolist() == [0, 1, 1, 2, 2, 2]
+    assert uf.components().dtype == np.int32